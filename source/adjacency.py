@@ -0,0 +1,291 @@
+"""
+  Build a graph's edge table directly from an adjacency matrix file.
+
+  Row i and column j of the matrix refer to the nodes with IDs 'Node<i+1>'
+  and 'Node<j+1>'. Every finite nonzero off-diagonal cell becomes an edge
+  whose value is used as both its color and width. Matrices are either tab
+  delimited text, or binary .npy/raw files which are memory mapped and 
+  processed in blocks of rows, so they may be larger than memory. Compressed
+  text and .npy matrices are decompressed as a stream.
+"""
+# Library Imports
+import os
+from math import sqrt
+from itertools import chain, islice
+import numpy as np
+
+# Local Module Imports
+import config
+from metadata import EdgeMetadata
+from table import Table
+from reader import openStream, splitCompressionExtension
+
+# File extensions of binary matrices, which are memory mapped instead of read
+BINARY_MATRIX_EXTENSIONS = ('.npy', '.bin', '.raw', '.dat')
+
+def adjacencyNodeId(i):
+  """
+  Return the node ID referred to by matrix row or column i.
+  """
+  return 'Node' + str(i + 1)
+
+# Replacements filling in the empty cells of tab delimited matrix rows, which
+# are surrounded by newlines. Runs of empty cells take two passes.
+EMPTY_CELLS = (('\t\t', '\tnan\t'), ('\t\t', '\tnan\t'), ('\n\t', '\nnan\t'),
+               ('\t\n', '\tnan\n'))
+
+def parseMatrixRows(lines, num_cols):
+  """
+  Parse lines of a tab delimited matrix at once, from their joined text.
+
+  Args:
+    lines: A list of non-blank lines
+    num_cols: Number of cells per line
+  Return:
+    A 2D float64 array with NaN for empty cells
+  """
+  text = '\n%s\n' % '\n'.join(line.rstrip('\r\n') for line in lines)
+  for (empty, filled) in EMPTY_CELLS:
+    text = text.replace(empty, filled)
+  values = np.fromstring(text, dtype=np.float64, sep=' ')
+  if len(values) != len(lines) * num_cols:
+    raise ValueError('Adjacency matrix rows must hold %d numbers or empty ' 
+                     'cells' % num_cols)
+  return values.reshape(len(lines), num_cols)
+
+def readAdjacencyMatrix(adj_filename, block_rows=config.ADJ_BLOCK_ROWS):
+  """
+  Read a tab delimited adjacency matrix. Empty cells mean 'no edge'. Rows
+  are parsed in blocks, without splitting them into cells.
+
+  Args:
+    adj_filename: The file name of the adjacency matrix file, optionally
+      compressed
+    block_rows: Number of matrix rows parsed at once
+  Return:
+    A 2D float64 array with NaN for empty cells
+  """
+  adj_f = openStream(adj_filename)
+  try:
+    lines = (line for line in adj_f if line.strip('\r\n'))
+    first = next(lines, None)
+    if first is None:
+      return np.zeros((0, 0))
+    num_cols = first.count('\t') + 1
+    lines = chain([first], lines)
+    blocks = []
+    while True:
+      block = list(islice(lines, block_rows))
+      if not block:
+        break
+      blocks.append(parseMatrixRows(block, num_cols))
+  finally:
+    adj_f.close()
+  return np.concatenate(blocks)
+
+def isSymmetric(matrix):
+  """
+  Return True if matrix is square and equal to its transpose. Empty (NaN)
+  cells are considered equal.
+  """
+  if matrix.shape[0] != matrix.shape[1]:
+    return False
+  t = matrix.T
+  return bool(np.all((matrix == t) | (np.isnan(matrix) & np.isnan(t))))
+
+def blockEntries(block, row0, upper=False, thresh=None, top_k=None):
+  """
+  Find the edge entries of a block of consecutive matrix rows.
+
+  Args:
+    block: A 2D array holding matrix rows row0 onwards
+    row0: The matrix row index of the first row of block
+    upper: If True, only keep entries above the diagonal
+    thresh: Optional value entries must exceed to be kept
+    top_k: Optional number of largest entries to keep per row
+  Return:
+    A tuple of arrays (rows, cols, values) in row major order
+  """
+  row_ids = np.arange(row0, row0 + block.shape[0])[:, np.newaxis]
+  col_ids = np.arange(block.shape[1])[np.newaxis, :]
+  keep = np.isfinite(block) & (block != 0) & (col_ids != row_ids)
+  if upper:
+    keep &= (col_ids > row_ids)
+  if thresh is not None:
+    # Empty (NaN) cells are already dropped
+    with np.errstate(invalid='ignore'):
+      keep &= (block > thresh)
+  if top_k is not None and top_k < block.shape[1]:
+    scores = np.where(keep, block, -np.inf)
+    top = np.argpartition(scores, -top_k, axis=1)[:, -top_k:]
+    in_top = np.zeros(keep.shape, dtype=bool)
+    in_top[np.arange(block.shape[0])[:, np.newaxis], top] = True
+    keep &= in_top
+  (rows, cols) = np.nonzero(keep)
+  values = block[rows, cols].astype(np.float64)
+  return (rows + row0, cols, values)
+
+def adjacencyEdges(matrix, node_index, upper=False, thresh=None, top_k=None,
+                   block_rows=config.ADJ_BLOCK_ROWS, progress=None):
+  """
+  Extract the edges of an adjacency matrix with vectorized operations. The
+  matrix is processed in blocks of rows, so memory use is bounded by the
+  block size and the number of kept edges even for memory mapped matrices.
+
+  Args:
+    matrix: A 2D array, memory map or StreamedMatrix, eg. as returned by 
+      readAdjacencyMatrix or openBinaryMatrix
+    node_index: A dict mapping node IDs to node table row indices
+    upper: If True, only keep the upper triangle so each undirected edge 
+      appears once. In memory matrices must also be symmetric; memory mapped
+      and streamed ones are assumed to be.
+    thresh: Optional value entries must exceed to be kept
+    top_k: Optional number of largest entries to keep per row
+    block_rows: Number of matrix rows processed at once
+    progress: Optional callable progress(rows_done, num_rows), called after
+      each block
+  Return:
+    A tuple (EdgeMetadata, Table) laid out like a standard edge file with
+    Node1, Node2, color, width, depth and label columns.
+  """
+  if upper and type(matrix) is np.ndarray:
+    upper = isSymmetric(matrix)
+  num_rows = matrix.shape[0]
+  parts = []
+  for row0 in xrange(0, num_rows, block_rows):
+    block = np.asarray(matrix[row0:row0 + block_rows])
+    parts.append(blockEntries(block, row0, upper, thresh, top_k))
+    if progress:
+      progress(min(row0 + block_rows, num_rows), num_rows)
+  if parts:
+    (rows, cols, values) = [np.concatenate(p) for p in zip(*parts)]
+  else:
+    rows = cols = np.zeros(0, dtype=np.int64)
+    values = np.zeros(0)
+  num_edges = len(values)
+
+  # Map matrix indices to node indices
+  num_ids = max(matrix.shape) if matrix.size else 0
+  mapping = np.empty(num_ids, dtype=np.int32)
+  for i in xrange(num_ids):
+    mapping[i] = node_index.get(adjacencyNodeId(i), -1)
+  start = mapping[rows]
+  end   = mapping[cols]
+  missing = np.concatenate((rows[start < 0], cols[end < 0]))
+  if len(missing):
+    raise KeyError(adjacencyNodeId(missing[0]))
+
+  # Draw order follows the matrix in row major order
+  depth = np.arange(1, num_edges + 1, dtype=np.float64)
+  labels = np.empty(num_edges, dtype=object)
+  labels.fill(config.EDGE_DEFAULT_VAL['L'])
+  table = Table([None, start, end, values, values, depth, labels])
+
+  (min_v, max_v) = (values.min(), values.max()) if num_edges else (0.0, 1.0)
+  md_rows = [
+    ['Id', 'Node1', 'Node2', 'Property1', 'Property2', 'Property3', 'Property4'],
+    ['MIN_VAL', 'NA', 'NA', str(min_v), str(min_v), str(0), 'NA'],
+    ['MAX_VAL', 'NA', 'NA', str(max_v), str(max_v), str(num_edges), 'NA'],
+    ['USE_AS', 'S', 'E', 'C', 'W', 'D', 'L']]
+  return (EdgeMetadata.fromRows(md_rows, 'Id'), table)
+
+def isBinaryMatrix(adj_filename):
+  """
+  Return True if the given file holds a binary (.npy or raw) matrix,
+  compressed or not.
+  """
+  base_filename = splitCompressionExtension(adj_filename)[0]
+  return base_filename.lower().endswith(BINARY_MATRIX_EXTENSIONS)
+
+class StreamedMatrix(object):
+  """
+  A 2D .npy matrix read from a forward only stream, eg. a decompressing
+  InputStream. Only supports slicing consecutive blocks of rows in order,
+  as done by adjacencyEdges.
+  """
+  def __init__(self, stream):
+    """
+    Args:
+      stream: A binary file object positioned at the start of a .npy file
+    """
+    self.stream = stream
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+      header = np.lib.format.read_array_header_1_0(stream)
+    else:
+      header = np.lib.format.read_array_header_2_0(stream)
+    (self.shape, fortran_order, self.dtype) = header
+    if len(self.shape) != 2 or fortran_order or self.dtype.hasobject:
+      raise ValueError('Streamed .npy matrices must be 2D, C ordered and ' +
+                       'numeric')
+    self.ndim = 2
+    self.size = self.shape[0] * self.shape[1]
+    self.next_row = 0
+
+  def __getitem__(self, rows):
+    (start, stop, step) = rows.indices(self.shape[0])
+    if start != self.next_row or step != 1:
+      raise IndexError('StreamedMatrix rows must be read in order')
+    num_rows = max(stop - start, 0)
+    num_bytes = num_rows * self.shape[1] * self.dtype.itemsize
+    data = self.stream.read(num_bytes)
+    if len(data) != num_bytes:
+      raise ValueError('Streamed .npy matrix is truncated')
+    self.next_row = start + num_rows
+    return np.frombuffer(data, self.dtype).reshape(num_rows, self.shape[1])
+
+  def close(self):
+    self.stream.close()
+
+def openBinaryMatrix(adj_filename, dtype=np.float32):
+  """
+  Memory map a binary adjacency matrix without reading it. Compressed .npy
+  files are streamed instead.
+
+  Args:
+    adj_filename: Either a .npy file, or a raw file holding a square matrix
+      in row major order. .npy files may be compressed.
+    dtype: Element type of raw files. Ignored for .npy files.
+  Return:
+    A read only 2D np.memmap, or a StreamedMatrix for compressed files
+  """
+  (base_filename, compression) = splitCompressionExtension(adj_filename)
+  if compression:
+    if not base_filename.lower().endswith('.npy'):
+      raise ValueError('Compressed binary matrices must be .npy files: ' +
+                       adj_filename)
+    return StreamedMatrix(openStream(adj_filename))
+  if adj_filename.lower().endswith('.npy'):
+    matrix = np.load(adj_filename, mmap_mode='r')
+  else:
+    itemsize = np.dtype(dtype).itemsize
+    num_items = os.path.getsize(adj_filename) // itemsize
+    n = int(round(sqrt(num_items)))
+    if n * n != num_items:
+      raise ValueError(adj_filename + ' does not hold a square matrix of ' +
+                       np.dtype(dtype).name)
+    matrix = np.memmap(adj_filename, dtype=dtype, mode='r', shape=(n, n))
+  assert matrix.ndim == 2
+  return matrix
+
+def loadAdjacency(adj_filename, node_index, upper=False, **kwargs):
+  """
+  Read an adjacency matrix file straight into an edge table. Text matrices
+  are read into memory, binary matrices are memory mapped or streamed.
+
+  Args:
+    See readAdjacencyMatrix and adjacencyEdges. An optional dtype keyword
+    argument is passed to openBinaryMatrix.
+  Return:
+    A tuple (EdgeMetadata, Table)
+  """
+  if isBinaryMatrix(adj_filename):
+    matrix = openBinaryMatrix(adj_filename, kwargs.pop('dtype', np.float32))
+  else:
+    kwargs.pop('dtype', None)
+    matrix = readAdjacencyMatrix(adj_filename)
+  try:
+    return adjacencyEdges(matrix, node_index, upper, **kwargs)
+  finally:
+    if isinstance(matrix, StreamedMatrix):
+      matrix.close()
@@ -0,0 +1,338 @@
+"""
+  Batch rendering of a cohort of subjects sharing one node file.
+
+  The node file is parsed and laid out, and its rings, labels and ring
+  legends rendered, once in the parent process. Worker processes forked
+  after that inherit them without pickling. Each worker renders a chunk of
+  edge files, parsing the next one in a background thread while the
+  current one renders.
+
+  Usage example:
+    python batch.py -n nodes.csv -e 'subjects/*_edges.csv' -o renders -j 4
+"""
+
+# Library Imports
+import os
+import sys
+import glob
+import Queue
+import argparse
+import cPickle
+import threading
+import multiprocessing
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import matplotlib.font_manager as font_manager
+
+# Local Module Imports
+import config
+from graph import Graph, parseNodeFile
+from graph_renderer import GraphRenderer, outputFormat
+from metadata import NodeMetadata, EdgeMetadata
+from cache import GraphCache
+from reader import InputReader, splitCompressionExtension
+
+# State shared with worker processes. Set by initWorker, which is inherited
+# without pickling where processes are forked.
+_worker_state = None
+
+class LayerTemplate(object):
+  """
+  An in-memory stand-in for GraphCache's rendered layer storage, holding
+  the layers of a single node file as pickled bytes. Every get returns a
+  fresh copy to draw edges on.
+
+  Class usage example:
+    template = LayerTemplate()
+    GraphRenderer(g, None).renderNodeLayers(template)
+    gr.render('out.pdf', None, cache=template)
+  """
+  __slots__ = ('data',)
+
+  def __init__(self):
+    self.data = None
+
+  def layerKey(self, node_digest, lobe_digest=None):
+    return None
+
+  def getLayers(self, key):
+    if self.data is None:
+      return None
+    return cPickle.loads(self.data)
+
+  def putLayers(self, key, layers):
+    self.data = cPickle.dumps(layers, cPickle.HIGHEST_PROTOCOL)
+
+def expandInputs(patterns):
+  """
+  Expand edge file names and glob patterns, in the order given. Each
+  pattern's matches are sorted. Names matching nothing are kept, so that
+  they are reported as missing later.
+
+  Return:
+    A list of file names without duplicates
+  """
+  filenames = []
+  for pattern in patterns:
+    for filename in (sorted(glob.glob(pattern)) or [pattern]):
+      if filename not in filenames:
+        filenames.append(filename)
+  return filenames
+
+def outputFilename(out_dir, edge_filename, fmt):
+  """
+  Name the output file of an edge file: its base name in out_dir, with its
+  compression and file extensions replaced by fmt.
+  """
+  name = splitCompressionExtension(os.path.basename(edge_filename))[0]
+  return os.path.join(out_dir, os.path.splitext(name)[0] + '.' + fmt)
+
+def initWorker(graph, node_digest, lobe_filename, layers, cache,
+               edge_thresh, render_kwargs):
+  """
+  Store the state needed by renderChunk in a worker process.
+
+  Args:
+    graph: A Graph of the shared node file, without edges
+    node_digest: Digest of the node file, if cache is given
+    lobe_filename: Lobe extent file name, or None
+    layers: A LayerTemplate or GraphCache holding the rendered node layers
+    cache: Optional GraphCache of parsed edge tables
+    edge_thresh: Optional tuple (percentage, use style code)
+    render_kwargs: Dict of further GraphRenderer.render arguments
+  """
+  global _worker_state
+  _worker_state = (graph, node_digest, lobe_filename, layers, cache,
+                   edge_thresh, render_kwargs)
+  # Cached fonts read glyphs from their files as needed. A forked process 
+  # shares those files' offsets with its parent and siblings, so it opens 
+  # its own.
+  font_cache = getattr(font_manager, '_get_font', None)
+  if hasattr(font_cache, 'cache_clear'):
+    font_cache.cache_clear()
+
+def loadEdges(edge_filename):
+  """
+  Read an edge file into a Graph of the shared nodes.
+
+  Return:
+    A Graph instance
+  """
+  (graph, node_digest, lobe_filename, layers, cache, edge_thresh,
+   render_kwargs) = _worker_state
+  if cache:
+    (edge_md, edge_table, order) = cache.loadEdges(edge_filename, node_digest,
+                                                   graph.node_md,
+                                                   graph.node_table)
+    return graph.withEdges(edge_md, edge_filename, edge_thresh, edge_table,
+                           order)
+  edge_input = InputReader(edge_filename, config.NUM_EDGE_METADATA_ROWS)
+  edge_md = EdgeMetadata.fromRows(edge_input.md_rows, 'Id')
+  return graph.withEdges(edge_md, edge_input, edge_thresh)
+
+def prefetch(func, items):
+  """
+  Apply func to items in a background thread, one item ahead of the caller.
+
+  Return:
+    An iterator of (item, result, error) tuples, in order. error is the
+    exception func raised, in which case result is None.
+  """
+  results = Queue.Queue(maxsize=1)
+  def work():
+    for item in items:
+      try:
+        results.put((item, func(item), None))
+      except Exception as e:
+        results.put((item, None, e))
+  thread = threading.Thread(target=work)
+  thread.daemon = True
+  thread.start()
+  for i in xrange(len(items)):
+    yield results.get()
+  thread.join()
+
+def renderChunk(chunk):
+  """
+  Render a list of (edge file name, output file name) pairs with the state
+  given to initWorker.
+
+  Return:
+    A list of (edge file name, output file name, error message or None)
+  """
+  (graph, node_digest, lobe_filename, layers, cache, edge_thresh,
+   render_kwargs) = _worker_state
+  outputs = dict(chunk)
+  results = []
+  for (edge_filename, g, error) in prefetch(loadEdges,
+                                            [e for e, o in chunk]):
+    out_filename = outputs[edge_filename]
+    if error is None:
+      try:
+        gr = GraphRenderer(g, lobe_filename)
+        gr.render(out_filename, None, cache=layers, **render_kwargs)
+        plt.close(gr.fig)
+      except Exception as e:
+        error = e
+    results.append((edge_filename, out_filename,
+                    error and '%s: %s' % (type(error).__name__, error)))
+  return results
+
+def mapChunks(chunks, jobs):
+  """
+  Run renderChunk over chunks, in this process if jobs is 1, or else with a
+  pool of jobs worker processes, each set up by initWorker.
+
+  Return:
+    An iterator of renderChunk results, in order
+  """
+  if jobs == 1:
+    return (renderChunk(chunk) for chunk in chunks)
+  pool = multiprocessing.Pool(jobs, initWorker, _worker_state)
+  try:
+    return pool.map(renderChunk, chunks, chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+
+def renderBatch(node_filename, edge_filenames, out_dir, lobe_filename=None,
+                edge_thresh=None, jobs=1, cache=None, layer_cache=None,
+                **render_kwargs):
+  """
+  Render every edge file against one node file.
+
+  Args:
+    node_filename: The node CSV file name shared by all renders
+    edge_filenames: A list of edge CSV file names
+    out_dir: Output directory, created if missing
+    lobe_filename: Optional lobe extent file name
+    edge_thresh: Optional tuple (percentage, use style code)
+    jobs: Number of worker processes. 0 or None uses every CPU.
+    cache: Optional GraphCache of parsed node and edge tables
+    layer_cache: Optional GraphCache to keep the rendered node layers in.
+      By default they are only kept in memory for this batch.
+    render_kwargs: Further GraphRenderer.render arguments, eg. fmt
+  Return:
+    A list of (edge file name, output file name, error message or None), in
+    edge file order
+  """
+  jobs = jobs or multiprocessing.cpu_count()
+  fmt = outputFormat('', render_kwargs.get('fmt'))
+  pairs = [(e, outputFilename(out_dir, e, fmt)) for e in edge_filenames]
+  if len(set(o for e, o in pairs)) < len(pairs):
+    raise ValueError('Edge files with the same base name would overwrite ' +
+                     'each other\'s output')
+  if not os.path.isdir(out_dir):
+    os.makedirs(out_dir)
+
+  # Parse and lay out the nodes, and render their layers, once
+  node_digest = None
+  if cache:
+    (node_md, node_table, node_digest) = cache.loadNodes(node_filename)
+  else:
+    node_input = InputReader(node_filename, config.NUM_NODE_METADATA_ROWS)
+    node_md = NodeMetadata.fromRows(node_input.md_rows, 'Id')
+    node_table = parseNodeFile(node_input, node_md)
+  graph = Graph(node_md, None, node_filename, None, node_table=node_table)
+  layers = layer_cache or LayerTemplate()
+  gr = GraphRenderer(graph, lobe_filename)
+  gr.renderNodeLayers(layers)
+  plt.close(gr.fig)
+
+  size = max(1, min(config.BATCH_CHUNK_FILES, -(-len(pairs) // jobs)))
+  chunks = [pairs[i:i + size] for i in xrange(0, len(pairs), size)]
+  initWorker(graph, node_digest, lobe_filename, layers, cache, edge_thresh,
+             render_kwargs)
+  results = []
+  for chunk_results in mapChunks(chunks, min(jobs, len(chunks) or 1)):
+    results.extend(chunk_results)
+  return results
+
+def main(sdef=100):
+  # Parse command line args
+  parser = argparse.ArgumentParser(prog='fmri-viz-batch',
+             description='Render many edge files against one node file')
+  parser.add_argument('-n', required=True, help='Node csv filename, ' +
+    'shared by every render. May be gzip, bz2 or xz compressed')
+  parser.add_argument('-e', required=True, nargs='+',
+    help='Edge csv filenames or glob patterns. May be gzip, bz2 or xz ' +
+         'compressed')
+  parser.add_argument('-o', required=True,
+    help='Output directory. Each output file is named after its edge file')
+  parser.add_argument('-l', help='Lobe extent file')
+  parser.add_argument('-s', type=int,
+    help='Specifies that only edges with a weight in the top s percent of ' +
+         'the full range of edge weights will be rendered. Defaults to ' +
+         str(sdef) + ' unless -t is given')
+  parser.add_argument('-t', type=int,
+    help='Specifies that t%% of edges will be rendered, those with the ' +
+         'highest weights')
+  parser.add_argument('--format', choices=config.OUTPUT_FORMATS,
+    default=config.DEFAULT_OUTPUT_FORMAT, help='Output file format')
+  parser.add_argument('--rasterize', default='none',
+    choices=sorted(config.RASTER_POLICIES),
+    help='Layers drawn as images in PDF and SVG output')
+  parser.add_argument('--dpi', type=int,
+    help='Resolution of PNG output and of rasterized layers')
+  parser.add_argument('--bundle', type=float, nargs='?',
+    const=config.BUNDLE_STRENGTH, metavar='BETA',
+    help='Bundle edges through their lobes with strength BETA in [0, 1]')
+  parser.add_argument('--bundle-lobes', action='store_true',
+    help='Draw one bundle per pair of lobes. Implies --bundle')
+  parser.add_argument('--density', type=int, nargs='?',
+    const=config.DENSITY_SIZE, metavar='PIXELS',
+    help='Draw edges as one density image, PIXELS wide')
+  parser.add_argument('-j', type=int, default=1,
+    help='Number of rendering processes. 0 uses every CPU')
+  parser.add_argument('--cache', action='store_true',
+    help='Reuse parsed node and edge tables from an on-disk cache')
+  parser.add_argument('--cache-layers', action='store_true',
+    help='Keep the rendered node layers in the on-disk cache for later ' +
+         'batches')
+  parser.add_argument('--cache-dir', default=config.CACHE_DIR,
+    help='Directory of the on-disk cache')
+  parser.add_argument('--cache-size', type=int,
+    default=config.CACHE_MAX_BYTES // (1024 ** 2),
+    help='Size limit of the on-disk cache in megabytes')
+  args = parser.parse_args()
+
+  if args.s and args.t:
+    parser.error('You must filter edges with either -s or -t, not both')
+  if args.s is None and not args.t:
+    args.s = sdef
+  if args.bundle is not None and not 0.0 <= args.bundle <= 1.0:
+    parser.error('The bundling strength (--bundle) must be in [0, 1]')
+  if args.density is not None and args.bundle_lobes:
+    parser.error('Use either --density or --bundle-lobes, not both')
+  edge_filenames = expandInputs(args.e)
+
+  # Edge Threshold Info
+  edge_thresh = None
+  if args.s:
+    edge_thresh = (args.s, config.EDGE_THRESH_1)
+  elif args.t:
+    edge_thresh = (args.t, config.EDGE_THRESH_2)
+
+  cache = None
+  if args.cache or args.cache_layers:
+    cache = GraphCache(args.cache_dir, args.cache_size * 1024 ** 2)
+  try:
+    results = renderBatch(args.n, edge_filenames, args.o, args.l,
+                          edge_thresh, args.j, args.cache and cache,
+                          args.cache_layers and cache, bundle=args.bundle,
+                          collapse=args.bundle_lobes, density=args.density,
+                          rasterize=args.rasterize, dpi=args.dpi,
+                          fmt=args.format)
+  except ValueError as e:
+    parser.error(str(e))
+  failed = [(e, error) for e, o, error in results if error]
+  for (edge_filename, error) in failed:
+    sys.stderr.write('%s: %s\n' % (edge_filename, error))
+  sys.stderr.write('Rendered %d of %d edge files\n' %
+                   (len(results) - len(failed), len(results)))
+  if failed:
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,308 @@
+"""
+  A persistent on-disk cache of parsed node and edge tables.
+
+  Each entry is a directory holding one .npy file per stored column and a
+  JSON file with the metadata rows, so numeric columns load as read-only
+  memory maps instead of being parsed again. Entries are keyed by a hash of
+  the input file contents and the CSV layout constants in config. Least
+  recently used entries are evicted once the cache exceeds its size limit.
+
+  The same cache also stores the rendered layers which depend only on the
+  node file, pickled as a whole matplotlib figure, so renders sharing a node
+  file only draw their edges.
+"""
+# Library Imports
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import cPickle
+import matplotlib
+import numpy as np
+
+# Local Module Imports
+import config
+from metadata import NodeMetadata, EdgeMetadata
+from table import Table, STRING_COL, columnKinds
+from graph import Graph, parseNodeFile, parseEdgeFile, nodeIndex
+from threshold import weightOrder
+from reader import InputReader
+
+# Bump to invalidate entries written by older versions of this module
+CACHE_VERSION = 2
+
+def fileDigest(filename):
+  """
+  Return the hex SHA-1 digest of a file's contents.
+  """
+  h = hashlib.sha1()
+  with open(filename, 'rb') as f:
+    while True:
+      chunk = f.read(1 << 20)
+      if not chunk:
+        break
+      h.update(chunk)
+  return h.hexdigest()
+
+class GraphCache(object):
+  """
+  Cache of parsed node and edge tables. Node tables are keyed by the node
+  file alone, so a node file shared by many renders is parsed only once.
+  Rendered node layers are likewise keyed by the node file and the render
+  settings.
+
+  Class usage example:
+    cache = GraphCache('~/.cache/brain_network_viz', 2 * 1024 ** 3)
+    g = cache.loadGraph('nodes.csv', 'edges.csv', (10, config.EDGE_THRESH_2))
+  """
+
+  def __init__(self, cache_dir=config.CACHE_DIR,
+               max_bytes=config.CACHE_MAX_BYTES):
+    """
+    Args:
+      cache_dir: Directory holding cache entries. Created if missing.
+      max_bytes: Maximum total size of all cache entries.
+    """
+    self.cache_dir = os.path.expanduser(cache_dir)
+    self.max_bytes = max_bytes
+    if not os.path.isdir(self.cache_dir):
+      os.makedirs(self.cache_dir)
+
+  def key(self, kind, *digests):
+    """
+    Build a cache key from input file digests and the relevant config values.
+
+    Args:
+      kind: 'nodes', 'edges' or 'layers'
+      digests: Content digests of every input the entry depends on
+    Return:
+      String key, usable as a directory name
+    """
+    h = hashlib.sha1()
+    layout = (CACHE_VERSION, kind, digests,
+              config.NUM_NODE_METADATA_ROWS, config.NUM_EDGE_METADATA_ROWS,
+              config.NODE_LAYER_COLS_BEGIN, config.EDGE_LAYER_COLS_BEGIN,
+              config.NODE_USE_AS_KEYS, config.EDGE_USE_AS_KEYS)
+    h.update(repr(layout))
+    return kind + '-' + h.hexdigest()
+
+  def get(self, key):
+    """
+    Look up a cache entry and mark it as most recently used.
+
+    Return:
+      A tuple (metadata rows, Table, dict of extra arrays), or None on a miss.
+    """
+    entry_dir = os.path.join(self.cache_dir, key)
+    try:
+      with open(os.path.join(entry_dir, 'meta.json'), 'rb') as f:
+        meta = json.load(f)
+      columns = []
+      for col_i, kind in enumerate(meta['kinds']):
+        if kind is None:
+          columns.append(None)
+        elif kind == STRING_COL:
+          col = np.load(os.path.join(entry_dir, 'col_%d.npy' % col_i))
+          columns.append(col.astype(object))
+        else:
+          columns.append(self.loadArray(entry_dir, 'col_%d.npy' % col_i))
+      arrays = dict((name, self.loadArray(entry_dir, name + '.npy'))
+                    for name in meta['arrays'])
+    except (IOError, OSError, ValueError, KeyError):
+      return None
+    os.utime(entry_dir, None)
+    # Metadata bytes are stored as latin-1 code points, see put
+    md_rows = [[v.encode('latin-1') for v in row] for row in meta['md']]
+    return (md_rows, Table(columns), arrays)
+
+  def loadArray(self, entry_dir, name):
+    """
+    Memory map a numeric .npy file of a cache entry.
+    """
+    path = os.path.join(entry_dir, name)
+    try:
+      return np.load(path, mmap_mode='r')
+    except ValueError:
+      # Empty arrays can't be memory mapped
+      return np.load(path)
+
+  def put(self, key, md, table, kinds, arrays=None):
+    """
+    Store a parsed table, then evict entries beyond the size limit.
+
+    Args:
+      key: A key returned by self.key
+      md: The Metadata instance describing the table
+      table: A Table
+      kinds: The table's column kinds, as returned by columnKinds
+      arrays: Optional dict of extra numeric arrays to store with the entry
+    """
+    arrays = arrays or {}
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+    try:
+      for col_i, kind in enumerate(kinds):
+        col = table.column(col_i)
+        if col is None:
+          continue
+        if kind == STRING_COL:
+          col = col.astype(str)
+        np.save(os.path.join(tmp_dir, 'col_%d.npy' % col_i), col)
+      for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), arr)
+      # Metadata rows are byte strings in any encoding. Decoding them as 
+      # latin-1 maps every byte to a code point, so json stores them exactly.
+      md_rows = [[v.decode('latin-1') for v in row] for row in md.data]
+      meta = {'md': md_rows, 'kinds': kinds, 'arrays': sorted(arrays)}
+      with open(os.path.join(tmp_dir, 'meta.json'), 'wb') as f:
+        json.dump(meta, f)
+      os.rename(tmp_dir, os.path.join(self.cache_dir, key))
+    except OSError:
+      # Another process stored the same entry first
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+    self.evict(keep=key)
+
+  def evict(self, keep=None):
+    """
+    Remove least recently used entries until the cache fits in max_bytes.
+
+    Args:
+      keep: Optional key of an entry that must not be evicted
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(self.cache_dir):
+      entry_dir = os.path.join(self.cache_dir, name)
+      if name.startswith('.') or not os.path.isdir(entry_dir):
+        continue
+      size = sum(os.path.getsize(os.path.join(entry_dir, f))
+                 for f in os.listdir(entry_dir))
+      entries.append((os.path.getmtime(entry_dir), name, size))
+      total += size
+    for mtime, name, size in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      if name == keep:
+        continue
+      shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+      total -= size
+
+  def layerKey(self, node_digest, lobe_digest=None):
+    """
+    Build the cache key of the rendered layers of a node file, from its
+    digest and every setting the layers depend on.
+
+    Args:
+      node_digest: Digest of the node file
+      lobe_digest: Digest of the lobe extent file, if any
+    Return:
+      String key, usable as a directory name
+    """
+    settings = (matplotlib.__version__, config.FIGURE_DPI, 
+                config.TOTAL_GAP_DEGREES, config.RING_RADIUS, 
+                config.RING_ORIGIN, config.RING_DEPTH, 
+                config.NODE_COLOR_GRADIENTS, config.LAYER_LABEL_COLORS, 
+                config.NODE_LABEL_FONTSIZE, config.NODE_LABEL_SPACING,
+                config.NODE_LABEL_SEPARATOR, config.MERGED_LABEL_COLOR,
+                config.NON_NUM_COLOR_MIN_VAL, config.NON_NUM_COLOR_MAX_VAL)
+    return self.key('layers', node_digest, lobe_digest, settings)
+
+  def getLayers(self, key):
+    """
+    Look up rendered layers and mark them as most recently used.
+
+    Return:
+      The object stored by putLayers, or None on a miss.
+    """
+    entry_dir = os.path.join(self.cache_dir, key)
+    try:
+      with open(os.path.join(entry_dir, 'layers.pickle'), 'rb') as f:
+        layers = cPickle.load(f)
+    except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+      return None
+    os.utime(entry_dir, None)
+    return layers
+
+  def putLayers(self, key, layers):
+    """
+    Store rendered layers, then evict entries beyond the size limit.
+
+    Args:
+      key: A key returned by self.layerKey
+      layers: A picklable object holding the layers, eg. a matplotlib 
+        figure and its artists
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+    try:
+      with open(os.path.join(tmp_dir, 'layers.pickle'), 'wb') as f:
+        cPickle.dump(layers, f, cPickle.HIGHEST_PROTOCOL)
+      os.rename(tmp_dir, os.path.join(self.cache_dir, key))
+    except OSError:
+      # Another process stored the same entry first
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+    self.evict(keep=key)
+
+  def loadNodes(self, node_filename):
+    """
+    Load node metadata and table, parsing node_filename on a cache miss.
+
+    Return:
+      A tuple (NodeMetadata, Table, node file digest)
+    """
+    digest = fileDigest(node_filename)
+    key = self.key('nodes', digest)
+    hit = self.get(key)
+    if hit:
+      node_md = NodeMetadata.fromRows(hit[0], 'Id')
+      return (node_md, hit[1], digest)
+    node_input = InputReader(node_filename, config.NUM_NODE_METADATA_ROWS)
+    node_md = NodeMetadata.fromRows(node_input.md_rows, 'Id')
+    node_table = parseNodeFile(node_input, node_md)
+    self.put(key, node_md, node_table, columnKinds(node_md, True))
+    return (node_md, node_table, digest)
+
+  def loadEdges(self, edge_filename, node_digest, node_md, node_table, 
+                jobs=1):
+    """
+    Load edge metadata, the full edge table and its weight-sorted row order,
+    parsing edge_filename on a cache miss.
+
+    Args:
+      edge_filename: The file name of the CSV edge input file
+      node_digest: Digest of the node file the edges index into
+      node_md, node_table: The parsed node file
+      jobs: Number of processes parsing the edge file on a miss
+    Return:
+      A tuple (EdgeMetadata, Table, weight order array or None)
+    """
+    key = self.key('edges', fileDigest(edge_filename), node_digest)
+    hit = self.get(key)
+    if hit:
+      edge_md = EdgeMetadata.fromRows(hit[0], 'Id')
+      return (edge_md, hit[1], hit[2].get('order'))
+    edge_input = InputReader(edge_filename, config.NUM_EDGE_METADATA_ROWS)
+    edge_md = EdgeMetadata.fromRows(edge_input.md_rows, 'Id')
+    edge_table = parseEdgeFile(edge_input, edge_md,
+                               nodeIndex(node_table, node_md), jobs=jobs)
+    order = weightOrder(edge_table, edge_md)
+    arrays = {'order': order} if order is not None else {}
+    self.put(key, edge_md, edge_table, columnKinds(edge_md, False), arrays)
+    return (edge_md, edge_table, order)
+
+  def loadGraph(self, node_filename, edge_filename, edge_thresh=None, jobs=1):
+    """
+    Construct a Graph, reusing cached tables where possible.
+
+    Args:
+      node_filename: The file name of the CSV node input file
+      edge_filename: The file name of the CSV edge input file
+      edge_thresh: Optional tuple (percentage, use style code)
+      jobs: Number of processes parsing the edge file on a miss
+    Return:
+      A Graph instance
+    """
+    node_md, node_table, node_digest = self.loadNodes(node_filename)
+    edge_md, edge_table, order = self.loadEdges(edge_filename, node_digest,
+                                                node_md, node_table, jobs)
+    return Graph(node_md, edge_md, node_filename, edge_filename, edge_thresh,
+                 node_table, edge_table, order)
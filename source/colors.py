@@ -0,0 +1,143 @@
+"""
+  Color mapping for node rings and edges.
+
+  A Gradient parses its two hex endpoint colors once and maps values to
+  colors with the same arithmetic as helper.calcColor, so results are
+  identical at 8-bit precision: either one value at a time as a hex string,
+  or whole value arrays at once as RGBA arrays for the batched renderers.
+"""
+# Library Imports
+import numpy as np
+
+# Local Module Imports
+import config
+
+# Lookup tables from an 8-bit channel value to its hex digits and its
+# normalized matplotlib value
+HEX_LEVELS  = ['%0.2X' % i for i in range(256)]
+RGBA_LEVELS = np.arange(256) / 255.0
+
+def parseHex(color):
+  """
+  Return the decimal (red, green, blue) values of a '#RRGGBB' string.
+  """
+  return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+class Gradient(object):
+  """
+  A linear gradient between two colors.
+
+  Class usage example:
+    gradient = Gradient('#DA6638', '#6F2000')
+    gradient.color(0.5, 0.0, 1.0)                  # => '#A4431C'
+    gradient.rgba(np.array([0.0, 1.0]), 0.0, 1.0)  # => shape (2, 4)
+  """
+  __slots__ = ('start_color', 'end_color', 'start_rgb', 'delta_rgb',
+               'colors')
+
+  def __init__(self, start_color, end_color):
+    """
+    Args:
+      start_color: Hex string of the color of the minimum value
+      end_color: Hex string of the color of the maximum value
+    """
+    self.start_color = start_color
+    self.end_color = end_color
+    self.start_rgb = parseHex(start_color)
+    end_rgb = parseHex(end_color)
+    self.delta_rgb = tuple(e - s for s, e in zip(self.start_rgb, end_rgb))
+    # Hex strings by (red, green, blue), filled in as they are used
+    self.colors = {}
+
+  def color(self, u, min_u, max_u):
+    """
+    Interpolate one color, like calcColor(start_color, end_color, u, min_u,
+    max_u).
+
+    Args:
+      u: float value in the range [min_u, max_u]
+      min_u, max_u: float range of values
+    Return:
+      Interned hex string color
+    """
+    assert max_u - min_u != 0.0
+    v = (1.0 * (u - min_u)) / float(max_u - min_u) + 0.0
+    assert 0.0 <= v <= 1.0
+    (r0, g0, b0) = self.start_rgb
+    (dr, dg, db) = self.delta_rgb
+    rgb = (int(v * dr + r0), int(v * dg + g0), int(v * db + b0))
+    hex_color = self.colors.get(rgb)
+    if hex_color is None:
+      hex_color = intern('#' + ''.join(HEX_LEVELS[c] for c in rgb))
+      self.colors[rgb] = hex_color
+    return hex_color
+
+  def rgb(self, values, min_val, max_val):
+    """
+    Interpolate the 8-bit colors of an array of values.
+
+    Args:
+      values: float64 array of values in the range [min_val, max_val]
+      min_val, max_val: float range of values
+    Return:
+      An int array of (red, green, blue) values, shape (len(values), 3)
+    """
+    assert max_val - min_val != 0.0
+    v = (1.0 * (values - min_val)) / float(max_val - min_val) + 0.0
+    assert np.all((0.0 <= v) & (v <= 1.0))
+    # Values are non-negative, so truncating matches int()
+    rgb = v[:, np.newaxis] * np.array(self.delta_rgb) + self.start_rgb
+    return rgb.astype(np.intp)
+
+  def rgba(self, values, min_val, max_val):
+    """
+    Interpolate the colors of an array of values for matplotlib.
+
+    Return:
+      A float64 array of RGBA colors in [0, 1], shape (len(values), 4)
+    """
+    rgba = np.ones((len(values), 4))
+    rgba[:, :3] = RGBA_LEVELS[self.rgb(values, min_val, max_val)]
+    return rgba
+
+NODE_GRADIENTS = [Gradient(*g) for g in config.NODE_COLOR_GRADIENTS]
+EDGE_GRADIENT  = Gradient(*config.EDGE_COLOR_GRADIENT)
+
+def nodeGradient(layer_i):
+  """
+  Return the Gradient of a node ring layer. Gradients repeat when there are
+  more layers than config.NODE_COLOR_GRADIENTS.
+  """
+  return NODE_GRADIENTS[layer_i % len(NODE_GRADIENTS)]
+
+def categoryValues(column):
+  """
+  Map the values of a categorical property to color values in the
+  [NON_NUM_COLOR_MIN_VAL, NON_NUM_COLOR_MAX_VAL) range by hashing them, like
+  the per-object renderers do. Each distinct value is hashed once.
+
+  Args:
+    column: A sequence of strings
+  Return:
+    A float64 array of color values
+  """
+  (uniques, inverse) = np.unique(np.asarray(column, dtype=object),
+                                 return_inverse=True)
+  hashed = [abs(hash(u)) % config.NON_NUM_COLOR_MAX_VAL for u in uniques]
+  return np.array(hashed, dtype=np.float64)[inverse]
+
+def hexRGBA(hex_colors):
+  """
+  Convert a sequence of hex string colors to an RGBA array, parsing each
+  distinct color once.
+
+  Return:
+    A float64 array of RGBA colors in [0, 1], shape (len(hex_colors), 4)
+  """
+  rows = {}
+  codes = np.fromiter((rows.setdefault(c, len(rows)) for c in hex_colors),
+                      dtype=np.intp, count=len(hex_colors))
+  table = np.ones((len(rows), 4))
+  for c, i in rows.items():
+    table[i, :3] = RGBA_LEVELS[list(parseHex(c))]
+  return table[codes]
@@ -20,6 +20,57 @@ NODE_LAYER_COLS_BEGIN = 5
 # define properties.
 EDGE_LAYER_COLS_BEGIN = 3
 
+# Number of adjacency matrix rows processed at once. Bounds memory use when
+# extracting edges from large (memory mapped) matrices.
+ADJ_BLOCK_ROWS = 256
+
+# Maximum number of bytes of an edge file parsed at once by one worker process
+# when parsing in parallel (-j)
+PARSE_CHUNK_BYTES = 64 * 1024 ** 2
+
+"""----------------------------------------------------------------------------
+  PARSED GRAPH CACHE
+----------------------------------------------------------------------------"""
+
+# Default directory of the on-disk cache of parsed node and edge tables
+CACHE_DIR = '~/.cache/brain_network_viz'
+
+# Least recently used cache entries are evicted beyond this total size
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+"""----------------------------------------------------------------------------
+  BATCH RENDERING
+----------------------------------------------------------------------------"""
+
+# Maximum number of edge files a batch worker renders per task. Each worker
+# parses the next edge file of its task while rendering the current one.
+BATCH_CHUNK_FILES = 8
+
+"""----------------------------------------------------------------------------
+  OUTPUT
+----------------------------------------------------------------------------"""
+
+# Output file formats. Chosen by the output file name's extension unless one
+# is given explicitly, DEFAULT_OUTPUT_FORMAT if the extension isn't known.
+OUTPUT_FORMATS = ('pdf', 'svg', 'png')
+DEFAULT_OUTPUT_FORMAT = 'pdf'
+
+# Resolution of the figure in dots per inch. Sets the size of PNG output.
+FIGURE_DPI = 72
+
+# Default resolution of rasterized layers in PDF and SVG output
+RASTER_DPI = 300
+
+# Layers drawn as images in PDF and SVG output, by rasterization policy. Text
+# and legends always stay vector. 'other' covers every remaining non-text 
+# artist, such as node label arcs and leader lines.
+RASTER_POLICIES = {
+  'none': (),
+  'edges': ('edges',),
+  'edges+rings': ('edges', 'rings'),
+  'all': ('edges', 'rings', 'other')
+}
+
 """----------------------------------------------------------------------------
   METADATA
 ----------------------------------------------------------------------------"""
@@ -92,6 +143,25 @@ RING_DEPTH = 0.1
 MIN_EDGE_WIDTH = 0.0
 MAX_EDGE_WIDTH = 2.0
 
+""" Edge bundling routes each edge from its node, through its lobe's anchor
+point, through the ring origin, to the other lobe's anchor and node. Anchors 
+sit at BUNDLE_ANCHOR_RADIUS times the ring radius, at the lobe's mid theta. 
+The bundling strength (beta) is in [0, 1]: 0 draws straight lines, 1 follows
+the lobe hierarchy exactly. """
+BUNDLE_ANCHOR_RADIUS = 0.5
+BUNDLE_STRENGTH = 0.85
+
+# Width limit of the edge bundles drawn when collapsing lobe pairs
+MAX_BUNDLE_WIDTH = 8.0
+
+""" Density rendering rasterizes all edges into one image of DENSITY_SIZE by
+DENSITY_SIZE pixels covering the inside of the ring. Curves are flattened 
+into DENSITY_SEGMENTS line segments per Bezier piece, and about 
+DENSITY_CHUNK_SAMPLES points are splatted into the image at once. """
+DENSITY_SIZE = 1024
+DENSITY_SEGMENTS = 16
+DENSITY_CHUNK_SAMPLES = 1 << 22
+
 # An array of color gradients. Will be cycled through to color rings.
 NODE_COLOR_GRADIENTS = [
   ('#44A77D', '#004C2C'), # Green
@@ -103,6 +173,15 @@ EDGE_COLOR_GRADIENT = ('#DA6638', '#6F2000') # Red
 
 LAYER_LABEL_COLORS = ('#801815', '#804615', '#0D4A4D', '#116416')
 
+""" Node labels are drawn at NODE_LABEL_FONTSIZE points. Labels closer than 
+NODE_LABEL_SPACING line heights of arc to the last label kept are dropped. 
+When nodes have several labels and each label gets less arc than that, a 
+node's labels are merged into one, joined by NODE_LABEL_SEPARATOR. """
+NODE_LABEL_FONTSIZE = 2.5
+NODE_LABEL_SPACING = 1.0
+NODE_LABEL_SEPARATOR = ' / '
+MERGED_LABEL_COLOR = '#555555'
+
 """ When input color values are not numeric, but are instead strings, those
 strings get hashed to numeric values and modulo'd into the range specified
 by the following constants. """
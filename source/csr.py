@@ -0,0 +1,169 @@
+"""
+  Compressed sparse row (CSR) index of a graph's edges over integer node
+  indices, for neighborhood queries that don't scan every edge.
+
+  Edges are grouped twice: by start node (out edges) and by end node (in
+  edges). For node i, out_edges[out_ptr[i]:out_ptr[i + 1]] lists the indices
+  of the edges starting at i, in edge order. Likewise for in edges.
+"""
+# Library Imports
+import numpy as np
+
+def groupBy(keys, num_keys):
+  """
+  Group positions 0..len(keys)-1 by key.
+
+  Args:
+    keys: int array of keys in [0, num_keys)
+    num_keys: Number of distinct keys
+  Return:
+    A tuple (int64 index pointer array of length num_keys + 1, int64 array
+    of positions sorted by key, ties in position order)
+  """
+  order = np.argsort(keys, kind='mergesort')
+  ptr = np.zeros(num_keys + 1, dtype=np.int64)
+  np.cumsum(np.bincount(keys, minlength=num_keys), out=ptr[1:])
+  return (ptr, order)
+
+def gatherRanges(ptr, values, keys):
+  """
+  Concatenate values[ptr[k]:ptr[k + 1]] for each k in keys, without a
+  Python loop.
+  """
+  keys = np.asarray(keys, dtype=np.intp)
+  begins = ptr[keys]
+  lengths = ptr[keys + 1] - begins
+  total = lengths.sum()
+  if total == 0:
+    return values[:0]
+  # Position within each range, offset by the range's begin
+  offsets = np.repeat(begins - np.cumsum(lengths) + lengths, lengths)
+  return values[offsets + np.arange(total)]
+
+class CSRIndex(object):
+  """
+  Out and in edge index of a directed graph. Undirected graphs are covered
+  by combining both directions, as the *Degree and edgesOf* methods do.
+
+  Class usage example:
+    csr = CSRIndex(g.edge_start, g.edge_end, len(g.node_list))
+    csr.degree()[g.nodes['Node1'].idx]
+  """
+  def __init__(self, start, end, num_nodes, weights=None):
+    """
+    Args:
+      start: int array of the start node index of each edge
+      end: int array of the end node index of each edge
+      num_nodes: Number of nodes
+      weights: Optional float array of edge weights, used for strengths.
+        Every edge weighs 1 if not given.
+    """
+    self.start = np.asarray(start, dtype=np.intp)
+    self.end = np.asarray(end, dtype=np.intp)
+    self.num_nodes = num_nodes
+    self.weights = weights
+    (self.out_ptr, self.out_edges) = groupBy(self.start, num_nodes)
+    (self.in_ptr, self.in_edges) = groupBy(self.end, num_nodes)
+    self.out_nbrs = self.end[self.out_edges]
+    self.in_nbrs = self.start[self.in_edges]
+
+  def outDegree(self):
+    """
+    Return an int array with the number of edges starting at each node.
+    """
+    return np.diff(self.out_ptr)
+
+  def inDegree(self):
+    """
+    Return an int array with the number of edges ending at each node.
+    """
+    return np.diff(self.in_ptr)
+
+  def degree(self):
+    """
+    Return an int array with the number of edge endpoints at each node. Self
+    loops count twice.
+    """
+    return self.outDegree() + self.inDegree()
+
+  def strength(self):
+    """
+    Return a float array with the summed weight of the edges at each node.
+    Self loops count twice.
+    """
+    if self.weights is None:
+      return self.degree().astype(np.float64)
+    return (np.bincount(self.start, self.weights, self.num_nodes) +
+            np.bincount(self.end, self.weights, self.num_nodes))
+
+  def outEdges(self, node_i):
+    """
+    Return the indices of the edges starting at node node_i, in edge order.
+    """
+    return self.out_edges[self.out_ptr[node_i]:self.out_ptr[node_i + 1]]
+
+  def inEdges(self, node_i):
+    """
+    Return the indices of the edges ending at node node_i, in edge order.
+    """
+    return self.in_edges[self.in_ptr[node_i]:self.in_ptr[node_i + 1]]
+
+  def neighbors(self, node_i):
+    """
+    Return the sorted indices of the nodes sharing an edge with node_i.
+    """
+    return np.union1d(self.out_nbrs[self.out_ptr[node_i]:
+                                    self.out_ptr[node_i + 1]],
+                      self.in_nbrs[self.in_ptr[node_i]:self.in_ptr[node_i + 1]])
+
+  def edgesOf(self, node_i):
+    """
+    Return the sorted indices of the edges touching node node_i.
+    """
+    return np.union1d(self.outEdges(node_i), self.inEdges(node_i))
+
+  def edgesOfNodes(self, nodes, within=False):
+    """
+    Find the edges touching a set of nodes. Runs in time proportional to the
+    number of edges found.
+
+    Args:
+      nodes: A sequence of node indices
+      within: If True, only return edges with both endpoints in nodes
+    Return:
+      A sorted int array of edge indices
+    """
+    out_found = gatherRanges(self.out_ptr, self.out_edges, nodes)
+    if within:
+      member = np.zeros(self.num_nodes, dtype=bool)
+      member[np.asarray(nodes, dtype=np.intp)] = True
+      return np.unique(out_found[member[self.end[out_found]]])
+    in_found = gatherRanges(self.in_ptr, self.in_edges, nodes)
+    return np.unique(np.concatenate((out_found, in_found)))
+
+  def groupDegree(self, groups, num_groups):
+    """
+    Count edge endpoints per group of nodes, eg. per lobe.
+
+    Args:
+      groups: int array with the group of each node
+      num_groups: Number of groups
+    Return:
+      An int array with the number of edge endpoints in each group. Edges
+      within a group count twice.
+    """
+    groups = np.asarray(groups)
+    return np.bincount(groups, self.degree(), num_groups).astype(np.int64)
+
+  def groupEdgeCounts(self, groups, num_groups):
+    """
+    Count edges between each pair of node groups, eg. lobes.
+
+    Return:
+      An int array of shape (num_groups, num_groups). Entry [a, b] counts
+      the edges starting in group a and ending in group b.
+    """
+    groups = np.asarray(groups)
+    pairs = groups[self.start] * num_groups + groups[self.end]
+    counts = np.bincount(pairs, minlength=num_groups * num_groups)
+    return counts.reshape(num_groups, num_groups)
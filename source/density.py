@@ -0,0 +1,154 @@
+"""
+  Edge density rasterization, for graphs with too many edges to draw one by
+  one.
+
+  Edge curves are flattened to polylines and sampled about once per pixel.
+  Each sample is splatted bilinearly into a float accumulation buffer,
+  weighted by its edge's weight and the length it stands for. The buffer is
+  then tone mapped through a color gradient into one RGBA image, so the
+  output size doesn't depend on the number of edges.
+"""
+# Library Imports
+import numpy as np
+
+# Local Module Imports
+import config
+
+def mergeCurves(start, end, weights, num_nodes):
+  """
+  Merge edges between the same pair of nodes, in either direction, which
+  follow the same curve. Their weights are summed.
+
+  Args:
+    start: int array of the start node index of each edge
+    end: int array of the end node index of each edge
+    weights: float64 array of edge weights
+    num_nodes: Number of nodes
+  Return:
+    A tuple (start, end, weights) of the distinct curves
+  """
+  (lo, hi) = (np.minimum(start, end), np.maximum(start, end))
+  (pairs, inverse) = np.unique(lo.astype(np.int64) * num_nodes + hi, 
+                               return_inverse=True)
+  return (pairs // num_nodes, pairs % num_nodes, 
+          np.bincount(inverse, weights, len(pairs)))
+
+def polylineSamples(verts, weights, px_per_unit):
+  """
+  Sample polylines about once per pixel.
+
+  Args:
+    verts: float64 array of polyline vertices, shape (num lines, k, 2)
+    weights: float64 array of the weight of each polyline
+    px_per_unit: Pixels per data coordinate unit
+  Return:
+    A tuple (float64 array of sample points, shape (num samples, 2), float64
+    array of sample weights). A sample's weight is its polyline's weight
+    times the length in pixels it stands for.
+  """
+  starts = verts[:, :-1].reshape(-1, 2)
+  deltas = (verts[:, 1:] - verts[:, :-1]).reshape(-1, 2)
+  seg_px = np.hypot(deltas[:, 0], deltas[:, 1]) * px_per_unit
+  counts = np.maximum(np.ceil(seg_px), 1).astype(np.intp)
+  seg_wts = np.repeat(weights, verts.shape[1] - 1) * seg_px / counts
+  # Sample each segment at the middle of counts equal parts
+  steps = deltas / counts[:, np.newaxis]
+  first = np.cumsum(counts) - counts
+  k = np.arange(counts.sum(), dtype=np.float64) - np.repeat(first, counts)
+  points = np.repeat(starts + 0.5 * steps, counts, axis=0)
+  points += k[:, np.newaxis] * np.repeat(steps, counts, axis=0)
+  return (points, np.repeat(seg_wts, counts))
+
+def splat(buf, points, weights, extent):
+  """
+  Add weighted points to an accumulation buffer with bilinear weights, so
+  each point's weight is shared between the four nearest pixel centers.
+  Points outside the buffer are moved onto its border.
+
+  Args:
+    buf: float64 array of shape (height, width), modified in place. Row 0
+      is the bottom of the extent.
+    points: float64 array of (x, y) points in data coordinates
+    weights: float64 array of point weights
+    extent: Tuple (left, right, bottom, top) covered by buf
+  """
+  (height, width) = buf.shape
+  (left, right, bottom, top) = extent
+  # Pixel coordinates with pixel centers at integers, clipped so that all
+  # four neighbors are inside the buffer
+  x = (points[:, 0] - left) * (width / float(right - left)) - 0.5
+  y = (points[:, 1] - bottom) * (height / float(top - bottom)) - 0.5
+  np.clip(x, 0, width - 1.000001, out=x)
+  np.clip(y, 0, height - 1.000001, out=y)
+  (x0, y0) = (np.floor(x), np.floor(y))
+  (fx, fy) = (x - x0, y - y0)
+  corner = y0.astype(np.intp) * width + x0.astype(np.intp)
+  (wx, wy) = (weights * fx, fy)
+  w0 = weights - wx
+  flat = buf.reshape(-1)
+  for offset, w in ((0, w0 - w0 * wy), (1, wx - wx * wy), 
+                    (width, w0 * wy), (width + 1, wx * wy)):
+    flat += np.bincount(corner + offset, w, flat.size)
+
+def accumulate(verts, weights, size, extent,
+               chunk_samples=config.DENSITY_CHUNK_SAMPLES):
+  """
+  Rasterize weighted polylines into a density buffer. Polylines are
+  processed in chunks, so memory use doesn't grow with their number.
+
+  Args:
+    verts: float64 array of polyline vertices, shape (num lines, k, 2)
+    weights: float64 array of the weight of each polyline
+    size: Width and height of the square buffer in pixels
+    extent: Tuple (left, right, bottom, top) covered by the buffer
+    chunk_samples: Approximate number of samples splatted at once
+  Return:
+    A float64 array of shape (size, size)
+  """
+  buf = np.zeros((size, size))
+  px_per_unit = size / float(extent[1] - extent[0])
+  if not len(verts):
+    return buf
+  # Size chunks by the longest polyline, measured along its vertices
+  lengths = np.hypot(*np.diff(verts, axis=1).transpose(2, 0, 1)).sum(axis=1)
+  samples_per_line = lengths.max() * px_per_unit + verts.shape[1]
+  chunk = max(1, int(chunk_samples // samples_per_line))
+  for begin in xrange(0, len(verts), chunk):
+    (points, point_wts) = polylineSamples(verts[begin:begin + chunk],
+                                          weights[begin:begin + chunk],
+                                          px_per_unit)
+    splat(buf, points, point_wts, extent)
+  return buf
+
+def toneMap(buf, gradient):
+  """
+  Map a density buffer to an RGBA image. Densities are log scaled to [0, 1]
+  and colored by the gradient. Opacity follows the scaled density, so empty
+  pixels are transparent.
+
+  Args:
+    buf: float64 density array of shape (height, width)
+    gradient: A colors.Gradient
+  Return:
+    A float64 RGBA array of shape (height, width, 4)
+  """
+  scaled = np.log1p(np.maximum(buf, 0.0))
+  top = scaled.max()
+  if top > 0:
+    scaled /= top
+  rgba = gradient.rgba(scaled.reshape(-1), 0.0, 1.0)
+  rgba[:, 3] = scaled.reshape(-1)
+  return rgba.reshape(buf.shape + (4,))
+
+def composite(rgba, background):
+  """
+  Blend an RGBA image over a solid background color.
+
+  Args:
+    rgba: float64 RGBA array of shape (height, width, 4)
+    background: RGB or RGBA tuple of floats in [0, 1]
+  Return:
+    A float64 RGB array of shape (height, width, 3)
+  """
+  alpha = rgba[..., 3:]
+  return rgba[..., :3] * alpha + np.asarray(background[:3]) * (1 - alpha)
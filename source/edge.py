@@ -4,13 +4,15 @@
 """
 import config
 
-class Edge:
+class Edge(object):
+  __slots__ = ('md', 'csv', 'start_node', 'end_node')
+
   def __init__(self, csv_row, start_node, end_node, md):
     """
     Construct an Edge instance.
 
     Args:
-      csv_row: This edge's csv row as a list of strings.
+      csv_row: This edge's csv row as a list of strings, or a TableRow view.
       start_node: A reference to one endpoint Node of this edge.
       end_node: A reference to the other endpoint Node of this edge.
       md: A Metadata object about edges.
@@ -19,3 +21,40 @@ class Edge:
     self.csv = csv_row
     self.start_node = start_node
     self.end_node = end_node
+
+class EdgeList(object):
+  """
+  A read only sequence of Edge views over a columnar edge Table. Edge objects
+  are constructed on access, so only the table's arrays stay resident.
+  """
+  __slots__ = ('table', 'start', 'end', 'node_list', 'md')
+
+  def __init__(self, table, start, end, node_list, md):
+    """
+    Args:
+      table: A Table of edge data rows
+      start: int32 array of start node indices, one per edge
+      end: int32 array of end node indices, one per edge
+      node_list: A list of Node instances ordered by node index
+      md: A Metadata object about edges.
+    """
+    self.table = table
+    self.start = start
+    self.end = end
+    self.node_list = node_list
+    self.md = md
+
+  def __len__(self):
+    return len(self.table)
+
+  def __getitem__(self, i):
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError('edge index out of range')
+    return Edge(self.table.row(i), self.node_list[self.start[i]], 
+                self.node_list[self.end[i]], self.md)
+
+  def __iter__(self):
+    for i in xrange(len(self)):
+      yield self[i]
@@ -1,115 +1,216 @@
 """
-  A class to maintain render information about an Edge instance and provide
-  rendering methods for that edge.
+  Edge rendering. Render values of all edges are computed as arrays and the
+  edges drawn as one collection.
 """
 
 # Library Imports
-from matplotlib.patches import Path, PathPatch
+import numpy as np
+from matplotlib.collections import PathCollection
 
 # Local Module Imports
 import config
-from helper import mapRangeParam, calcColor
-from helper import polar2Cartesian, midTheta 
-
-class EdgeRenderer:
-
-  def __init__(self, edge):
-    """
-      Constructor
-
-      Args:
-        edge: An Edge instance
-    """
-    self.edge = edge
-
-    # Render properties. Populated below.
-    self.color = None
-    self.width = None
-    self.depth = None
-    self.label = None
-
-    # Parse color, width, depth, and label from CSV
-    csv = self.edge.csv
-    md  = self.edge.md
-    row_i = md.attr_indices['USE_AS']
-    for col_i in range(config.EDGE_LAYER_COLS_BEGIN, len(self.edge.csv)):
-      use_as = md.data[row_i][col_i]
-      csv_val = csv[col_i]
-
-      min_val = md.data[md.getAttrIdx('MIN_VAL')][col_i]
-      max_val = md.data[md.getAttrIdx('MAX_VAL')][col_i]
-      if use_as == 'C':
-        start_color = config.EDGE_COLOR_GRADIENT[0]
-        end_color   = config.EDGE_COLOR_GRADIENT[1]
-        color_val   = csv_val
-        if min_val == 'NA':
-          min_val = config.NON_NUM_COLOR_MIN_VAL 
-          max_val = config.NON_NUM_COLOR_MAX_VAL 
-          color_val = abs(hash(csv_val)) % max_val
-        self.color  = calcColor(start_color, end_color, float(color_val), 
-                                float(min_val), float(max_val)) 
-      elif use_as == 'W':
-        self.width = mapRangeParam(float(csv_val), float(min_val), 
-                                   float(max_val), config.MIN_EDGE_WIDTH, 
-                                   config.MAX_EDGE_WIDTH)
-      elif use_as == 'D':
-        self.depth = float(csv_val)
-      elif use_as == 'L':
-        self.label = csv_val
-      else:
-        raise Exception('Unknown edge property specified in ' + self.edge_filename)
-
-    # Fill in unset properties with defaults.
-    # TODO: Consider following same style as node_renderer => Computing render values
-    # at render time, instead of pre-computing like this.
-    if not self.color:
-      min_val     = config.EDGE_DEFAULT_META['C'][2] 
-      max_val     = config.EDGE_DEFAULT_META['C'][3]
-      color_val   = config.EDGE_DEFAULT_VAL['C']
-      start_color = config.EDGE_COLOR_GRADIENT[0]
-      end_color   = config.EDGE_COLOR_GRADIENT[1]
-      self.color  = calcColor(start_color, end_color, float(color_val), 
-                              float(min_val), float(max_val)) 
-    if not self.width:
-      min_val    = config.EDGE_DEFAULT_META['W'][2] 
-      max_val    = config.EDGE_DEFAULT_META['W'][3]
-      color_val  = config.EDGE_DEFAULT_VAL['W']
-      self.width = mapRangeParam(float(color_val), float(min_val), 
-                                  float(max_val), config.MIN_EDGE_WIDTH, 
-                                  config.MAX_EDGE_WIDTH) 
-    if not self.depth:
-      self.depth = float(config.EDGE_DEFAULT_VAL['D'])
-    if not self.label:
-      self.depth = config.EDGE_DEFAULT_VAL['L']
-
-  def render(self, ax, node_extents):
-    """
-      Render this EdgeRenderer instance.
-
-      Args:
-        ax: A matplotlib Axes instance to add text and patches to.
-        node_extents: A lookup table to find node start and end thetas 
-    """
-    edge = self.edge
-    n1_extents = node_extents[edge.start_node.uID]
-    n2_extents = node_extents[edge.end_node.uID]
-    bez_codes = [Path.MOVETO, Path.CURVE3, Path.CURVE3]
-    n1_mid_theta = midTheta(*n1_extents)
-    n1_endpoint = polar2Cartesian(config.RING_RADIUS, n1_mid_theta)
-    n2_mid_theta = midTheta(*n2_extents)
-    n2_endpoint = polar2Cartesian(config.RING_RADIUS, n2_mid_theta)
-    bez_verts = [n1_endpoint, config.RING_ORIGIN, n2_endpoint]
-    bez_path = Path(bez_verts, bez_codes)
-    ax.add_patch(PathPatch(bez_path, 
-                           facecolor='none', 
-                           edgecolor=self.color, 
-                           lw=self.width))
-
-  def __lt__(self, other):
-    """
-      Comparator to define ordering of EdgeRenders based on their depth.
-
-      Return:
-        Boolean
-    """
-    return self.depth < other.depth
+import density
+import geometry
+from helper import mapRangeParam, mapRangeArray
+from colors import EDGE_GRADIENT, categoryValues
+
+# Draw edges above the node rings, which are patches with zorder 1
+EDGE_ZORDER = 1.5
+
+# Draw edge density images below the node rings
+DENSITY_ZORDER = 0.5
+
+def edgeValues(graph, use_as, indices):
+  """
+  Gather one render property of the given edges. The last column used as
+  use_as is read.
+
+  Args:
+    graph: A Graph instance
+    use_as: An edge USE_AS value. EG: C, W
+    indices: int array of edge indices
+  Return:
+    A tuple (array of values, PropertySpec). Values of categorical colors 
+    are hashed to the NON_NUM_COLOR range. Values are float64, except for 
+    labels.
+  """
+  spec = dict(graph.edge_md.prop_specs).get(use_as)
+  if spec is None:
+    spec = graph.edge_md.schema[use_as]
+    values = np.empty(len(indices), dtype=object if use_as == 'L' else 
+                                          np.float64)
+    values.fill(config.EDGE_DEFAULT_VAL[use_as])
+    return (values, spec)
+  column = graph.edge_props[spec.col][indices]
+  if use_as == 'L':
+    return (column, spec)
+  if use_as == 'C' and spec.categorical:
+    return (categoryValues(column), spec)
+  return (np.asarray(column, dtype=np.float64), spec)
+
+def edgeRenderValues(graph, edge_indices=None):
+  """
+  Compute the draw order, colors and widths of edges as arrays. Edges are
+  drawn by increasing depth, ties in file order.
+
+  Args:
+    graph: A Graph instance
+    edge_indices: Optional int array of the only edges to render
+  Return:
+    A tuple (int array of edge indices in draw order, float64 RGBA array of
+    shape (num edges, 4), float64 array of widths), in draw order
+  """
+  if graph.edge_md is None:
+    # A graph of nodes only, see Graph.withEdges
+    return (np.zeros(0, dtype=np.intp), np.zeros((0, 4)), np.zeros(0))
+  if edge_indices is None:
+    indices = np.arange(len(graph.edges))
+  else:
+    indices = np.asarray(edge_indices, dtype=np.intp)
+  # Zero depths and widths are replaced by defaults
+  depths = edgeValues(graph, 'D', indices)[0]
+  depths[depths == 0.0] = float(config.EDGE_DEFAULT_VAL['D'])
+  indices = indices[np.argsort(depths, kind='mergesort')]
+
+  (values, spec) = edgeValues(graph, 'C', indices)
+  colors = EDGE_GRADIENT.rgba(values, spec.min, spec.max)
+  (values, spec) = edgeValues(graph, 'W', indices)
+  widths = mapRangeArray(values, spec.min, spec.max, config.MIN_EDGE_WIDTH,
+                         config.MAX_EDGE_WIDTH)
+  (min_val, max_val) = config.EDGE_DEFAULT_META['W'][2:]
+  widths[widths == 0.0] = mapRangeParam(float(config.EDGE_DEFAULT_VAL['W']),
+                                        float(min_val), float(max_val), 
+                                        config.MIN_EDGE_WIDTH, 
+                                        config.MAX_EDGE_WIDTH)
+  return (indices, colors, widths)
+
+def renderEdges(ax, start, end, colors, widths, node_extents, bundling=None):
+  """
+  Render many edges as a single PathCollection, which costs far less than
+  one PathPatch artist per edge. Edges are drawn in the given order.
+
+  Args:
+    ax: A matplotlib Axes instance to add the collection to.
+    start: int array of the start node index of each edge, in draw order
+    end: int array of the end node index of each edge
+    colors: float64 RGBA array of edge colors, shape (num edges, 4)
+    widths: float64 array of edge widths
+    node_extents: float64 array of node start and end thetas by node index,
+      shape (num nodes, 2)
+    bundling: An optional geometry.LobeBundling routing edges through their
+      lobes
+  Return:
+    The PathCollection, None if there are no edges.
+  """
+  if not len(start):
+    return None
+  node_points = geometry.nodePoints(node_extents)
+  if bundling:
+    ctrl = bundling.controlPoints(start, end, node_points)
+  else:
+    ctrl = geometry.edgeControlPoints(start, end, node_points)
+  collection = PathCollection(geometry.controlPaths(ctrl), 
+                              facecolors='none',
+                              edgecolors=colors,
+                              linewidths=widths,
+                              zorder=EDGE_ZORDER)
+  ax.add_collection(collection, autolim=False)
+  return collection
+
+def collapseEdges(start, end, colors, widths, node_lobes):
+  """
+  Merge edges between the same pair of lobes, in either direction, into one
+  bundle. A bundle's width is the sum of its edges' widths, up to
+  config.MAX_BUNDLE_WIDTH, and its color is their width weighted mean color.
+
+  Args:
+    start: int array of the start node index of each edge
+    end: int array of the end node index of each edge
+    colors: float64 RGBA array of edge colors, shape (num edges, 4)
+    widths: float64 array of edge widths
+    node_lobes: int array of the lobe number of each node
+  Return:
+    A tuple (int array of first lobe numbers, int array of second lobe
+    numbers, float64 array of widths, float64 RGBA array of shape 
+    (num bundles, 4)), ordered by increasing width so wide bundles are drawn
+    on top.
+  """
+  (start, end) = (node_lobes[start], node_lobes[end])
+  (lobe_a, lobe_b) = (np.minimum(start, end), np.maximum(start, end))
+  num_lobes = node_lobes.max() + 1
+  (pairs, bundle_i) = np.unique(lobe_a * num_lobes + lobe_b, 
+                                return_inverse=True)
+  total = np.bincount(bundle_i, widths, len(pairs))
+  # Bundles of zero width edges get their edges' plain mean color
+  weights = np.where(total[bundle_i] > 0, widths, 1.0)
+  colors = np.column_stack([np.bincount(bundle_i, weights * colors[:, k], 
+                                        len(pairs)) for k in range(4)])
+  colors /= np.bincount(bundle_i, weights, len(pairs))[:, np.newaxis]
+  order = np.argsort(total, kind='mergesort')
+  return (pairs[order] // num_lobes, pairs[order] % num_lobes, 
+          np.minimum(total[order], config.MAX_BUNDLE_WIDTH), colors[order])
+
+def renderBundles(ax, start, end, colors, widths, bundling):
+  """
+  Render the edges between each pair of lobes as one bundle from lobe to
+  lobe, see collapseEdges. 
+
+  Args:
+    ax: A matplotlib Axes instance to add the collection to.
+    start, end, colors, widths: Edge arrays, see renderEdges
+    bundling: A geometry.LobeBundling
+  Return:
+    The PathCollection, None if there are no edges.
+  """
+  if not len(start):
+    return None
+  (lobe_a, lobe_b, widths, colors) = collapseEdges(start, end, colors, 
+                                                   widths, 
+                                                   bundling.node_lobes)
+  ctrl = bundling.lobeControlPoints(lobe_a, lobe_b)
+  collection = PathCollection(geometry.controlPaths(ctrl), 
+                              facecolors='none',
+                              edgecolors=colors,
+                              linewidths=widths,
+                              zorder=EDGE_ZORDER)
+  ax.add_collection(collection, autolim=False)
+  return collection
+
+def renderDensity(ax, start, end, widths, node_extents, bundling=None,
+                  size=config.DENSITY_SIZE):
+  """
+  Render edges as one density image under the node rings, see the density
+  module. Each edge adds density in proportion to its width.
+
+  Args:
+    ax: A matplotlib Axes instance to add the image to.
+    start: int array of the start node index of each edge
+    end: int array of the end node index of each edge
+    widths: float64 array of edge widths
+    node_extents: float64 array of node start and end thetas by node index,
+      shape (num nodes, 2)
+    bundling: An optional geometry.LobeBundling routing edges through their
+      lobes
+    size: Width and height of the image in pixels
+  Return:
+    The AxesImage
+  """
+  (start, end, widths) = density.mergeCurves(start, end, widths, 
+                                             len(node_extents))
+  node_points = geometry.nodePoints(node_extents)
+  if bundling:
+    ctrl = bundling.controlPoints(start, end, node_points)
+    verts = geometry.flattenBSpline(ctrl, config.DENSITY_SEGMENTS)
+  else:
+    ctrl = geometry.edgeControlPoints(start, end, node_points)
+    verts = geometry.flattenQuadratic(ctrl, config.DENSITY_SEGMENTS)
+  (x, y) = config.RING_ORIGIN
+  r = config.RING_RADIUS
+  extent = (x - r, x + r, y - r, y + r)
+  buf = density.accumulate(verts, widths, size, extent)
+  # Nothing is drawn below the image, so it is blended over the background
+  # up front. Raster backends resample opaque images more faithfully.
+  image = density.composite(density.toneMap(buf, EDGE_GRADIENT), 
+                            ax.get_facecolor())
+  return ax.imshow(image, origin='lower', extent=extent, 
+                   interpolation='bilinear', zorder=DENSITY_ZORDER)
@@ -0,0 +1,123 @@
+"""
+  Read plain edge lists without metadata rows. Each row holds a source node
+  ID, a target node ID and any number of property values:
+
+    source,target,weight[,...]
+
+  What each property column is used as comes from the command line instead
+  of a USE_AS row, and MIN_VAL and MAX_VAL are computed from the data as it
+  is loaded, so producers can stream edges straight into the renderer.
+"""
+# Library Imports
+from itertools import chain
+import numpy as np
+
+# Local Module Imports
+import config
+from metadata import EdgeMetadata
+from table import Table, parseTable, isNumeric
+from table import FLOAT_COL, INDEX_COL, STRING_COL, SKIP_COL
+from reader import InputReader
+
+# Property columns are used as both edge color and width by default
+DEFAULT_ROLES = 'C+W'
+
+# Role of property columns that are not used
+IGNORE_ROLE = '-'
+
+def parseRoles(roles):
+  """
+  Parse the USE_AS roles of the property columns of an edge list.
+
+  Args:
+    roles: Comma separated roles, one per property column. A role is one or
+      more edge USE_AS keys joined by '+', or '-' to ignore the column.
+      EG: 'C+W,-,L'
+  Return:
+    A list with a tuple of USE_AS keys per property column
+  """
+  parsed = []
+  used = set()
+  for role in roles.split(','):
+    role = role.strip()
+    keys = () if role == IGNORE_ROLE else tuple(role.split('+'))
+    for key in keys:
+      if key not in config.EDGE_USE_AS_KEYS:
+        raise ValueError('Unknown edge USE_AS key: ' + key)
+      if key in used:
+        raise ValueError('Edge USE_AS key used more than once: ' + key)
+      used.add(key)
+    parsed.append(keys)
+  return parsed
+
+def roleKind(keys, value):
+  """
+  Decide how a property column is stored from its roles and first value.
+  """
+  if not keys:
+    return SKIP_COL
+  if 'L' in keys or ('C' in keys and not isNumeric(value)):
+    return STRING_COL
+  return FLOAT_COL
+
+def isHeader(row, roles):
+  """
+  Decide whether the first row of an edge list is a header. Only width and
+  depth values must be numbers, so a header is recognized by non-numeric
+  cells in those columns. Rows with unknown node IDs are data, and fail to
+  parse.
+  """
+  cells = [value for keys, value in zip(roles, row[2:])
+           if 'W' in keys or 'D' in keys]
+  return bool(cells) and not any(isNumeric(value) for value in cells)
+
+def loadEdgeList(edge_filename, node_index, roles=DEFAULT_ROLES):
+  """
+  Read a headerless edge list straight into an edge table. A first row
+  whose width and depth cells aren't numbers is taken as a header naming
+  the columns. Blank rows are skipped.
+
+  Args:
+    edge_filename: The edge list file name, optionally compressed. '-' for
+      stdin.
+    node_index: A dict mapping node IDs to node table row indices
+    roles: USE_AS roles of the property columns, see parseRoles
+  Return:
+    A tuple (EdgeMetadata, Table) laid out like a standard edge file with
+    Id, Node1 and Node2 columns followed by one column per property role.
+  """
+  roles = parseRoles(roles)
+  with InputReader(edge_filename, 0) as r:
+    rows = (row for row in chain(r.md_rows, r.rows()) if row)
+    first = next(rows, None)
+    names = ['Property' + str(i + 1) for i in range(len(roles))]
+    if first and isHeader(first, roles):
+      names = first[2:2 + len(roles)] + names[len(first) - 2:]
+      first = next(rows, None)
+    if first is None:
+      first = ['', ''] + [''] * len(roles)
+    else:
+      rows = chain([first], rows)
+    if len(first) < 2 + len(roles):
+      raise ValueError('Edge list %s has fewer property columns than roles' %
+                       edge_filename)
+    kinds = [INDEX_COL, INDEX_COL] + [roleKind(keys, first[2 + i])
+                                      for i, keys in enumerate(roles)]
+    table = parseTable(rows, kinds, node_index)
+
+  columns = [None, table.column(0), table.column(1)]
+  md_rows = [['Id', 'Node1', 'Node2'], ['MIN_VAL', 'NA', 'NA'],
+             ['MAX_VAL', 'NA', 'NA'], ['USE_AS', 'S', 'E']]
+  for i, keys in enumerate(roles):
+    col = table.column(2 + i)
+    min_val = max_val = 'NA'
+    if kinds[2 + i] == FLOAT_COL:
+      (min_val, max_val) = (str(col.min()), str(col.max())) if len(col) \
+                           else ('0.0', '1.0')
+    for key in keys:
+      # Property names must be unique, also when a column has several roles
+      name = names[i] if len(keys) == 1 else names[i] + '_' + key
+      columns.append(col)
+      for md_row, value in zip(md_rows, (name, min_val, max_val, key)):
+        md_row.append(value)
+  return (EdgeMetadata.fromRows(md_rows, 'Id'), Table(columns))
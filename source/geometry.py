@@ -0,0 +1,222 @@
+"""
+  Vectorized edge geometry.
+
+  Every edge is drawn as a quadratic Bezier curve from its start node's mid
+  theta on the ring, pulled toward config.RING_ORIGIN, to its end node's mid
+  theta. Node endpoints are computed once per node and gathered per edge, so
+  the control points of all edges come from a few array operations.
+
+  Bundled edges instead follow a quadratic B-spline through the lobe
+  hierarchy (node, lobe anchor, origin, lobe anchor, node), so edges between
+  the same lobes run together.
+"""
+# Library Imports
+import numpy as np
+from matplotlib.path import Path
+
+# Local Module Imports
+import config
+
+# Path codes of a quadratic Bezier curve
+QUAD_CODES = np.array([Path.MOVETO, Path.CURVE3, Path.CURVE3],
+                      dtype=Path.code_type)
+
+def nodePoints(node_extents, radius=config.RING_RADIUS):
+  """
+  Compute the point of each node on the ring, at its mid theta.
+
+  Args:
+    node_extents: float64 array of node start and end thetas by node index,
+      shape (num nodes, 2)
+    radius: Ring radius
+  Return:
+    A float64 array of (x, y) points by node index, shape (num nodes, 2)
+  """
+  mid_thetas = np.radians(node_extents.sum(axis=1) / 2)
+  return radius * np.column_stack((np.cos(mid_thetas), np.sin(mid_thetas)))
+
+def edgeControlPoints(start, end, node_points):
+  """
+  Compute the control points of the quadratic Bezier curve of each edge.
+
+  Args:
+    start: int array of the start node index of each edge
+    end: int array of the end node index of each edge
+    node_points: float64 array of node points by node index, eg. from
+      nodePoints
+  Return:
+    A float64 array of shape (num edges, 3, 2). Each edge's control points
+    are its start node's point, config.RING_ORIGIN and its end node's point.
+  """
+  ctrl = np.empty((len(start), 3, 2))
+  ctrl[:, 0] = node_points[start]
+  ctrl[:, 1] = config.RING_ORIGIN
+  ctrl[:, 2] = node_points[end]
+  return ctrl
+
+def flattenQuadratic(ctrl, num_segs):
+  """
+  Approximate quadratic Bezier curves by polylines.
+
+  Args:
+    ctrl: float64 array of control points, shape (num curves, 3, 2)
+    num_segs: Number of line segments per curve
+  Return:
+    A float64 array of polyline vertices, shape (num curves, num_segs + 1, 2)
+  """
+  t = np.linspace(0.0, 1.0, num_segs + 1)[:, np.newaxis]
+  # Bernstein basis of each sample, shape (num_segs + 1, 3)
+  basis = np.hstack(((1 - t) ** 2, 2 * (1 - t) * t, t ** 2))
+  return np.einsum('sk,nkd->nsd', basis, ctrl)
+
+def curvePaths(verts, codes):
+  """
+  Build one Path per curve, all sharing the same codes.
+
+  Args:
+    verts: float64 array of vertices, shape (num curves, verts per curve, 2)
+    codes: Path codes of one curve, or None for polylines
+  Return:
+    A list of Paths
+  """
+  return [Path(v, codes) for v in verts]
+
+def bsplineVerts(ctrl):
+  """
+  Convert clamped uniform quadratic B-splines to the vertices of quadratic
+  Bezier paths. Each inner control point becomes a Bezier control point,
+  joined by the midpoints between consecutive inner control points.
+
+  Args:
+    ctrl: float64 array of control points, shape (num curves, k, 2), k >= 3
+  Return:
+    A float64 array of Bezier vertices, shape (num curves, 2 * k - 3, 2),
+    for use with bsplineCodes(k)
+  """
+  k = ctrl.shape[1]
+  verts = np.empty((len(ctrl), 2 * k - 3, 2))
+  verts[:, 0] = ctrl[:, 0]
+  verts[:, 1:-1:2] = ctrl[:, 1:-1]
+  verts[:, 2:-1:2] = (ctrl[:, 1:-2] + ctrl[:, 2:-1]) / 2
+  verts[:, -1] = ctrl[:, -1]
+  return verts
+
+def bsplineCodes(k):
+  """
+  Return the Path codes of a B-spline of k control points, see bsplineVerts.
+  """
+  codes = np.empty(2 * k - 3, dtype=Path.code_type)
+  codes.fill(Path.CURVE3)
+  codes[0] = Path.MOVETO
+  return codes
+
+def flattenBSpline(ctrl, num_segs):
+  """
+  Approximate clamped quadratic B-splines by polylines.
+
+  Args:
+    ctrl: float64 array of control points, shape (num curves, k, 2)
+    num_segs: Number of line segments per Bezier piece
+  Return:
+    A float64 array of polyline vertices, shape (num curves, 
+    (k - 2) * num_segs + 1, 2)
+  """
+  verts = bsplineVerts(ctrl)
+  num_pieces = ctrl.shape[1] - 2
+  # Consecutive pieces share their end vertex
+  idx = 2 * np.arange(num_pieces)[:, np.newaxis] + np.arange(3)
+  pieces = verts[:, idx].reshape(-1, 3, 2)
+  flat = flattenQuadratic(pieces, num_segs).reshape(len(ctrl), num_pieces, 
+                                                    num_segs + 1, 2)
+  return np.concatenate((flat[:, :, :-1].reshape(len(ctrl), -1, 2), 
+                         flat[:, -1:, -1]), axis=1)
+
+def controlPaths(ctrl):
+  """
+  Build the Paths of curves from their control points: quadratic Beziers for
+  3 control points, clamped quadratic B-splines for more.
+
+  Args:
+    ctrl: float64 array of control points, shape (num curves, k, 2)
+  Return:
+    A list of Paths
+  """
+  k = ctrl.shape[1]
+  if k == 3:
+    return curvePaths(ctrl, QUAD_CODES)
+  return curvePaths(bsplineVerts(ctrl), bsplineCodes(k))
+
+class LobeBundling(object):
+  """
+  Routes edges through the lobe hierarchy, with a bundling strength beta.
+
+  Class usage example:
+    bundling = LobeBundling(g.node_lobe, lobe_extents)
+    ctrl = bundling.controlPoints(g.edge_start, g.edge_end, 
+                                  nodePoints(node_extents))
+    paths = controlPaths(ctrl)
+  """
+  __slots__ = ('node_lobes', 'lobe_points', 'anchor_points', 'beta')
+
+  def __init__(self, node_lobes, lobe_extents, beta=config.BUNDLE_STRENGTH):
+    """
+    Args:
+      node_lobes: int array of the lobe number of each node
+      lobe_extents: float64 array of lobe start and end thetas by lobe 
+        number, shape (num lobes, 2)
+      beta: Bundling strength in [0, 1]
+    """
+    if not 0.0 <= beta <= 1.0:
+      raise ValueError('Bundling strength must be in [0, 1]: ' + str(beta))
+    self.node_lobes = np.asarray(node_lobes, dtype=np.intp)
+    self.lobe_points = nodePoints(lobe_extents)
+    self.anchor_points = nodePoints(lobe_extents, config.RING_RADIUS * 
+                                    config.BUNDLE_ANCHOR_RADIUS)
+    self.beta = beta
+
+  def route(self, start_points, end_points, start_lobes, end_lobes):
+    """
+    Compute the straightened B-spline control points of curves between
+    points in the given lobes. Curves within one lobe turn at its anchor
+    instead of the origin.
+
+    Return:
+      A float64 array of shape (num curves, 5, 2)
+    """
+    ctrl = np.empty((len(start_points), 5, 2))
+    ctrl[:, 0] = start_points
+    ctrl[:, 1] = self.anchor_points[start_lobes]
+    ctrl[:, 2] = config.RING_ORIGIN
+    ctrl[:, 3] = self.anchor_points[end_lobes]
+    ctrl[:, 4] = end_points
+    same = start_lobes == end_lobes
+    ctrl[same, 2] = ctrl[same, 1]
+    # Pull control points toward the straight line between the endpoints
+    t = np.linspace(0.0, 1.0, 5)[:, np.newaxis]
+    line = ctrl[:, :1] + t * (ctrl[:, 4:] - ctrl[:, :1])
+    return self.beta * ctrl + (1 - self.beta) * line
+
+  def controlPoints(self, start, end, node_points):
+    """
+    Compute the bundled control points of edges between nodes.
+
+    Args:
+      start: int array of the start node index of each edge
+      end: int array of the end node index of each edge
+      node_points: float64 array of node points by node index
+    Return:
+      A float64 array of shape (num edges, 5, 2)
+    """
+    return self.route(node_points[start], node_points[end], 
+                      self.node_lobes[start], self.node_lobes[end])
+
+  def lobeControlPoints(self, start_lobes, end_lobes):
+    """
+    Compute the control points of bundles from lobe to lobe, which end at
+    the lobes' mid thetas on the ring.
+
+    Return:
+      A float64 array of shape (num bundles, 5, 2)
+    """
+    return self.route(self.lobe_points[start_lobes], 
+                      self.lobe_points[end_lobes], start_lobes, end_lobes)
@@ -1,77 +1,299 @@
 """
   Maintain model data about all Lobes, Nodes, and Edges involved in this 
-  visualization. Handles parsing input files and constructing those entities.
+  visualization. Handles parsing input files into columnar tables and 
+  constructing those entities as views over the table rows.
 """
 # Library Imports
-import csv
-import bisect
+import copy
+import numpy as np
 
 # Local Module Imports
 import config 
 from lobe import Lobe
 from node import Node
-from edge import Edge
+from edge import EdgeList
+from table import parseTable, columnKinds
+from threshold import filterRows, filterTable
+from reader import openInput
+from parallel import parseParallel
+import layout
+from csr import CSRIndex
+
+def parseNodeFile(node_input, node_md):
+  """
+  Parse the data rows of a CSV node file into a Table.
+
+  Args:
+    node_input: The file name of the CSV node input file, or an InputReader
+      for it
+    node_md: A NodeMetadata instance for that file
+  Return:
+    A Table instance
+  """
+  with openInput(node_input, config.NUM_NODE_METADATA_ROWS) as reader:
+    return parseTable(reader.rows(), columnKinds(node_md, True))
+
+def parseEdgeFile(edge_input, edge_md, node_index, edge_thresh=None, jobs=1):
+  """
+  Parse the data rows of a CSV edge file into a Table in a single pass. Edges
+  outside the weight range threshold are dropped as they are read, and the
+  top percent threshold is applied once they are all parsed. Uncompressed 
+  regular files may be parsed by several processes at once.
+
+  Args:
+    edge_input: The file name of the CSV edge input file, or an InputReader
+      for it
+    edge_md: An EdgeMetadata instance for that file
+    node_index: A dict mapping node IDs to node table row indices
+    edge_thresh: Optional tuple (percentage, use style code)
+    jobs: Number of worker processes. 0 or None uses every CPU.
+  Return:
+    A Table instance
+  """
+  with openInput(edge_input, config.NUM_EDGE_METADATA_ROWS) as reader:
+    kinds = columnKinds(edge_md, False)
+    if jobs != 1 and isinstance(reader.file, file):
+      return parseParallel(reader, kinds, node_index, edge_md, edge_thresh, 
+                           jobs)
+    if edge_thresh and edge_thresh[1] == config.EDGE_THRESH_2:
+      # The top t percent depends on the number of rows, so threshold after
+      # parsing instead of reading the file twice
+      table = parseTable(reader.rows(), kinds, node_index)
+      return filterTable(table, edge_md, edge_thresh)
+    rows = filterRows(reader.rows(), edge_md, edge_thresh)
+    return parseTable(rows, kinds, node_index)
+
+def nodeIndex(node_table, node_md):
+  """
+  Return a dict mapping node IDs to their row index in node_table.
+  """
+  ids = node_table.column(node_md.getPropIdx('Id'))
+  return dict((node_id, i) for i, node_id in enumerate(ids))
 
 class Graph:
-  def __init__(self, node_md, edge_md, node_filename, edge_filename):
+  def __init__(self, node_md, edge_md, node_filename, edge_filename,
+               edge_thresh=None, node_table=None, edge_table=None, 
+               edge_order=None, jobs=1):
     """
     Construct a graph object from the given input files.
 
     Args:
       node_md: A Metadata instance populated with node metadata
-      edge_md: A Metadata instance populated with edge metadata
-      node_filename: The file name of the CSV node input file
-      edge_filename: The file name of the CSV edge input file
+      edge_md: A Metadata instance populated with edge metadata, or None to
+        only read the nodes. See withEdges.
+      node_filename: The file name of the CSV node input file, or an 
+        InputReader for it
+      edge_filename: The file name of the CSV edge input file, or an 
+        InputReader for it
+      edge_thresh: Optional tuple (percentage, use style code) defining an 
+        edge weight threshold. Edges failing it are dropped while reading.
+      node_table: Optional pre-parsed node Table. Skips parsing node_filename.
+      edge_table: Optional pre-parsed edge Table. Skips parsing edge_filename.
+      edge_order: Optional edge_table row indices sorted by descending weight.
+        Speeds up thresholding a pre-parsed edge_table.
+      jobs: Number of processes parsing the edge file. 0 or None uses every
+        CPU.
     """
     self.node_md = node_md
     self.edge_md = edge_md
-    self.node_filename = node_filename
-    self.edge_filename = edge_filename
+    self.node_filename = getattr(node_filename, 'filename', node_filename)
+    self.edge_filename = getattr(edge_filename, 'filename', edge_filename)
 
     # Declare graph state attributes. Will be populated during CSV parsing.
     self.lobes = {}
     self.sorted_lobes = [] # Sorted 
     self.nodes = {} 
+    self.node_list = []    # Ordered by node index
     self.edges = []        # Unsorted 
     self.total_wt = 0.0
 
+    """ Columnar model data. Nodes are identified by their row index in 
+    node_table; node_index maps node IDs to those indices. node_props and 
+    edge_props map the CSV column index of each USE_AS property to its array
+    of values (float64, or object for string valued properties).          """
+    self.node_table = None
+    self.edge_table = None
+    self.node_index = {}
+    self.node_pos   = None # float64 array, shape (num nodes, 3)
+    self.node_props = {}
+    self.edge_start = None # int32 array of node indices
+    self.edge_end   = None # int32 array of node indices
+    self.edge_props = {}
+    self.csr_index  = None # CSRIndex, built on first use by csr()
+
+    """ Layout arrays. node_order lists node indices sorted by lobe in ring
+    order, then by theta within each lobe. lobe_wts and lobe_centers are 
+    indexed by position in sorted_lobes.                                 """
+    self.node_theta   = None # float64 array of polar thetas in degrees
+    self.node_weight  = None # float64 array
+    self.node_lobe    = None # int array of positions in sorted_lobes
+    self.node_order   = None # int array of node indices
+    self.lobe_wts     = None # float64 array
+    self.lobe_centers = None # float64 array, shape (num lobes, 3)
+
     # Parse Node CSV for data and generate objects
-    with open(node_filename, "rb") as node_file:
-      dialect = csv.Sniffer().sniff(node_file.read(1024), delimiters=",\t")
-      node_file.seek(0)
-      reader = csv.reader(node_file, dialect)
-      for row in reader:
-        if reader.line_num > config.NUM_NODE_METADATA_ROWS + 1:
-          node_id   = row[self.node_md.getPropIdx('Id')]
-          x_val     = float(row[self.node_md.getPropIdx('X')])
-          lobe_name = row[self.node_md.getPropIdx('Lobe')]
-          lobe_id   = (lobe_name + '_L') if x_val <= 0 else (lobe_name + '_R')
-          if lobe_id not in self.lobes: 
-            self.lobes[lobe_id] = Lobe(lobe_id, lobe_name)
-          # Create new Node object and add it to top level lookup
-          new_node = Node(row, self.lobes[lobe_id], self.node_md)
-          self.nodes[node_id] = new_node
-          # Map from lobe to node for reverse lookup
-          self.lobes[lobe_id].addNode(new_node) 
-
-    # Calculate total graph weight 
-    for node in self.nodes.values():
-      self.total_wt += node.weight()
-
-    # Calculate sorted lobe list
-    for lobe in self.lobes.values():
-      bisect.insort(self.sorted_lobes, lobe)
-
-    # Parse Edge CSV for data
-    with open(edge_filename, "rb") as edge_file:
-      dialect = csv.Sniffer().sniff(edge_file.read(1024), delimiters=",\t")
-      edge_file.seek(0)
-      reader = csv.reader(edge_file, dialect)
-      for row in reader:
-        if reader.line_num > config.NUM_EDGE_METADATA_ROWS + 1:
-          # Find node endpoints
-          n1_key = row[self.edge_md.getPropIdx("Node1")]
-          n2_key = row[self.edge_md.getPropIdx("Node2")]
-          node1  = self.nodes[n1_key]
-          node2  = self.nodes[n2_key]
-          self.edges.append(Edge(row, node1, node2, self.edge_md))
+    if node_table is None:
+      node_table = parseNodeFile(node_filename, node_md)
+    self.setNodeTable(node_table)
+
+    # Parse Edge CSV for data, keeping only edges that pass edge_thresh
+    if edge_md is None:
+      return
+    if edge_table is None:
+      edge_table = parseEdgeFile(edge_filename, edge_md, self.node_index, 
+                                 edge_thresh, jobs)
+    else:
+      edge_table = filterTable(edge_table, edge_md, edge_thresh, edge_order)
+    self.setEdgeTable(edge_table)
+
+  def withEdges(self, edge_md, edge_filename, edge_thresh=None, 
+                edge_table=None, edge_order=None, jobs=1):
+    """
+    Construct a graph of this graph's nodes and another edge file. The node
+    table, Node views, lobes and layout arrays are shared, not copied.
+
+    Args:
+      See the constructor.
+    Return:
+      A new Graph instance
+    """
+    g = copy.copy(self)
+    g.edge_md = edge_md
+    g.edge_filename = getattr(edge_filename, 'filename', edge_filename)
+    if edge_table is None:
+      edge_table = parseEdgeFile(edge_filename, edge_md, self.node_index, 
+                                 edge_thresh, jobs)
+    else:
+      edge_table = filterTable(edge_table, edge_md, edge_thresh, edge_order)
+    g.setEdgeTable(edge_table)
+    return g
+
+  def setNodeTable(self, table):
+    """
+    Populate node arrays, lobes and Node views from a columnar node table.
+
+    Args:
+      table: A Table of node data rows
+    """
+    md = self.node_md
+    self.node_table = table
+    self.node_index = nodeIndex(table, md)
+    self.node_pos = np.column_stack([table.column(md.getPropIdx(k)) 
+                                     for k in ('X', 'Y', 'Z')])
+    self.node_props = dict((col_i, table.column(col_i)) for col_i in 
+                           range(config.NODE_LAYER_COLS_BEGIN, len(md.data[0])))
+
+    # Assign nodes to hemisphere specific lobes
+    lobe_names = table.column(md.getPropIdx('Lobe'))
+    lobe_ids = [(name + '_L') if x_val <= 0 else (name + '_R') 
+                for name, x_val in zip(lobe_names, self.node_pos[:, 0])]
+    (codes, code_ids) = layout.lobeCodes(lobe_ids)
+    for lobe_id, i in zip(code_ids, np.unique(codes, return_index=True)[1]):
+      self.lobes[lobe_id] = Lobe(lobe_id, lobe_names[i])
+
+    # Create Node views and add them to top level lookup
+    for i in xrange(len(table)):
+      new_node = Node(table.row(i), self.lobes[lobe_ids[i]], md, i)
+      self.nodes[new_node.uID] = new_node
+      self.node_list.append(new_node)
+
+    # Sort nodes by theta within lobes, and lobes by their center of mass
+    self.node_theta  = layout.nodeThetas(self.node_pos)
+    self.node_weight = layout.nodeWeights(table, md)
+    self.total_wt    = float(self.node_weight.sum())
+    order = layout.sortNodes(codes, self.node_theta)
+    (centers, lobe_wts) = layout.lobeCenters(self.node_pos, self.node_weight,
+                                             codes, len(code_ids), order)
+    lobe_order = layout.sortLobes(centers)
+    self.sorted_lobes = [self.lobes[code_ids[c]] for c in lobe_order]
+    self.lobe_wts     = lobe_wts[lobe_order]
+    self.lobe_centers = centers[lobe_order]
+
+    # Renumber lobes by ring position, and order nodes accordingly
+    ring_pos = np.empty(len(lobe_order), dtype=np.intp)
+    ring_pos[lobe_order] = np.arange(len(lobe_order))
+    self.node_lobe  = ring_pos[codes]
+    self.node_order = layout.sortNodes(self.node_lobe, self.node_theta)
+    for i in self.node_order:
+      # Map from lobe to node for reverse lookup, already in sorted order
+      node = self.node_list[i]
+      node.lobe.nodes.append(node)
+
+  def setEdgeTable(self, table):
+    """
+    Populate edge arrays and Edge views from a columnar edge table.
+
+    Args:
+      table: A Table of edge data rows
+    """
+    md = self.edge_md
+    self.edge_table = table
+    self.edge_start = table.column(md.getPropIdx('Node1'))
+    self.edge_end   = table.column(md.getPropIdx('Node2'))
+    self.edge_props = dict((col_i, table.column(col_i)) for col_i in 
+                           range(config.EDGE_LAYER_COLS_BEGIN, len(md.data[0])))
+    self.edges = EdgeList(table, self.edge_start, self.edge_end, 
+                          self.node_list, md)
+    self.csr_index = None
+
+  def csr(self):
+    """
+    Return a CSRIndex of this graph's edges, building it on first use. Edge
+    strengths are summed from the edge weight (W) property, if there is one.
+    """
+    if self.csr_index is None:
+      w_col = self.edge_md.schema['W'].col
+      weights = self.edge_props[w_col] if w_col is not None else None
+      self.csr_index = CSRIndex(self.edge_start, self.edge_end, 
+                                len(self.node_list), weights)
+    return self.csr_index
+
+  def lobeNodes(self, lobe_id):
+    """
+    Return the node indices of a lobe, sorted by theta.
+
+    Args:
+      lobe_id: A lobe uID, eg. 'Frontal_L'
+    """
+    return np.array([node.idx for node in self.lobes[lobe_id].nodes], 
+                    dtype=np.intp)
+
+  def lobeEdges(self, lobe_id, within=False):
+    """
+    Return the sorted indices of the edges touching a lobe.
+
+    Args:
+      lobe_id: A lobe uID, eg. 'Frontal_L'
+      within: If True, only return edges with both endpoints in the lobe
+    """
+    return self.csr().edgesOfNodes(self.lobeNodes(lobe_id), within)
+
+  def roiEdges(self, lobe_ids=(), node_ids=(), within=False):
+    """
+    Select the edges of a region of interest made of lobes and nodes.
+
+    Args:
+      lobe_ids: Lobe uIDs (eg. 'Frontal_L'), or lobe names (eg. 'Frontal')
+        selecting the lobe in both hemispheres
+      node_ids: Node IDs
+      within: If True, only select edges with both endpoints in the region
+    Return:
+      A sorted int array of edge indices
+    """
+    nodes = [self.nodes[node_id].idx for node_id in node_ids]
+    for lobe_id in lobe_ids:
+      matches = [lobe for lobe in self.sorted_lobes 
+                 if lobe_id in (lobe.uID, lobe.name)]
+      if not matches:
+        raise KeyError(lobe_id)
+      for lobe in matches:
+        nodes.extend(node.idx for node in lobe.nodes)
+    return self.csr().edgesOfNodes(np.unique(np.array(nodes, dtype=np.intp)),
+                                   within)
+
+  def lobeDegree(self):
+    """
+    Return an int array with the number of edge endpoints in each lobe, in 
+    sorted_lobes order.
+    """
+    return self.csr().groupDegree(self.node_lobe, len(self.sorted_lobes))
@@ -6,8 +6,9 @@
 # Library Imports
 import bisect
 import csv
+import os
 import matplotlib
-matplotlib.use("PDF")
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import matplotlib.axes as axes
 from matplotlib.colors import hex2color, LinearSegmentedColormap, Normalize
@@ -16,7 +17,8 @@ import matplotlib.colorbar as colorbar
 from matplotlib.patches import Circle, Wedge, Polygon, FancyBboxPatch, PathPatch, Rectangle
 from matplotlib.path import Path
 from matplotlib.text import _get_textbox
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PatchCollection, PathCollection, \
+                                   LineCollection
 from matplotlib.lines import Line2D
 from math import degrees, radians, pi, cos, sin, floor, ceil
 import numpy as np
@@ -24,14 +26,41 @@ import numpy as np
 # Local Module Imports
 import config
 from helper import polar2Cartesian, cartesian2Polar, midTheta, theta2Quadrant, \
-                   minNetDiff, topRange, mapRangeParam, findRenderer, \
-                   angularExtentsOverlap
-from edge_renderer import EdgeRenderer
-from node_renderer import NodeRenderer
+                   minNetDiff, topRange, mapRangeParam
+from edge_renderer import edgeRenderValues, renderEdges, renderBundles, \
+                          renderDensity
+from node_renderer import NodeRenderer, renderRings, layerValues, wedgePaths
+import layout
+from geometry import LobeBundling
+from cache import fileDigest
+from labels import textSize, dataPerPoint, tangentRotations, labelLevels, \
+                   decimateLabels, radialRotations
+
+def outputFormat(filename, fmt=None):
+  """
+  Decide the output file format.
+
+  Args:
+    filename: The output file name
+    fmt: An explicit format, one of config.OUTPUT_FORMATS, or None
+  Return:
+    fmt if given, else the format named by filename's extension, else
+    config.DEFAULT_OUTPUT_FORMAT
+  """
+  if fmt:
+    if fmt not in config.OUTPUT_FORMATS:
+      raise ValueError('Unknown output format: ' + fmt)
+    return fmt
+  ext = os.path.splitext(filename)[1][1:].lower()
+  return ext if ext in config.OUTPUT_FORMATS else config.DEFAULT_OUTPUT_FORMAT
+
+# Label marking the non-text artists of legend boxes. Legends always stay
+# vector, whatever the rasterization policy.
+LEGEND_LABEL = '_legend'
 
 class GraphRenderer:
   
-  def __init__(self, graph, lobe_filename):
+  def __init__(self, graph, lobe_filename, edge_indices=None):
     """
     Constructor
 
@@ -39,20 +68,22 @@ class GraphRenderer:
       graph: A Graph instance.
       lobe_filename: Filename of lobe file explicitly setting lobe extents. 
         None if no lobe file specified.
+      edge_indices: Optional indices of the only edges to render, eg. from
+        Graph.roiEdges. The ring layout always covers every node.
     """
     self.graph = graph
+    self.lobe_filename = lobe_filename
     self.node_renderers = [] # Unsorted
-    self.edge_renderers = [] # Sorted by depth
 
     """ Lookup table for start and end thetas of lobes. 
         {(Lobe Name): (start_theta, end_theta)}         """
     self.lobe_extents = {}
 
-    """ Lookup table for angular coords of nodes. For use by EdgeRenderers. 
+    """ Lookup table for angular coords of nodes.
         {(node name): theta}                                                """
     self.node_extents = {}
 
-    self.fig = plt.figure(figsize=(8,8))
+    self.fig = plt.figure(figsize=(8,8), dpi=config.FIGURE_DPI)
     self.ax = self.fig.add_axes([0,0,1,1])
     self.ax.set_xlim(-1.5, 1.5)
     self.ax.set_ylim(-1.5, 1.5)
@@ -71,190 +102,191 @@ class GraphRenderer:
           self.lobe_extents[lobe_name] = [start_extent, end_extent]
 
     # CASE II: No Lobe File Specified - Layout based on node widths (weights)
+    # Lobe extents are shifted to more accurately reflect their physical 
+    # locations.
     else:
-      # Angular gap between lobes
-      gap_wdth = config.TOTAL_GAP_DEGREES / len(self.graph.lobes)
-
-      # Calculate Lobe extents
-      extent_centers = []
-      start_theta    = 0.0
-      curr_theta     = start_theta
-      for lobe in self.graph.sorted_lobes:
-        # Calculate thetas counterclockwise from starting point curr_theta
-        assert(len(lobe.nodes) > 0)
-        lobe_wt = sum([n.weight() for n in lobe.nodes])
-        lobe_wdth = (360.0 - config.TOTAL_GAP_DEGREES) * (lobe_wt / self.graph.total_wt)
-        self.lobe_extents[lobe.uID] = [curr_theta, curr_theta + lobe_wdth]
-        extent_centers.append(midTheta(curr_theta, curr_theta + lobe_wdth))
-        curr_theta += lobe_wdth + gap_wdth
-      assert(abs(curr_theta - 360.0) < 0.00001)
-
-      # Calculate list of lobe centers of mass
-      mass_centers = []
-      for l in self.graph.sorted_lobes:
-        center = l.centerOfMass()
-        (r, theta) = cartesian2Polar(center[0], center[1])
-        mass_centers.append(theta)
-
-      # Shift lobe extents to more accurately reflect their physical locations
-      self.offset = minNetDiff(mass_centers, extent_centers)
-      for k in self.lobe_extents.keys():
-        lex = self.lobe_extents[k]
-        lex[0] += self.offset
-        lex[1] += self.offset
+      (extents, self.offset) = layout.lobeExtents(
+        self.graph.lobe_wts, self.graph.total_wt,
+        layout.nodeThetas(self.graph.lobe_centers))
+      for lobe, lex in zip(self.graph.sorted_lobes, extents.tolist()):
+        self.lobe_extents[lobe.uID] = lex
 
     # Instantiate a RenderNode for each Node in self.graph.
-    for lobe in self.graph.sorted_lobes:
-      lex = self.lobe_extents[lobe.uID]
-      lobe_start = lex[0]
-      curr_theta = lex[0]
-      for node in lobe.nodes:
-        node_wt   = node.weight()
-        node_wdth = (lex[1] - lex[0]) * (node_wt / lobe.weight())
-        node_start = curr_theta
-        curr_theta += node_wdth
-        node_end   = curr_theta
-        self.node_renderers.append(NodeRenderer(node, node_start, node_end))
-        self.node_extents[node.uID] = (node_start, node_end) 
-      assert(abs(curr_theta - lex[1]) < 0.00001)
-
-    # Instantiate a RenderEdge for each Edge in self.graph
-    for edge in self.graph.edges:
-      bisect.insort(self.edge_renderers, EdgeRenderer(edge))
-
-  def render(self, out_filename, edge_thresh):
+    g = self.graph
+    self.lobe_extent_array = np.array([self.lobe_extents[lobe.uID] 
+                                       for lobe in g.sorted_lobes], 
+                                      dtype=np.float64)
+    self.node_extent_array = layout.nodeExtents(self.lobe_extent_array, 
+                                                g.lobe_wts, g.node_weight, 
+                                                g.node_lobe, g.node_order)
+    node_extents = self.node_extent_array.tolist()
+    for i in g.node_order:
+      node = g.node_list[i]
+      (node_start, node_end) = node_extents[i]
+      self.node_renderers.append(NodeRenderer(node, node_start, node_end))
+      self.node_extents[node.uID] = (node_start, node_end) 
+
+    # Edge indices, colors and widths, sorted by depth
+    (self.edge_order, self.edge_colors, self.edge_widths) = \
+      edgeRenderValues(self.graph, edge_indices)
+
+  def render(self, out_filename, edge_thresh, bundle=None, collapse=False,
+             density=None, rasterize='none', dpi=None, fmt=None, cache=None):
     """
-    Render this instance to a PDF.
+    Render this instance to a PDF, SVG or PNG file.
 
     Args:
-      out_filename: A string filename to save this PDF as.
+      out_filename: A string filename to save this figure as.
       edge_thresh: A tuple defining an edge weight threshold, in the following 
         form, (percentage, use style code)
+      bundle: If given, bundle edges through their lobes with this bundling 
+        strength in [0, 1]
+      collapse: If True, draw one bundle per pair of lobes instead of the 
+        edges between them. Implies bundling.
+      density: If given, draw the edges as one density image of this many 
+        pixels across, instead of one curve per edge
+      rasterize: A config.RASTER_POLICIES key naming the layers drawn as 
+        images in PDF and SVG output
+      dpi: Resolution of PNG output and of rasterized layers. Defaults to 
+        config.FIGURE_DPI for PNG output and config.RASTER_DPI otherwise.
+      fmt: One of config.OUTPUT_FORMATS. Defaults to the format named by 
+        out_filename's extension.
+      cache: Optional GraphCache to load the node rings, labels and ring 
+        legends from, or store them in. See renderNodeLayers.
     """
+    fmt = outputFormat(out_filename, fmt)
+    raster_layers = config.RASTER_POLICIES[rasterize]
 
-    # Render each NodeRenderer
-    for nr in self.node_renderers:
-      nr.render(self.ax)
+    # Render the node rings, node and lobe labels, and ring legends
+    rings = self.renderNodeLayers(cache)
 
-    # Render Node Labels
-    self.renderNodeLabels()
-
-    # Render EdgeRenderers
-    to_render = []
+    # Choose the edges to render, as positions in draw order
+    widths = self.edge_widths
+    to_render = np.arange(len(widths))
     if edge_thresh:
       percent = edge_thresh[0]
       use_style = edge_thresh[1]
       if (use_style == config.EDGE_THRESH_1):
-        edge_weights = [er.width for er in self.edge_renderers]
-        thresh = topRange(edge_weights, percent)[0]
-        to_render = [er for er in self.edge_renderers if er.width > thresh]
+        thresh = topRange(widths, percent)[0]
+        to_render = np.flatnonzero(widths > thresh)
       elif (use_style == config.EDGE_THRESH_2):
-        weight_sorted = sorted(self.edge_renderers, key=lambda er: er.width, reverse=True)
-        num_edges = int(ceil(len(self.edge_renderers) * (percent / 100.0)))
-        to_render = weight_sorted[:num_edges]
-    else:
-      to_render = self.edge_renderers
-    for er in to_render:
-      er.render(self.ax, self.node_extents)
+        # Widest first, keeping ties in draw order
+        num_edges = int(ceil(len(widths) * (percent / 100.0)))
+        to_render = np.argsort(-widths, kind='mergesort')[:num_edges]
+      else:
+        to_render = to_render[:0]
+    edge_i = self.edge_order[to_render]
+    (start, end) = (self.graph.edge_start[edge_i], 
+                    self.graph.edge_end[edge_i])
+    (colors, widths) = (self.edge_colors[to_render], widths[to_render])
 
-    # Render each Lobe label
-    self.renderLobeLabels()
-      
-    # Render Legends
-    self.renderRingLegends()
+    # Render Legends. The label legend goes below the edge legend.
     cur_y = 1.4
     (w, h) = self.renderEdgeLegend(-1.5, cur_y, 0.4)
     cur_y -= (h + 0.05)
     (w, h) = self.renderLabelLegend(-1.5, cur_y, 0.4)
 
+    # Edges are added last. Their zorder still places them between the rings
+    # and the text.
+    if collapse and bundle is None:
+      bundle = config.BUNDLE_STRENGTH
+    bundling = None
+    if bundle is not None:
+      bundling = LobeBundling(self.graph.node_lobe, self.lobe_extent_array, 
+                              bundle)
+    if density:
+      edges = renderDensity(self.ax, start, end, widths, 
+                            self.node_extent_array, bundling, density)
+    elif collapse:
+      edges = renderBundles(self.ax, start, end, colors, widths, bundling)
+    else:
+      edges = renderEdges(self.ax, start, end, colors, widths, 
+                          self.node_extent_array, bundling=bundling)
+
+    # Mark rasterized layers. Text and legends always stay vector.
+    others = [a for a in self.ax.collections + self.ax.patches + 
+              self.ax.lines + self.ax.images 
+              if a.get_label() != LEGEND_LABEL]
+    layers = {'edges': [edges] if edges else [], 'rings': rings, 
+              'other': others}
+    for layer in raster_layers:
+      for artist in layers[layer]:
+        artist.set_rasterized(True)
+
     # OK. We're set to render ax.
-    plt.savefig(out_filename)
+    if dpi is None:
+      dpi = config.FIGURE_DPI if fmt == 'png' else config.RASTER_DPI
+    self.fig.savefig(out_filename, format=fmt, dpi=dpi)
+
+  def renderNodeLayers(self, cache=None):
+    """
+    Render the layers which only depend on the node file: the node rings, 
+    node and lobe labels, and ring legends. With a cache, they are loaded 
+    as a whole figure, which then replaces this instance's figure, or 
+    rendered and stored on a miss.
+
+    Args:
+      cache: Optional GraphCache
+    Return:
+      A list of the ring PathCollections, by layer
+    """
+    key = None
+    if cache:
+      lobe_digest = None
+      if self.lobe_filename:
+        lobe_digest = fileDigest(self.lobe_filename)
+      key = cache.layerKey(fileDigest(self.graph.node_filename), lobe_digest)
+      hit = cache.getLayers(key)
+      if hit:
+        plt.close(self.fig)
+        (self.fig, rings) = hit
+        self.ax = self.fig.axes[0]
+        return rings
+
+    rings = renderRings(self.ax, self.graph, self.node_extent_array)
+    self.renderNodeLabels()
+    self.renderLobeLabels()
+    self.renderRingLegends()
+    if cache:
+      cache.putLayers(key, (self.fig, rings))
+    return rings
 
   def renderLobeLabels(self):
     """
-    Render all text lobe labels, detecting and resolving any text overlaps. 
+    Render all text lobe labels. Labels which would overlap the label before
+    them are moved outward to the next level, see labels.labelLevels.
     """
-    renderer       = findRenderer(self.fig)
-    lobes          = self.graph.lobes
-    sorted_lobes   = self.graph.sorted_lobes
+    sorted_lobes = self.graph.sorted_lobes
+    if not sorted_lobes:
+      return
+    fontsize   = 6
+    mid_thetas = self.lobe_extent_array.sum(axis=1) / 2
+    scale      = dataPerPoint(self.ax)
+    sizes      = scale * np.array([textSize(lobe.name, fontsize) 
+                                   for lobe in sorted_lobes])
 
     """ level determines the radial distance of the label from the origin. 
     Increasing the level for some labels is the way we resolve overlaps. """
-    level          = 0  
-
-    last_txt       = None
-    to_render      = [lobe.uID for lobe in sorted_lobes]
-    next_to_render = []
-
-    while to_render:
-      for lobe_id in to_render:
-        lobe = lobes[lobe_id]
-        extents = self.lobe_extents[lobe_id]
-
-        # Calculate lobe label position
-        mid_theta = midTheta(*extents)
-        quadrant  = theta2Quadrant(mid_theta)
-        radius  = config.RING_RADIUS 
-        radius += (len(self.graph.node_md.layers) + 1.5) * config.RING_DEPTH
-        radius += level * (.4 * config.RING_DEPTH)
-        (label_x, label_y) = polar2Cartesian(radius, mid_theta)
-
-        # Draw lobe label 
-        props = {
-          'fontsize': 6,
-          'va': 'center',
-          'ha': 'center',
-          'rotation_mode': 'anchor'
-        }
-        if quadrant == 1 or quadrant == 2:
-          props["rotation"] = mid_theta - 90
-        else:
-          props["rotation"] = mid_theta + 90
-        t = self.ax.text(label_x, label_y, lobe.name, props)
-
-        # Get lobe label bounding box and transform it to data coords
-        # http://matplotlib.org/users/transforms_tutorial.html?highlight=transform
-        disp_to_data = self.ax.transData.inverted()
-        bbox = t.get_window_extent(renderer).transformed(disp_to_data) 
-
-        # Calculate cartesian endpoints of label text
-        if quadrant == 2 or quadrant == 4:
-          text_start = (bbox.x0, bbox.y0)
-          text_end = (bbox.x1, bbox.y1)
-        else:
-          text_start = (bbox.x0 + bbox.width, bbox.y0)
-          text_end = (bbox.x0, bbox.y1)
-
-        # Ensure start and end in counterclockwise order
-        v1 = text_start 
-        v2 = (text_end[0] - text_start[0], text_end[1] - text_start[1])
-        cross = np.cross(v1, v2)
-        if cross < 0:
-          tmp = text_start
-          text_start = text_end
-          text_end = tmp
-
-        # Calculate angular start and end of label
-        r, text_start_theta = cartesian2Polar(*text_start)
-        r, text_end_theta   = cartesian2Polar(*text_end)
-
-        # Case I: This text overlaps the last rendered. Move it to next level.
-        if last_txt and \
-           angularExtentsOverlap(last_txt[0], last_txt[1], 
-                                 text_start_theta, text_end_theta):
-          t.remove()
-          next_to_render += [lobe_id]
-        else:
-          last_txt = (text_start_theta, text_end_theta)
-          """ Uncomment to see line that I'm using to approximate text position
-          self.ax.add_line(Line2D((text_start[0], text_end[0]), 
-                                  (text_start[1], text_end[1]), 
-                                  linewidth=0.5, color='red'))
-          """
-      level += 1
-      last_txt = None
-      to_render = next_to_render
-      next_to_render = []
+    radius  = config.RING_RADIUS 
+    radius += (len(self.graph.node_md.layers) + 1.5) * config.RING_DEPTH
+    level_step = .4 * config.RING_DEPTH
+    levels = labelLevels(mid_thetas, sizes, radius, level_step)
+
+    rotations = tangentRotations(mid_thetas)
+    props = {
+      'fontsize': fontsize,
+      'va': 'center',
+      'ha': 'center',
+      'rotation_mode': 'anchor'
+    }
+    for lobe, mid_theta, rotation, level in zip(sorted_lobes, 
+                                                mid_thetas.tolist(), 
+                                                rotations.tolist(),
+                                                levels.tolist()):
+      (label_x, label_y) = polar2Cartesian(radius + level * level_step, 
+                                           mid_theta)
+      props['rotation'] = rotation
+      self.ax.text(label_x, label_y, lobe.name, props)
 
   def renderRingLegends(self):
     """
@@ -334,7 +366,7 @@ class GraphRenderer:
       grad_segs = []
       for j in xrange(num_grad_segs):
         grad_segs += [Rectangle((x0 + j * dx, cur_y), dx + .005, dh/2.0)]
-      p = PatchCollection(grad_segs, edgecolors='none')
+      p = PatchCollection(grad_segs, edgecolors='none', label=LEGEND_LABEL)
       p.set(array=values, cmap=cm)
       self.ax.add_collection(p)
 
@@ -368,14 +400,17 @@ class GraphRenderer:
       start_x = x + dw
       end_x = start_x + config.RING_DEPTH
       cur_y -= 0.75 * dh
-      self.ax.add_line(Line2D((start_x, end_x), (cur_y, cur_y), linewidth=0.5, color=cm(0.5)))
+      self.ax.add_line(Line2D((start_x, end_x), (cur_y, cur_y), linewidth=0.5, 
+                              color=cm(0.5), label=LEGEND_LABEL))
       tick_h = 0.1 * dh
       self.ax.add_line(Line2D((start_x, start_x), 
                               (cur_y - tick_h, cur_y + tick_h), 
-                              linewidth=0.5, color=cm(0.5)))
+                              linewidth=0.5, color=cm(0.5), 
+                              label=LEGEND_LABEL))
       self.ax.add_line(Line2D((end_x, end_x), 
                               (cur_y - tick_h, cur_y + tick_h), 
-                              linewidth=0.5, color=cm(0.5)))
+                              linewidth=0.5, color=cm(0.5), 
+                              label=LEGEND_LABEL))
       props = {'va': 'center', 'ha': 'left', 'size': text_size}
       s = '[' + str(thick_min_val) + ',  ' + str(thick_max_val) + ']'
       self.ax.text(end_x + 0.2 * dw, cur_y, s, props)
@@ -447,7 +482,7 @@ class GraphRenderer:
       grad_segs = []
       for i in xrange(num_grad_segs):
         grad_segs += [Rectangle((x0 + i * dx, cur_y), dx + .005, dh/2)]
-      p = PatchCollection(grad_segs, edgecolors='none')
+      p = PatchCollection(grad_segs, edgecolors='none', label=LEGEND_LABEL)
       p.set(array=values, cmap=cm)
       self.ax.add_collection(p)
 
@@ -545,7 +580,7 @@ class GraphRenderer:
 
   def renderRectangle(self, x, y, w, h):
     """
-    Render a rectangle on this graph_renderer's axes instance.
+    Render a legend box outline on this graph_renderer's axes instance.
 
     Args:
       x, y: Bottom left corner coords
@@ -560,12 +595,14 @@ class GraphRenderer:
     ]
     codes = [Path.MOVETO, Path.LINETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY]
     path = Path(verts, codes)
-    patch = PathPatch(path, facecolor='none', lw=0.2)
+    patch = PathPatch(path, facecolor='none', lw=0.2, label=LEGEND_LABEL)
     self.ax.add_patch(patch)
 
   def renderNodeLabels(self):
     """
-    Render all Node labels. 
+    Render all Node labels. Labels which would crowd the last label kept are
+    dropped, see labels.decimateLabels. The label-grouping arcs and lines of
+    multiple labels are drawn as one collection each.
     """
     md = self.graph.node_md
     num_labeled_layers = md.numLabeledLayers()
@@ -574,98 +611,101 @@ class GraphRenderer:
     if num_labeled_layers == 0:
       return
 
+    fontsize  = config.NODE_LABEL_FONTSIZE
+    scale     = dataPerPoint(self.ax)
+    spacing   = config.NODE_LABEL_SPACING * scale * textSize('lp', fontsize)[1]
+    nodes     = [nr.node for nr in self.node_renderers]
+    num_nodes = len(nodes)
+    node_thetas = self.node_extent_array[self.graph.node_order].sum(axis=1) / 2
+
     # CASE II: Nodes Have 1 Label 
     if num_labeled_layers == 1:
-      for nr in self.node_renderers:
-        mid_theta   = midTheta(nr.start_theta, nr.end_theta)
-        quadrant    = theta2Quadrant(mid_theta)
-        radius      = config.RING_RADIUS
-        radius     += len(md.layers) * config.RING_DEPTH
-        radius     += 0.1 * config.RING_DEPTH
-        node_width  = nr.end_theta - nr.start_theta
-        num_pads    = 1
-
-        label_theta        = mid_theta 
-        (label_x, label_y) = polar2Cartesian(radius, label_theta)
-        props = {
-          'fontsize': 2.5,
-          'color': '#000000',
-          'rotation_mode': 'anchor'
-        }
-        if quadrant == 1 or quadrant == 4:
-          props['rotation'] = label_theta
-          props['va'] = 'center'
-          props['ha'] = 'left'
-        else:
-          props['rotation'] = label_theta - 180
-          props['va'] = 'center'
-          props['ha'] = 'right'
-        self.ax.text(label_x, label_y, nr.node.getLayerLabel(0), props)
+      radius  = config.RING_RADIUS
+      radius += len(md.layers) * config.RING_DEPTH
+      radius += 0.1 * config.RING_DEPTH
+      texts   = [node.getLayerLabel(0) for node in nodes]
+      colors  = ['#000000'] * num_nodes
+      thetas  = node_thetas
+      merged  = False
 
     # CASE III: Nodes Have Multiple Labels
     else:
-      num_labels = num_labeled_layers * len(self.node_renderers)
+      num_labels = num_labeled_layers * num_nodes
       label_w = 360.0 / num_labels
-      cur_theta = self.offset 
-      label_radius  = config.RING_RADIUS
-      label_radius += len(md.layers) * config.RING_DEPTH
-      label_radius += 0.3 * config.RING_DEPTH
-      for nr in self.node_renderers:
-        arc_start_theta = cur_theta + 0.5 * label_w
-        arc_end_theta   = arc_start_theta + label_w * (num_labeled_layers - 1)
-        for layer_i in range(num_labeled_layers):
-          layer_label_text = nr.node.getLayerLabel(layer_i)
-
-          label_theta = cur_theta + label_w / 2 
-          quadrant    = theta2Quadrant(label_theta)
-          (label_x, label_y) = polar2Cartesian(label_radius, label_theta)
-
-          num_colors = len(config.LAYER_LABEL_COLORS)
-          color      = config.LAYER_LABEL_COLORS[layer_i % num_colors]
-
-          props = {
-            'fontsize': 2.5,
-            'color': color,
-            'rotation_mode': 'anchor'
-          }
-          if quadrant == 1 or quadrant == 4:
-            props['rotation'] = label_theta
-            props['va']       = 'center'
-            props['ha']       = 'left'
-          else:
-            props['rotation'] = label_theta - 180
-            props['va']       = 'center'
-            props['ha']       = 'right'
-          self.ax.text(label_x, label_y, layer_label_text, props)
-          cur_theta += label_w
-
-        # Render label-grouping arc 
-        label_arc_radius = label_radius - 0.01
-        self.ax.add_patch(Wedge(config.RING_ORIGIN, 
-                           label_arc_radius, 
-                           arc_start_theta, arc_end_theta, 
-                           width=0.001,
-                           edgecolor='none',
-                           facecolor='#555555'))
-
-        # Draw a line from the label group arc to the node
-        node_theta = midTheta(nr.start_theta, nr.end_theta)
-        arc_len = arc_end_theta - arc_start_theta
-        if (abs(node_theta - arc_start_theta) < abs(node_theta - arc_end_theta)):
-          p1_theta = arc_start_theta + arc_len * 0.15
-        else:
-          p1_theta = arc_end_theta - arc_len * 0.15 
-        p1 = polar2Cartesian(label_arc_radius - 0.001, p1_theta)
-
-        last_layer_i = len(md.layers) - 1
-        min_depth_csv    = md.getPropertyMinVal('D', last_layer_i)
-        max_depth_csv    = md.getPropertyMaxVal('D', last_layer_i)
-        layer_depth_csv  = nr.node.getLayerDepth(last_layer_i) 
-        last_layer_depth = mapRangeParam(float(layer_depth_csv), float(min_depth_csv), 
-                                         float(max_depth_csv), 0.0, -config.RING_DEPTH)
-        r  = config.RING_RADIUS 
-        r += config.RING_DEPTH * last_layer_i 
-        r += -last_layer_depth
-        p2 = polar2Cartesian(r, node_theta)
-        self.ax.add_line(Line2D((p1[0], p2[0]), (p1[1], p2[1]), 
-                                linewidth=0.1, color='#555555'))
+      radius  = config.RING_RADIUS
+      radius += len(md.layers) * config.RING_DEPTH
+      radius += 0.3 * config.RING_DEPTH
+      # Label thetas by node and layer
+      layer_thetas  = np.arange(num_labels, dtype=np.float64) + 0.5
+      layer_thetas  = self.offset + label_w * layer_thetas
+      layer_thetas  = layer_thetas.reshape(num_nodes, num_labeled_layers)
+      layers = range(num_labeled_layers)
+
+      # Labels given too little arc are merged into one label per node
+      merged = radians(label_w) * radius < spacing
+      if merged:
+        texts  = [config.NODE_LABEL_SEPARATOR.join(node.getLayerLabel(i) 
+                                                   for i in layers)
+                  for node in nodes]
+        colors = [config.MERGED_LABEL_COLOR] * num_nodes
+        thetas = layer_thetas.mean(axis=1)
+      else:
+        num_colors = len(config.LAYER_LABEL_COLORS)
+        texts  = [node.getLayerLabel(i) for node in nodes for i in layers]
+        colors = [config.LAYER_LABEL_COLORS[i % num_colors] 
+                  for node in nodes for i in layers]
+        thetas = layer_thetas.reshape(-1)
+
+    # Drop empty labels, and labels crowding the last label kept
+    keep = np.array([bool(t) for t in texts], dtype=bool)
+    keep[keep] = decimateLabels(thetas[keep], degrees(spacing / radius))
+    (rotations, outward) = radialRotations(thetas)
+    props = {
+      'fontsize': fontsize,
+      'va': 'center',
+      'rotation_mode': 'anchor'
+    }
+    for i in np.flatnonzero(keep).tolist():
+      (label_x, label_y) = polar2Cartesian(radius, thetas[i])
+      props['color']    = colors[i]
+      props['rotation'] = rotations[i]
+      props['ha']       = 'left' if outward[i] else 'right'
+      self.ax.text(label_x, label_y, texts[i], props)
+    if num_labeled_layers == 1:
+      return
+
+    # Render label-grouping arcs of the nodes with at least one label drawn
+    node_keep    = keep.reshape(num_nodes, -1).any(axis=1)
+    layer_thetas = layer_thetas[node_keep]
+    node_thetas  = node_thetas[node_keep]
+    arc_start_thetas = layer_thetas[:, 0]
+    arc_end_thetas   = layer_thetas[:, -1]
+    label_arc_radius = radius - 0.01
+    arcs = wedgePaths(arc_start_thetas, arc_end_thetas, label_arc_radius,
+                      np.full(len(arc_start_thetas), 0.001))
+    self.ax.add_collection(PathCollection(arcs, facecolors='#555555', 
+                                          edgecolors='none'), 
+                           autolim=False)
+
+    # Draw a line from each label group arc to its node
+    arc_lens = arc_end_thetas - arc_start_thetas
+    near_start = np.abs(node_thetas - arc_start_thetas) < \
+                 np.abs(node_thetas - arc_end_thetas)
+    p1_thetas = np.where(near_start, arc_start_thetas + arc_lens * 0.15, 
+                         arc_end_thetas - arc_lens * 0.15)
+    last_layer_i = len(md.layers) - 1
+    (depths, spec) = layerValues(self.graph, 'D', last_layer_i)
+    depths = depths[self.graph.node_order][node_keep]
+    depths = (-config.RING_DEPTH * (depths - spec.min)) / \
+             float(spec.max - spec.min)
+    p2_radii = config.RING_RADIUS + config.RING_DEPTH * last_layer_i - depths
+    (p1_rads, p2_rads) = (np.radians(p1_thetas), np.radians(node_thetas))
+    p1_radius = label_arc_radius - 0.001
+    segments = np.empty((len(p1_rads), 2, 2))
+    segments[:, 0, 0] = p1_radius * np.cos(p1_rads)
+    segments[:, 0, 1] = p1_radius * np.sin(p1_rads)
+    segments[:, 1, 0] = p2_radii * np.cos(p2_rads)
+    segments[:, 1, 1] = p2_radii * np.sin(p2_rads)
+    self.ax.add_collection(LineCollection(segments, linewidths=0.1, 
+                                          colors='#555555', zorder=2),
+                           autolim=False)
@@ -133,6 +133,16 @@ def mapRangeParam(u, min_u, max_u, min_v, max_v):
 
   return ((max_v - min_v) * (u - min_u)) / float(max_u - min_u) + min_v
 
+def mapRangeArray(u, min_u, max_u, min_v, max_v):
+  """
+  Linearly map each value of the float array u in the range [min_u, max_u]
+  to a value in the range defined by [min_v, max_v], like mapRangeParam.
+
+  Return:
+    A float64 array
+  """
+  return ((max_v - min_v) * (u - min_u)) / float(max_u - min_u) + min_v
+
 def minNetDiff(a, b):
   """
   Returns an offset s that minimizes (zeros) the net difference between the 
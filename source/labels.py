@@ -0,0 +1,189 @@
+"""
+  Label layout without a renderer.
+
+  Label sizes come from font metrics, measured once per (text, font size) and
+  cached, so placing a label is arithmetic on its rotated box rather than a
+  draw of a trial text artist. Overlapping lobe labels are pushed outward to
+  higher levels in one sweep around the ring.
+
+  Node labels run radially and are too small to move outward, so labels
+  crowding the one before them are dropped instead.
+"""
+# Library Imports
+import numpy as np
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import TextToPath
+
+# Local Module Imports
+from helper import angularExtentsOverlap
+
+TEXT_TO_PATH = TextToPath()
+
+# Text box (width, height, descent) in points by (text, font size)
+_text_metrics = {}
+
+def textMetrics(text, fontsize):
+  """
+  Measure the box matplotlib lays a single line of text out in, at 72 dpi.
+  Like matplotlib.text.Text, the box covers at least the ascent and descent 
+  of 'lp'.
+
+  Args:
+    text: The label string
+    fontsize: Font size in points
+  Return:
+    A tuple (width, height, descent) in points. The box spans descent below
+    the baseline to height - descent above it.
+  """
+  key = (text, fontsize)
+  metrics = _text_metrics.get(key)
+  if metrics is None:
+    prop = FontProperties(size=fontsize)
+    (w, h, d) = TEXT_TO_PATH.get_text_width_height_descent(text, prop, False)
+    (lp_w, lp_h, lp_d) = TEXT_TO_PATH.get_text_width_height_descent('lp',
+                                                                    prop,
+                                                                    False)
+    metrics = (w, max(h, lp_h), max(d, lp_d))
+    _text_metrics[key] = metrics
+  return metrics
+
+def textSize(text, fontsize):
+  """
+  Return the (width, height) in points of a line of text, see textMetrics.
+  """
+  return textMetrics(text, fontsize)[:2]
+
+def dataPerPoint(ax):
+  """
+  Return the length in ax's data coordinates of one typographic point,
+  assuming equal x and y scales.
+  """
+  (x0, x1) = ax.transData.transform([(0.0, 0.0), (1.0, 0.0)])[:, 0]
+  return (ax.figure.dpi / 72.0) / (x1 - x0)
+
+def tangentRotations(mid_thetas):
+  """
+  Return the text rotations in degrees which run labels along the ring at
+  mid_thetas, reading left to right: mid_theta - 90 in quadrants 1 and 2,
+  mid_theta + 90 in quadrants 3 and 4.
+  """
+  upper = (mid_thetas % 360.0) < 180.0
+  return np.where(upper, mid_thetas - 90, mid_thetas + 90)
+
+def labelExtents(mid_thetas, radius, sizes):
+  """
+  Compute the angular extents of centered labels running along the ring.
+  Each extent spans the corners of the label's axis aligned bounding box
+  which lie along the text, like the window extent of the text artist.
+
+  Args:
+    mid_thetas: float64 array of the label centers' thetas in degrees
+    radius: Radius of the label centers
+    sizes: float64 array of label (width, height) in data coordinates,
+      shape (num labels, 2)
+  Return:
+    A tuple (start thetas, end thetas) of float64 arrays in degrees [0, 360),
+    each counterclockwise from start to end
+  """
+  rad = np.radians(mid_thetas)
+  (x, y) = (radius * np.cos(rad), radius * np.sin(rad))
+  rot = np.radians(tangentRotations(mid_thetas))
+  (c, s) = (np.abs(np.cos(rot)), np.abs(np.sin(rot)))
+  (w, h) = (sizes[:, 0], sizes[:, 1])
+  (half_w, half_h) = ((c * w + s * h) / 2, (s * w + c * h) / 2)
+  # Quadrants 2 and 4 run bottom left to top right, 1 and 3 bottom right to
+  # top left
+  quadrant = (mid_thetas % 360.0) // 90
+  rising = (quadrant == 1) | (quadrant == 3)
+  start_x = np.where(rising, x - half_w, x + half_w)
+  end_x = np.where(rising, x + half_w, x - half_w)
+  (start_y, end_y) = (y - half_h, y + half_h)
+  # Ensure start and end in counterclockwise order
+  cw = start_x * (end_y - start_y) - start_y * (end_x - start_x) < 0
+  (start_x, end_x) = (np.where(cw, end_x, start_x), 
+                      np.where(cw, start_x, end_x))
+  (start_y, end_y) = (np.where(cw, end_y, start_y), 
+                      np.where(cw, start_y, end_y))
+  return (np.degrees(np.arctan2(start_y, start_x)) % 360,
+          np.degrees(np.arctan2(end_y, end_x)) % 360)
+
+def labelLevels(mid_thetas, sizes, base_radius, level_step):
+  """
+  Assign each label the lowest level at which it doesn't overlap the label
+  before it on that level. Labels are swept once in order; since each
+  level's placed extents are then sorted by angle, only its last one needs
+  checking.
+
+  Args:
+    mid_thetas: float64 array of label thetas in degrees, in ring order
+    sizes: float64 array of label (width, height) in data coordinates
+    base_radius: Radius of level 0
+    level_step: Radial distance between levels
+  Return:
+    An int array of the level of each label
+  """
+  levels = np.zeros(len(mid_thetas), dtype=np.intp)
+  # Extents of every label at each level, computed as levels come into use
+  extents = []
+  # Extent of the last label placed on each level
+  last = []
+  for i in xrange(len(mid_thetas)):
+    level = 0
+    while True:
+      if level == len(extents):
+        extents.append(labelExtents(mid_thetas,
+                                    base_radius + level * level_step, sizes))
+        last.append(None)
+      extent = (extents[level][0][i], extents[level][1][i])
+      if last[level] is None or \
+         not angularExtentsOverlap(last[level][0], last[level][1], *extent):
+        break
+      level += 1
+    last[level] = extent
+    levels[i] = level
+  return levels
+
+def decimateLabels(thetas, min_angle):
+  """
+  Choose the labels to keep so that no two kept labels are closer than
+  min_angle. Labels are swept once in order, keeping each label far enough
+  from the last kept one, and from the first kept one around the ring.
+
+  Args:
+    thetas: float64 array of increasing label thetas in degrees, spanning 
+      less than 360 degrees
+    min_angle: Minimum angle between kept labels in degrees
+  Return:
+    A bool array, True for labels to keep
+  """
+  keep = np.ones(len(thetas), dtype=bool)
+  if len(thetas) < 2:
+    return keep
+  gaps = np.diff(thetas)
+  if gaps.min() >= min_angle and thetas[0] + 360 - thetas[-1] >= min_angle:
+    return keep
+  thetas = thetas.tolist()
+  last = thetas[0]
+  end = thetas[0] + 360 - min_angle
+  for i in xrange(1, len(thetas)):
+    if thetas[i] - last < min_angle or thetas[i] > end:
+      keep[i] = False
+    else:
+      last = thetas[i]
+  return keep
+
+def radialRotations(thetas):
+  """
+  Return the text rotations in degrees of labels running radially outward
+  at thetas, and whether each label reads outward. Labels on the left half 
+  are turned over to read left to right, so they read inward.
+
+  Args:
+    thetas: float64 array of label thetas in degrees
+  Return:
+    A tuple (float64 array of rotations, bool array, True where the label
+    reads outward)
+  """
+  quadrant = (thetas % 360.0) // 90
+  outward = (quadrant == 0) | (quadrant == 3)
+  return (np.where(outward, thetas, thetas - 180), outward)
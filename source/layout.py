@@ -0,0 +1,154 @@
+"""
+  Vectorized layout of nodes and lobes around the visualization ring.
+
+  Computes node angles, the node and lobe ordering, lobe centers of mass,
+  lobe extents and node extents with array operations over a graph's node
+  arrays, instead of comparing Node and Lobe objects pairwise. Results match
+  the per-object methods (Node.__lt__, Lobe.centerOfMass, Lobe.weight).
+"""
+# Library Imports
+import numpy as np
+
+# Local Module Imports
+import config
+from helper import minNetDiff
+
+def nodeThetas(pos):
+  """
+  Return the polar theta coordinate of each node, like cartesian2Polar.
+
+  Args:
+    pos: float64 array of node positions, shape (num nodes, 3)
+  Return:
+    float64 array of thetas in degrees [0, 360)
+  """
+  return np.degrees(np.arctan2(pos[:, 1], pos[:, 0])) % 360
+
+def nodeWeights(node_table, node_md):
+  """
+  Return the weight of each node, like Node.weight.
+  """
+  col_i = node_md.getPropertyIdx('W', 0)
+  if col_i:
+    return np.asarray(node_table.column(col_i), dtype=np.float64)
+  weights = np.empty(len(node_table))
+  weights.fill(float(config.NODE_DEFAULT_VAL['W']))
+  return weights
+
+def lobeCodes(lobe_ids):
+  """
+  Number lobes in order of first appearance.
+
+  Args:
+    lobe_ids: A sequence with the lobe ID of each node
+  Return:
+    A tuple (int array with the lobe number of each node, list of lobe IDs
+    by lobe number)
+  """
+  numbers = {}
+  codes = np.empty(len(lobe_ids), dtype=np.intp)
+  for i, lobe_id in enumerate(lobe_ids):
+    codes[i] = numbers.setdefault(lobe_id, len(numbers))
+  ids = [None] * len(numbers)
+  for lobe_id, code in numbers.items():
+    ids[code] = lobe_id
+  return (codes, ids)
+
+def sortNodes(codes, thetas):
+  """
+  Order nodes by lobe number, then by theta within each lobe. Ties keep node
+  table order, as bisect.insort does.
+
+  Return:
+    An int array of node indices
+  """
+  return np.lexsort((thetas, codes))
+
+def lobeCenters(pos, weights, codes, num_lobes, order):
+  """
+  Compute the weighted center of mass and total weight of each lobe. Sums
+  are accumulated in the given node order, so results equal
+  Lobe.centerOfMass and Lobe.weight for lobes sorted that way.
+
+  Args:
+    pos: float64 array of node positions, shape (num nodes, 3)
+    weights: float64 array of node weights
+    codes: int array of the lobe number of each node
+    num_lobes: Number of lobes
+    order: Node indices in the order nodes are summed, eg. from sortNodes
+  Return:
+    A tuple (float64 array of centers, shape (num lobes, 3), float64 array
+    of lobe weights)
+  """
+  (c, w) = (codes[order], weights[order])
+  lobe_wts = np.bincount(c, w, num_lobes)
+  assert np.all(lobe_wts != 0)
+  centers = np.column_stack([np.bincount(c, pos[order, k] * w, num_lobes)
+                             for k in range(3)])
+  return (centers / lobe_wts[:, np.newaxis], lobe_wts)
+
+def sortLobes(centers):
+  """
+  Order lobes by the theta coordinate of their center of mass, as
+  Lobe.__lt__ does. Ties keep lobe number order.
+
+  Return:
+    An int array of lobe numbers
+  """
+  return np.argsort(nodeThetas(centers), kind='mergesort')
+
+def lobeExtents(lobe_wts, total_wt, center_thetas):
+  """
+  Divide the ring between lobes in proportion to their weights, separated by
+  equal gaps, then rotate all lobes by the offset that best aligns the lobe
+  centers with their centers of mass.
+
+  Args:
+    lobe_wts: float64 array of lobe weights, in ring order
+    total_wt: Total weight of all nodes
+    center_thetas: float64 array of the theta of each lobe's center of mass,
+      in ring order
+  Return:
+    A tuple (float64 array of extents, shape (num lobes, 2), offset)
+  """
+  gap_wdth = config.TOTAL_GAP_DEGREES / len(lobe_wts)
+  widths = (360.0 - config.TOTAL_GAP_DEGREES) * (lobe_wts / total_wt)
+  ends = np.cumsum(widths + gap_wdth)
+  assert(abs(ends[-1] - 360.0) < 0.00001)
+  starts = np.concatenate(([0.0], ends[:-1]))
+  extents = np.column_stack((starts, starts + widths))
+  offset = minNetDiff(list(center_thetas), list(extents.sum(axis=1) / 2))
+  return (extents + offset, offset)
+
+def nodeExtents(lobe_extents, lobe_wts, weights, codes, order):
+  """
+  Divide each lobe's extent between its nodes in proportion to their
+  weights, in sorted node order.
+
+  Args:
+    lobe_extents: float64 array of extents by lobe number, shape (num lobes,
+      2)
+    lobe_wts: float64 array of weights by lobe number
+    weights: float64 array of node weights
+    codes: int array of the lobe number of each node
+    order: Node indices sorted by lobe, then theta, eg. from sortNodes
+  Return:
+    A float64 array of node extents by node index, shape (num nodes, 2)
+  """
+  c = codes[order]
+  lex = lobe_extents[c]
+  widths = (lex[:, 1] - lex[:, 0]) * (weights[order] / lobe_wts[c])
+  # Accumulate each lobe's node widths from its start theta
+  bounds = np.flatnonzero(np.diff(c)) + 1
+  ends = np.empty(len(order))
+  for seg_begin, seg_end in zip(np.concatenate(([0], bounds)),
+                                np.concatenate((bounds, [len(order)]))):
+    seg = np.concatenate((lex[seg_begin:seg_begin + 1, 0],
+                          widths[seg_begin:seg_end]))
+    ends[seg_begin:seg_end] = np.cumsum(seg)[1:]
+  starts = np.concatenate((lex[:1, 0], ends[:-1]))
+  starts[bounds] = lex[bounds, 0]
+  extents = np.empty((len(order), 2))
+  extents[order, 0] = starts
+  extents[order, 1] = ends
+  return extents
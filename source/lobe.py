@@ -4,7 +4,9 @@
 import bisect
 from helper import centerOfMass, cartesian2Polar
 
-class Lobe:
+class Lobe(object):
+  __slots__ = ('uID', 'name', 'nodes')
+
   def __init__(self, uID, name):
     """
     Lobe constructor.
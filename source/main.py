@@ -8,31 +8,99 @@
 import sys
 import bisect
 import argparse
-import csv
-import os
 
 # Local module imports
 import config
-from graph import Graph
+from graph import Graph, parseNodeFile, nodeIndex
 from graph_renderer import GraphRenderer
 from metadata import NodeMetadata, EdgeMetadata
+from cache import GraphCache
+from adjacency import loadAdjacency
+from edgelist import loadEdgeList, parseRoles, DEFAULT_ROLES
+from reader import InputReader, STDIN
 
 def main(nodefile, edgefile, outimage='fmri-viz.pdf', sdef=100):
   # Parse command line args
   parser = argparse.ArgumentParser(prog='fmri-viz',
              description='An fmri graph visualization tool')
-  parser.add_argument('-n', help='Node csv filename', default=nodefile)
-  parser.add_argument('-e', help='Edge csv filename', default=edgefile)
-  parser.add_argument('-a', help='Edge adjacency matrix csv filename')
+  parser.add_argument('-n', help='Node csv filename. May be gzip, bz2 or ' +
+    'xz compressed, or - for stdin', default=nodefile)
+  parser.add_argument('-e', help='Edge csv filename. May be gzip, bz2 or ' +
+    'xz compressed, or - for stdin', default=edgefile)
+  parser.add_argument('--edge-list', action='store_true',
+    help='The edge file (-e) is a plain source,target,property list ' +
+         'without metadata rows')
+  parser.add_argument('--use-as', default=DEFAULT_ROLES,
+    help='Comma separated USE_AS roles of the property columns of an edge ' +
+         'list (--edge-list). Join roles with + to use a column for several, ' +
+         'or use - to ignore a column. EG: C+W,-,L')
+  parser.add_argument('-a', help='Edge adjacency matrix csv filename. May ' +
+    'be gzip, bz2 or xz compressed')
+  parser.add_argument('--adj-upper', action='store_true',
+    help='Keep only the upper triangle of a symmetric adjacency matrix (-a)')
+  parser.add_argument('--adj-thresh', type=float,
+    help='Only read adjacency matrix (-a) entries greater than this value')
+  parser.add_argument('--adj-top-k', type=int,
+    help='Only read the k largest adjacency matrix (-a) entries of each row')
+  parser.add_argument('--adj-block-rows', type=int, 
+    default=config.ADJ_BLOCK_ROWS,
+    help='Number of adjacency matrix (-a) rows processed at once')
+  parser.add_argument('--adj-dtype', default='float32',
+    help='Element type of raw binary adjacency matrices (-a)')
   parser.add_argument('-l', help='Lobe extent file')
-  parser.add_argument('-s', type=int, default=sdef,
+  parser.add_argument('-s', type=int,
     help='Specifies that only edges with a weight in the top s percent of ' +
-         'the full range of edge weights will be rendered')
+         'the full range of edge weights will be rendered. Defaults to ' +
+         str(sdef) + ' unless -t is given')
   parser.add_argument('-t', type=int,
     help='Specifies that t% of edges will be rendered. Those edges will be' +
          'those with the highest weights. If there is a tie between ' + 
          'candidates of the same weight, it will be broken non-deterministically')
   parser.add_argument('-o', help='output filename', default=outimage)
+  parser.add_argument('--format', choices=config.OUTPUT_FORMATS,
+    help='Output file format. Defaults to the format named by the output ' +
+         'filename extension, or %s' % config.DEFAULT_OUTPUT_FORMAT)
+  parser.add_argument('--rasterize', default='none', 
+    choices=sorted(config.RASTER_POLICIES),
+    help='Layers drawn as images in PDF and SVG output: none, edges, edges ' +
+         'and rings, or all. Text always stays vector')
+  parser.add_argument('--dpi', type=int,
+    help='Resolution of PNG output (default %d) and of rasterized layers ' 
+         % config.FIGURE_DPI + '(default %d)' % config.RASTER_DPI)
+  parser.add_argument('--roi-lobes', 
+    help='Comma separated lobe IDs (eg. Frontal_L) or lobe names. Only ' +
+         'edges touching these lobes are rendered')
+  parser.add_argument('--roi-nodes', 
+    help='Comma separated node IDs. Only edges touching these nodes are ' +
+         'rendered')
+  parser.add_argument('--roi-within', action='store_true',
+    help='Only render edges with both endpoints in the --roi-lobes and ' +
+         '--roi-nodes region')
+  parser.add_argument('--bundle', type=float, nargs='?', 
+    const=config.BUNDLE_STRENGTH, metavar='BETA',
+    help='Bundle edges through their lobes. BETA in [0, 1] sets the ' +
+         'bundling strength, default %s' % config.BUNDLE_STRENGTH)
+  parser.add_argument('--bundle-lobes', action='store_true',
+    help='Draw one bundle per pair of lobes instead of the edges between ' +
+         'them. Implies --bundle')
+  parser.add_argument('--density', type=int, nargs='?', 
+    const=config.DENSITY_SIZE, metavar='PIXELS',
+    help='Draw edges as one density image, PIXELS wide (default %d), ' 
+         % config.DENSITY_SIZE + 'instead of one curve per edge. For graphs ' +
+         'with millions of edges')
+  parser.add_argument('-j', type=int, default=1,
+    help='Number of processes parsing the edge file (-e). 0 uses every CPU')
+  parser.add_argument('--cache', action='store_true',
+    help='Reuse parsed node and edge tables from an on-disk cache')
+  parser.add_argument('--cache-layers', action='store_true',
+    help='Reuse the rendered node rings, labels and ring legends of the ' +
+         'node file from the on-disk cache. Only the edges and their ' +
+         'legends are drawn again')
+  parser.add_argument('--cache-dir', default=config.CACHE_DIR,
+    help='Directory of the parsed graph cache')
+  parser.add_argument('--cache-size', type=int, 
+    default=config.CACHE_MAX_BYTES // (1024 ** 2),
+    help='Size limit of the parsed graph cache in megabytes')
   args = parser.parse_args()
   node_filename   = args.n
   edge_filename   = args.e
@@ -47,17 +115,22 @@ def main(nodefile, edgefile, outimage='fmri-viz.pdf', sdef=100):
                  'an adjacency edge file (-a)') 
   if edge_percent_s and edge_percent_t:
     parser.error('You must filter edges with either -s or -t, not both') 
-
-  # Parse Node and Edge CSV for metadata
-  node_file = open(node_filename, 'rb')
-  if adj_filename:
-    temp_edge_filename = generateEdgeFile(adj_filename)
-    edge_filename = temp_edge_filename
-  edge_file = open(edge_filename, 'rb')
-  node_md = NodeMetadata(node_file, config.NUM_NODE_METADATA_ROWS, 'Id')
-  edge_md = EdgeMetadata(edge_file, config.NUM_EDGE_METADATA_ROWS, 'Id')
-  node_file.close()
-  edge_file.close()
+  if edge_percent_s is None and not edge_percent_t:
+    edge_percent_s = sdef
+  if args.bundle is not None and not 0.0 <= args.bundle <= 1.0:
+    parser.error('The bundling strength (--bundle) must be in [0, 1]')
+  if args.dpi is not None and args.dpi < 1:
+    parser.error('The resolution (--dpi) must be positive')
+  if args.density is not None:
+    if args.density < 1:
+      parser.error('The density image size (--density) must be positive')
+    if args.bundle_lobes:
+      parser.error('Use either --density or --bundle-lobes, not both')
+  if args.edge_list:
+    try:
+      parseRoles(args.use_as)
+    except ValueError as e:
+      parser.error(str(e))
 
   # Edge Threshold Info
   edge_thresh = None
@@ -67,69 +140,65 @@ def main(nodefile, edgefile, outimage='fmri-viz.pdf', sdef=100):
     edge_thresh = (edge_percent_t, config.EDGE_THRESH_2)
 
   # Lets go!
-  g  = Graph(node_md, edge_md, node_filename, edge_filename)
-  gr = GraphRenderer(g, lobe_filename)
-  gr.render(output_filename, edge_thresh)
-
-  # Cleanup
-  if adj_filename:
-    os.remove(temp_edge_filename)
+  cache = None
+  if args.cache and STDIN not in (node_filename, edge_filename):
+    cache = GraphCache(args.cache_dir, args.cache_size * 1024 ** 2)
+  layer_cache = None
+  if args.cache_layers and node_filename != STDIN:
+    layer_cache = cache or GraphCache(args.cache_dir, 
+                                      args.cache_size * 1024 ** 2)
+  if adj_filename or args.edge_list:
+    # Build the edge table straight from the adjacency matrix or edge list
+    if cache:
+      node_md, node_table, node_digest = cache.loadNodes(node_filename)
+    else:
+      node_input = InputReader(node_filename, config.NUM_NODE_METADATA_ROWS)
+      node_md = NodeMetadata.fromRows(node_input.md_rows, 'Id')
+      node_table = parseNodeFile(node_input, node_md)
+    node_index = nodeIndex(node_table, node_md)
+    if adj_filename:
+      edge_md, edge_table = loadAdjacency(adj_filename, node_index,
+                                          args.adj_upper, 
+                                          thresh=args.adj_thresh,
+                                          top_k=args.adj_top_k,
+                                          block_rows=args.adj_block_rows,
+                                          progress=printProgress,
+                                          dtype=args.adj_dtype)
+    else:
+      edge_md, edge_table = loadEdgeList(edge_filename, node_index, 
+                                         args.use_as)
+    g = Graph(node_md, edge_md, node_filename, adj_filename or edge_filename,
+              edge_thresh, node_table, edge_table)
+  elif cache:
+    g = cache.loadGraph(node_filename, edge_filename, edge_thresh, args.j)
+  else:
+    # Parse Node and Edge CSV for metadata. Graph reads on from there.
+    node_input = InputReader(node_filename, config.NUM_NODE_METADATA_ROWS)
+    edge_input = InputReader(edge_filename, config.NUM_EDGE_METADATA_ROWS)
+    node_md = NodeMetadata.fromRows(node_input.md_rows, 'Id')
+    edge_md = EdgeMetadata.fromRows(edge_input.md_rows, 'Id')
+    g = Graph(node_md, edge_md, node_input, edge_input, edge_thresh, 
+              jobs=args.j)
+  edge_indices = None
+  if args.roi_lobes or args.roi_nodes:
+    roi_lobes = args.roi_lobes.split(',') if args.roi_lobes else []
+    roi_nodes = args.roi_nodes.split(',') if args.roi_nodes else []
+    try:
+      edge_indices = g.roiEdges(roi_lobes, roi_nodes, args.roi_within)
+    except KeyError as e:
+      parser.error('Unknown region of interest lobe or node: %s' % e.args[0])
+  gr = GraphRenderer(g, lobe_filename, edge_indices)
+  gr.render(output_filename, None, args.bundle, args.bundle_lobes, 
+            args.density, args.rasterize, args.dpi, args.format, layer_cache)
 
-def generateEdgeFile(adj_filename):
+def printProgress(rows_done, num_rows):
   """
-  Generate a temporary standard edge file based on the given adjacency edge
-  file.
-
-  Return:
-    The filename of the generated temp CSV file
+  Report adjacency matrix progress on stderr.
   """
-  # Parse the adjacency file
-  edges = []
-  edge_id = 0
-  min_v = None
-  max_v = None
-  min_depth = 0
-  depth     = 0
-  num_nodes = 0
-  with open(adj_filename, 'r') as adj_f:
-    r = csv.reader(adj_f, delimiter='\t')
-    for row_idx, row in enumerate(r):
-      if not num_nodes:
-        num_nodes = len(row)
-      else:
-        assert len(row) == num_nodes
-      for col_idx, v in enumerate(row):
-        if v:
-          v = float(v)
-          if not min_v:
-            min_v = v
-            max_v = v
-          if (v < min_v):
-            min_v = v
-          if v > max_v:
-            max_v = v
-          start  = 'Node' + str(row_idx + 1)
-          end    = 'Node' + str(col_idx + 1)
-          depth += 1 
-          edges.append([edge_id, start, end, v, v, depth, ''])
-          edge_id += 1
-  max_depth = depth
-
-  # Create temporary edge CSV file
-  temp_edge_filename = 'temp_edges.csv'
-  with open(temp_edge_filename, 'w') as edge_f:
-    w = csv.writer(edge_f, delimiter='\t')
-    header_row =   ['Id', 'Node1', 'Node2', 'Property1', 'Property2', 'Property3', 'Property4']
-    meta_row_min = ['MIN_VAL', 'NA', 'NA', str(min_v), str(min_v), str(min_depth), 'NA']
-    meta_row_max = ['MAX_VAL', 'NA', 'NA', str(max_v), str(max_v), str(max_depth), 'NA']
-    meta_row_use = ['USE_AS', 'S', 'E', 'C', 'W', 'D', 'L']
-    w.writerow(header_row)
-    w.writerow(meta_row_min)
-    w.writerow(meta_row_max)
-    w.writerow(meta_row_use)
-    for edge in edges: 
-      w.writerow(edge)
-  return temp_edge_filename
+  sys.stderr.write('\rAdjacency matrix rows: %d/%d (%d%%)' % 
+                   (rows_done, num_rows, 100 * rows_done // num_rows))
+  if rows_done == num_rows:
+    sys.stderr.write('\n')
 
 if __name__ == '__main__':
   main()
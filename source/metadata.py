@@ -1,9 +1,29 @@
 # Library Imports
-from itertools import islice 
-import csv
+from collections import namedtuple
 
 # Local Module Imports
 import config
+from reader import readHeader
+
+""" A compiled description of one property: its name and CSV column index 
+(both None for default properties), and its MIN_VAL and MAX_VAL as floats. 
+Categorical properties (MIN_VAL of 'NA') have the range their values are 
+hashed into instead. min and max are None if they aren't numeric.        """
+PropertySpec = namedtuple('PropertySpec', 
+                          ['name', 'col', 'min', 'max', 'categorical'])
+
+def compileSpec(name, col, min_val, max_val):
+  """
+  Build a PropertySpec from a property's metadata strings.
+  """
+  if min_val == 'NA':
+    return PropertySpec(name, col, float(config.NON_NUM_COLOR_MIN_VAL),
+                        float(config.NON_NUM_COLOR_MAX_VAL), True)
+  try:
+    (min_val, max_val) = (float(min_val), float(max_val))
+  except ValueError:
+    (min_val, max_val) = (None, None)
+  return PropertySpec(name, col, min_val, max_val, False)
 
 class Metadata(object):
   """
@@ -46,6 +66,33 @@ class Metadata(object):
       prime_key: The name of the column of primary keys. EG: Attribute names or
                  Item (Node, Edge) IDs.
     """
+    (reader, rows) = readHeader(in_file, num_rows)
+    self.parseRows(rows, prime_key)
+
+  @classmethod
+  def fromRows(cls, rows, prime_key):
+    """
+    Construct a Metadata object from already parsed rows.
+
+    Args:
+      rows: The property name row followed by all metadata rows, as lists of
+            strings.
+      prime_key: See __init__
+    Return:
+      An instance of cls
+    """
+    md = cls.__new__(cls)
+    md.parseRows(rows, prime_key)
+    return md
+
+  def parseRows(self, rows, prime_key):
+    """
+    Populate lookup tables from the property name row and metadata rows.
+
+    Args:
+      rows: See fromRows
+      prime_key: See __init__
+    """
     # 'data' will contain the property name row + all metadata rows as lists
     self.data = []
     # Lookup table mapping property names to column indices
@@ -53,18 +100,13 @@ class Metadata(object):
     # Lookup table mapping attribute names to row indices
     self.attr_indices = {}
 
-    # Detect and use correct delimiter. Commas and Tabs are supported.
-    dialect = csv.Sniffer().sniff(in_file.read(1024), delimiters=",\t")
-    in_file.seek(0)
-    reader = csv.reader(in_file, dialect)
     # Populate data structs
-    while reader.line_num < num_rows + 1:
-      row = next(reader)
-      if reader.line_num == 1:
+    for row_i, row in enumerate(rows):
+      if row_i == 0:
         for i, name in enumerate(row):
           self.prop_indices[name] = i
-      self.attr_indices[row[0]] = reader.line_num - 1
-      self.data.append(row)
+      self.attr_indices[row[0]] = row_i
+      self.data.append(list(row))
 
   def get(self, prop, attr):
     """
@@ -116,8 +158,8 @@ class NodeMetadata(Metadata):
   """
   Subclass to implement Node specific Metadata functionality
   """
-  def __init__(self, in_file, num_rows, prime_key):
-    super(NodeMetadata, self).__init__(in_file, num_rows, prime_key)
+  def parseRows(self, rows, prime_key):
+    super(NodeMetadata, self).parseRows(rows, prime_key)
 
     """
     A list of dicts for looking up Property names by layer: 
@@ -164,6 +206,14 @@ class NodeMetadata(Metadata):
         if not v:
           layer[use_as_key] = config.NODE_DEFAULT_META[use_as_key] 
 
+    """ The layers compiled once for render time lookups:
+      self.schema[('C', 0)] => PropertySpec(name, col, min, max, categorical)
+    """
+    self.schema = {}
+    for layer_i, layer in enumerate(self.layers):
+      for use_as_key, v in layer.items():
+        self.schema[(use_as_key, layer_i)] = compileSpec(*v)
+
   def getPropertyName(self, use_as, layer_i):
     """
     Get the Property name associated with the given USE_AS string for the given
@@ -218,10 +268,34 @@ class NodeMetadata(Metadata):
 
 class EdgeMetadata(Metadata):
   """
-  Subclass to implement Node specific Metadata functionality
-
-  TODO: Consider constructing a lookup table in the same way NodeMetadata does.
+  Subclass to implement Edge specific Metadata functionality
   """
+  def parseRows(self, rows, prime_key):
+    super(EdgeMetadata, self).parseRows(rows, prime_key)
+
+    """ Compiled property lookups:
+      self.schema['W'] => PropertySpec(name, col, min, max, categorical)
+    for the first column of each USE_AS value, and for default properties 
+    (name and col None) of render properties not in the input file.
+      self.prop_specs => [(USE_AS value, PropertySpec), ...]
+    for each render property column, in column order.                    """
+    self.schema = {}
+    self.prop_specs = []
+    use_as_row  = self.data[self.getAttrIdx('USE_AS')]
+    min_val_row = self.data[self.getAttrIdx('MIN_VAL')]
+    max_val_row = self.data[self.getAttrIdx('MAX_VAL')]
+    for col_i, use_as in enumerate(use_as_row):
+      if col_i == 0:
+        continue
+      spec = compileSpec(self.data[0][col_i], col_i, min_val_row[col_i],
+                         max_val_row[col_i])
+      self.schema.setdefault(use_as, spec)
+      if col_i >= config.EDGE_LAYER_COLS_BEGIN:
+        self.prop_specs.append((use_as, spec))
+    for use_as_key in config.EDGE_USE_AS_KEYS:
+      if use_as_key not in self.schema:
+        self.schema[use_as_key] = compileSpec(
+          *config.EDGE_DEFAULT_META[use_as_key])
 
   def getPropertyName(self, use_as):
     """
@@ -232,10 +306,5 @@ class EdgeMetadata(Metadata):
     Return:
       The string name of the associated property
     """
-    row_i = self.getAttrIdx('USE_AS')
-    use_as_row = self.data[row_i]
-    col_i = 0
-    for val in use_as_row:
-      if val == use_as:
-        return self.data[0][col_i]
-      col_i += 1
+    spec = self.schema.get(use_as)
+    return spec.name if spec else None
@@ -9,17 +9,21 @@ import numpy as np
 import config
 from helper import cartesian2Polar, calcColor, mapRangeParam
 
-class Node:
-  def __init__(self, csv_row, lobe, md):
+class Node(object):
+  __slots__ = ('csv', 'idx', 'lobe', 'md', 'uID', 'pos', 'theta1', 'theta2')
+
+  def __init__(self, csv_row, lobe, md, idx=None):
     """
     Node Constructor.
 
     Args:
-      csv_row: This node's csv row as a list of strings.
+      csv_row: This node's csv row as a list of strings, or a TableRow view.
       lobe: A reference to this node's lobe object
       md: A Metadata object about nodes
+      idx: This node's row index in the graph's node table, if any.
     """
     self.csv = csv_row
+    self.idx = idx
     self.lobe = lobe
     self.md = md
     self.uID = csv_row[md.getPropIdx('Id')]
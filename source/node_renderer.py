@@ -1,18 +1,132 @@
 """
-  A class to maintain render information about a Node instance and provide
-  rendering methods for that node.
+  Node rendering. Render values of each node layer are computed as arrays
+  and each ring drawn as one collection. A class maintains the angular 
+  extent of a Node instance.
 """
 
 # Library Imports
-from matplotlib.patches import Wedge
+import numpy as np
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection
 
 # Local Module Imports
 import config
-from helper import midTheta, theta2Quadrant, polar2Cartesian, mapRangeParam, \
-                   calcColor
+from helper import midTheta, theta2Quadrant, polar2Cartesian, mapRangeArray
+from colors import nodeGradient, categoryValues
 from math import pi
 
-class NodeRenderer:
+def layerValues(graph, use_as, layer_i):
+  """
+  Gather one render property of a node layer for every node.
+
+  Args:
+    graph: A Graph instance
+    use_as: A node USE_AS value. EG: C, D
+    layer_i: The layer index
+  Return:
+    A tuple (float64 array of values by node index, PropertySpec). Values of
+    categorical properties are hashed to the NON_NUM_COLOR range.
+  """
+  spec = graph.node_md.schema[(use_as, layer_i)]
+  num_nodes = len(graph.node_list)
+  if spec.col is None:
+    values = np.empty(num_nodes)
+    values.fill(float(config.NODE_DEFAULT_VAL[use_as]))
+    return (values, spec)
+  column = graph.node_table.column(spec.col)
+  if spec.categorical:
+    return (categoryValues(column), spec)
+  return (np.asarray(column, dtype=np.float64), spec)
+
+def wedgePaths(start_thetas, end_thetas, radius, widths):
+  """
+  Build the paths of many partial annuli centered at config.RING_ORIGIN, with
+  the same cubic Bezier arcs as matplotlib's Wedge patch.
+
+  Args:
+    start_thetas: float64 array of start thetas in degrees
+    end_thetas: float64 array of end thetas in degrees, each less than 360
+      degrees past its start theta
+    radius: Outer radius of the wedges
+    widths: float64 array of radial widths. Negative widths extend outward.
+  Return:
+    A list of Paths, one per wedge
+  """
+  eta1 = np.radians(start_thetas)
+  eta2 = np.radians(end_thetas)
+  # Wedges are grouped by their number of arc segments, as chosen by Path.arc
+  num_segs = (2 ** np.ceil((eta2 - eta1) / (0.5 * pi))).astype(np.intp)
+  paths = [None] * len(eta1)
+  for n in np.unique(num_segs):
+    idx = np.flatnonzero(num_segs == n)
+    deta = (eta2[idx] - eta1[idx]) / n
+    t = np.tan(0.5 * deta)
+    alpha = (np.sin(deta) * (np.sqrt(4.0 + 3.0 * t * t) - 1) / 3.0)[:, None]
+    steps = np.linspace(eta1[idx], eta2[idx], n + 1, axis=1)
+    (cos_eta, sin_eta) = (np.cos(steps), np.sin(steps))
+    (xA, yA, xB, yB) = (cos_eta[:, :-1], sin_eta[:, :-1], 
+                        cos_eta[:, 1:], sin_eta[:, 1:])
+    arc_len = 3 * n + 1
+    arc = np.empty((len(idx), arc_len, 2))
+    arc[:, 0] = np.column_stack((xA[:, 0], yA[:, 0]))
+    arc[:, 1::3, 0] = xA - alpha * yA
+    arc[:, 1::3, 1] = yA + alpha * xA
+    arc[:, 2::3, 0] = xB + alpha * yB
+    arc[:, 2::3, 1] = yB - alpha * xB
+    arc[:, 3::3, 0] = xB
+    arc[:, 3::3, 1] = yB
+    # Outer arc, then the reversed and scaled inner arc, then close
+    verts = np.empty((len(idx), 2 * arc_len + 2, 2))
+    verts[:, :arc_len] = arc
+    inner = (radius - widths[idx])[:, None, None]
+    verts[:, arc_len:2 * arc_len] = arc[:, ::-1] * inner / radius
+    verts[:, -2] = arc[:, 0]
+    verts[:, -1] = 0.0
+    verts *= radius
+    verts += config.RING_ORIGIN
+    codes = np.empty(2 * arc_len + 2, dtype=Path.code_type)
+    codes.fill(Path.CURVE4)
+    codes[0] = Path.MOVETO
+    codes[arc_len] = Path.LINETO
+    codes[-2:] = (Path.LINETO, Path.CLOSEPOLY)
+    for i, v in zip(idx, verts):
+      paths[i] = Path(v, codes)
+  return paths
+
+def renderRings(ax, graph, node_extents):
+  """
+  Render the node rings, one PathCollection per layer, at the cost of one
+  artist per layer instead of one Wedge patch per node per layer.
+
+  Args:
+    ax: A matplotlib Axes instance to add the collections to.
+    graph: A Graph instance
+    node_extents: float64 array of node start and end thetas by node index,
+      shape (num nodes, 2)
+  Return:
+    A list of PathCollections, by layer
+  """
+  order = graph.node_order
+  (start_thetas, end_thetas) = (node_extents[order, 0], node_extents[order, 1])
+  collections = []
+  for layer_i in xrange(len(graph.node_md.layers)):
+    # Calculate Colors
+    (values, spec) = layerValues(graph, 'C', layer_i)
+    colors = nodeGradient(layer_i).rgba(values[order], spec.min, spec.max)
+    # Calculate Widths
+    (values, spec) = layerValues(graph, 'D', layer_i)
+    depths = mapRangeArray(values[order], spec.min, spec.max, 0.0, 
+                           -config.RING_DEPTH)
+    # Render Ring Collection
+    paths = wedgePaths(start_thetas, end_thetas, 
+                       config.RING_RADIUS + config.RING_DEPTH * layer_i, depths)
+    collection = PathCollection(paths, facecolors=colors, edgecolors='none')
+    ax.add_collection(collection, autolim=False)
+    collections.append(collection)
+  return collections
+
+class NodeRenderer(object):
+  __slots__ = ('node', 'start_theta', 'end_theta')
 
   """
     Constructor
@@ -24,41 +138,3 @@ class NodeRenderer:
     self.node = node
     self.start_theta = start_theta
     self.end_theta = end_theta
-
-  """
-    Render this NodeRenderer instance as a set of matplotlib wedge patches
-    and labels.
-
-    Args:
-      ax: A matplotlib Axes instance to add text and patches to.
-  """
-  def render(self, ax):
-    # Patches
-    node = self.node
-    for layer_i in xrange(len(node.md.layers)):
-      # Calculate Color
-      num_gradients   = len(config.NODE_COLOR_GRADIENTS)
-      start_color     = config.NODE_COLOR_GRADIENTS[layer_i % num_gradients][0]
-      end_color       = config.NODE_COLOR_GRADIENTS[layer_i % num_gradients][1]
-      min_color_csv   = node.md.getPropertyMinVal('C', layer_i)
-      max_color_csv   = node.md.getPropertyMaxVal('C', layer_i)
-      layer_color_csv = node.getLayerColor(layer_i) 
-      if min_color_csv == 'NA':
-        min_color_csv = config.NON_NUM_COLOR_MIN_VAL 
-        max_color_csv = config.NON_NUM_COLOR_MAX_VAL 
-        layer_color_csv = abs(hash(layer_color_csv)) % max_color_csv
-      layer_color     = calcColor(start_color, end_color, float(layer_color_csv), 
-                                  float(min_color_csv), float(max_color_csv)) 
-      # Calculate Width
-      min_depth_csv   = node.md.getPropertyMinVal('D', layer_i)
-      max_depth_csv   = node.md.getPropertyMaxVal('D', layer_i)
-      layer_depth_csv = node.getLayerDepth(layer_i) 
-      layer_depth     = mapRangeParam(float(layer_depth_csv), float(min_depth_csv), 
-                                      float(max_depth_csv), 0.0, -config.RING_DEPTH)
-      # Render Ring Patch
-      ax.add_patch(Wedge(config.RING_ORIGIN, 
-                         config.RING_RADIUS + config.RING_DEPTH * layer_i, 
-                         self.start_theta, self.end_theta, 
-                         width=layer_depth,
-                         edgecolor='none',
-                         facecolor=layer_color))
@@ -0,0 +1,151 @@
+"""
+  Parallel parsing of large edge files. The data section of the file is
+  split into byte ranges aligned to line boundaries, each range is parsed
+  into typed columns by a worker process, and the results are joined back
+  together in file order.
+
+  Only uncompressed regular files can be split this way, and quoted fields
+  must not contain line breaks.
+"""
+# Library Imports
+import csv
+import multiprocessing
+import numpy as np
+
+# Local Module Imports
+import config
+from table import Table, parseTable
+from threshold import filterRows, filterTable
+
+# CSV dialect attributes passed on to workers. Sniffed dialects are not
+# picklable, so their attributes are copied.
+DIALECT_ATTRS = ('delimiter', 'quotechar', 'doublequote', 'escapechar',
+                 'skipinitialspace', 'quoting')
+
+# State shared with worker processes. Set by initWorker, which is inherited
+# without pickling where processes are forked.
+_worker_state = None
+
+def dataOffset(filename, num_md_rows):
+  """
+  Return the byte offset of the first data row of a CSV file.
+
+  Args:
+    filename: CSV file name
+    num_md_rows: The number of metadata rows following the header row
+  """
+  with open(filename, 'rb') as f:
+    for i in xrange(num_md_rows + 1):
+      f.readline()
+    return f.tell()
+
+def chunkRanges(filename, begin, num_chunks):
+  """
+  Split the bytes of a file from begin to its end into about num_chunks
+  ranges, each starting at the beginning of a line.
+
+  Args:
+    filename: File name
+    begin: Byte offset of the first range, at the beginning of a line
+    num_chunks: Requested number of ranges
+  Return:
+    A list of (begin, end) byte offset tuples, in file order
+  """
+  with open(filename, 'rb') as f:
+    f.seek(0, 2)
+    size = f.tell()
+    step = max((size - begin) // max(num_chunks, 1), 1)
+    bounds = [begin]
+    for pos in xrange(begin + step, size, step):
+      if pos <= bounds[-1]:
+        continue
+      # Move to the beginning of the line following the one holding pos - 1
+      f.seek(pos - 1)
+      f.readline()
+      bounds.append(min(f.tell(), size))
+    if bounds[-1] < size:
+      bounds.append(size)
+  return [(b, e) for b, e in zip(bounds[:-1], bounds[1:]) if e > b]
+
+def initWorker(filename, dialect, kinds, node_index, md, edge_thresh):
+  """
+  Store the state needed by parseRange in a worker process.
+  """
+  global _worker_state
+  _worker_state = (filename, dialect, kinds, node_index, md, edge_thresh)
+
+def parseRange(byte_range):
+  """
+  Parse the CSV rows in a byte range of the file given to initWorker.
+
+  Args:
+    byte_range: A (begin, end) tuple of byte offsets
+  Return:
+    A list of columns, as stored by Table
+  """
+  (filename, dialect, kinds, node_index, md, edge_thresh) = _worker_state
+  (begin, end) = byte_range
+  with open(filename, 'rb') as f:
+    f.seek(begin)
+    data = f.read(end - begin)
+  rows = csv.reader(data.splitlines(True), **dialect)
+  rows = filterRows(rows, md, edge_thresh)
+  return parseTable(rows, kinds, node_index).columns
+
+def joinTables(parts, kinds):
+  """
+  Concatenate lists of columns returned by parseRange into a single Table.
+  """
+  columns = []
+  for col_i, kind in enumerate(kinds):
+    if kind is None:
+      columns.append(None)
+    else:
+      columns.append(np.concatenate([part[col_i] for part in parts]))
+  return Table(columns)
+
+def parseParallel(reader, kinds, node_index, md, edge_thresh=None, jobs=None,
+                  chunk_bytes=config.PARSE_CHUNK_BYTES):
+  """
+  Parse the data rows of a CSV file with a pool of worker processes.
+
+  Args:
+    reader: An InputReader for an uncompressed regular file
+    kinds: A list of column kinds, as returned by columnKinds
+    node_index: A dict mapping node IDs to node table row indices
+    md: The Metadata instance for the file
+    edge_thresh: Optional tuple (percentage, use style code). EDGE_THRESH_1
+      is applied by the workers, EDGE_THRESH_2 to the joined table.
+    jobs: Number of worker processes. Defaults to the number of CPUs.
+    chunk_bytes: Maximum size of the byte range parsed at once
+  Return:
+    A Table instance, with rows in file order
+  """
+  jobs = jobs or multiprocessing.cpu_count()
+  filename = reader.filename
+  begin = dataOffset(filename, len(reader.md_rows) - 1)
+  with open(filename, 'rb') as f:
+    f.seek(0, 2)
+    size = f.tell()
+  # Several ranges per worker balance the load; bounding their size bounds
+  # the memory each worker needs
+  num_chunks = max(jobs * 4, (size - begin) // chunk_bytes + 1)
+  ranges = chunkRanges(filename, begin, num_chunks)
+  dialect = dict((a, getattr(reader.reader.dialect, a)) for a in DIALECT_ATTRS)
+  row_thresh = None
+  if edge_thresh and edge_thresh[1] == config.EDGE_THRESH_1:
+    row_thresh = edge_thresh
+
+  pool = multiprocessing.Pool(jobs, initWorker, (filename, dialect, kinds,
+                              node_index, md, row_thresh))
+  try:
+    parts = pool.map(parseRange, ranges, chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+  if not parts:
+    return parseTable([], kinds)
+  table = joinTables(parts, kinds)
+  if row_thresh is None:
+    table = filterTable(table, md, edge_thresh)
+  return table
@@ -0,0 +1,236 @@
+"""
+  Single pass reading of node and edge input files. The delimiter is sniffed
+  once, the header and metadata rows are read up front, and the remaining
+  data rows are handed on from the same csv reader.
+
+  Inputs may be gzip, bz2 or xz compressed, detected by file extension or
+  magic bytes, and are decompressed as a stream. Nothing is read twice, so
+  non-seekable inputs (eg. '-' for stdin) work too.
+"""
+# Library Imports
+import bz2
+import csv
+import sys
+import zlib
+from itertools import chain
+
+# Optional xz support. Python 2 needs the backports.lzma package.
+try:
+  import lzma
+except ImportError:
+  try:
+    from backports import lzma
+  except ImportError:
+    lzma = None
+
+# File name standing for the standard input
+STDIN = '-'
+
+# Number of bytes the CSV dialect is sniffed from
+SNIFF_BYTES = 1024
+
+# Number of compressed bytes read from a stream at once
+CHUNK_BYTES = 1 << 20
+
+# Compression format names, file extensions and magic bytes
+GZIP = 'gzip'
+BZ2  = 'bz2'
+XZ   = 'xz'
+COMPRESSION_EXTENSIONS = {'.gz': GZIP, '.bz2': BZ2, '.xz': XZ}
+COMPRESSION_MAGIC = ((GZIP, '\x1f\x8b'), (BZ2, 'BZh'), (XZ, '\xfd7zXZ\x00'))
+MAGIC_BYTES = 6
+
+def splitCompressionExtension(filename):
+  """
+  Split a compression extension (eg. '.gz') off of a file name.
+
+  Return:
+    A tuple (file name without the extension, compression format or None)
+  """
+  for ext, fmt in COMPRESSION_EXTENSIONS.items():
+    if filename.lower().endswith(ext):
+      return (filename[:-len(ext)], fmt)
+  return (filename, None)
+
+def decompressorFactory(fmt):
+  """
+  Return a callable creating a new decompressor object for the given
+  compression format, or None for uncompressed data.
+  """
+  if fmt == GZIP:
+    return lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+  if fmt == BZ2:
+    return bz2.BZ2Decompressor
+  if fmt == XZ:
+    if lzma is None:
+      raise ImportError('Reading xz input requires the lzma module ' +
+                        '(backports.lzma on Python 2)')
+    return lzma.LZMADecompressor
+  return None
+
+class InputStream(object):
+  """
+  A forward only binary stream over a raw file, decompressing it on the fly.
+  Concatenated compressed streams (eg. from pigz or pbzip2) are supported.
+  Supports read() and iteration over lines.
+  """
+  def __init__(self, raw, fmt, prefix=''):
+    """
+    Args:
+      raw: A binary file object. Only its read method is used.
+      fmt: Compression format name, or None for uncompressed data
+      prefix: Bytes already read from raw (eg. to check magic bytes)
+    """
+    self.raw = raw
+    self.new_decompressor = decompressorFactory(fmt)
+    self.decompressor = self.new_decompressor and self.new_decompressor()
+    self.pending = prefix # Raw bytes not decompressed yet
+    self.buf = ''         # Decompressed bytes not consumed yet
+
+  def fill(self):
+    """
+    Decompress more data into self.buf.
+
+    Return:
+      False at the end of the stream
+    """
+    while True:
+      data = self.pending or self.raw.read(CHUNK_BYTES)
+      self.pending = ''
+      if not data:
+        return False
+      if not self.decompressor:
+        self.buf += data
+        return True
+      try:
+        out = self.decompressor.decompress(data)
+      except EOFError:
+        # Previous stream ended exactly at a chunk boundary. Start the next.
+        self.decompressor = self.new_decompressor()
+        self.pending = data
+        continue
+      if self.decompressor.unused_data:
+        self.pending = self.decompressor.unused_data
+        self.decompressor = self.new_decompressor()
+      if out:
+        self.buf += out
+        return True
+
+  def read(self, size=-1):
+    while (size < 0 or len(self.buf) < size) and self.fill():
+      pass
+    if size < 0:
+      size = len(self.buf)
+    (data, self.buf) = (self.buf[:size], self.buf[size:])
+    return data
+
+  def __iter__(self):
+    line_end = ''
+    while self.buf or self.fill():
+      lines = (line_end + self.buf).split('\n')
+      self.buf = ''
+      line_end = lines.pop()
+      for line in lines:
+        yield line + '\n'
+    if line_end:
+      yield line_end
+
+  def close(self):
+    if self.raw is not sys.stdin:
+      self.raw.close()
+
+def openStream(filename):
+  """
+  Open an input file for binary reading, transparently decompressing it.
+  The compression format is taken from the file extension, or else from
+  the file's magic bytes. '-' reads from stdin.
+
+  Return:
+    A file object, or an InputStream where the file can't be used directly
+  """
+  if filename == STDIN:
+    raw = sys.stdin
+  else:
+    raw = open(filename, 'rb')
+  fmt = splitCompressionExtension(filename)[1]
+  prefix = ''
+  if not fmt:
+    prefix = raw.read(MAGIC_BYTES)
+    for magic_fmt, magic in COMPRESSION_MAGIC:
+      if prefix.startswith(magic):
+        fmt = magic_fmt
+    if not fmt and raw is not sys.stdin:
+      # Plain regular files are read natively, which is fastest
+      raw.seek(0)
+      return raw
+  return InputStream(raw, fmt, prefix)
+
+def readHeader(in_file, num_rows):
+  """
+  Sniff the delimiter of a CSV file and read its header and metadata rows,
+  without seeking. Commas and Tabs are supported.
+
+  Args:
+    in_file: An iterable of the lines of an input csv file, positioned at
+      its start. EG: A file handle.
+    num_rows: The number of rows of the csv file defining metadata
+  Return:
+    A tuple (csv reader positioned at the first data row, list of the
+    property name row and all metadata rows)
+  """
+  lines = iter(in_file)
+  head = []
+  head_bytes = 0
+  for line in lines:
+    head.append(line)
+    head_bytes += len(line)
+    if len(head) > num_rows and head_bytes >= SNIFF_BYTES:
+      break
+  dialect = csv.Sniffer().sniff(''.join(head)[:SNIFF_BYTES], delimiters=",\t")
+  md_rows = list(csv.reader(head[:num_rows + 1], dialect))
+  reader = csv.reader(chain(head[num_rows + 1:], lines), dialect)
+  return (reader, md_rows)
+
+class InputReader(object):
+  """
+  An open node or edge input file.
+
+  Class usage example:
+    with InputReader('sample_edges.csv.gz', 3) as r:
+      md = EdgeMetadata.fromRows(r.md_rows, 'Id')
+      for row in r.rows():
+        ...
+  """
+  def __init__(self, filename, num_rows):
+    """
+    Args:
+      filename: The input CSV file name, optionally compressed. '-' for stdin.
+      num_rows: The number of rows of the csv file defining metadata
+    """
+    self.filename = filename
+    self.file = openStream(filename)
+    (self.reader, self.md_rows) = readHeader(self.file, num_rows)
+
+  def rows(self):
+    """
+    Return an iterator over the data rows not read yet.
+    """
+    return self.reader
+
+  def close(self):
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+def openInput(source, num_rows):
+  """
+  Return an InputReader for source, which is either a file name or an
+  InputReader that has not been read past its metadata rows yet.
+  """
+  if isinstance(source, InputReader):
+    return source
+  return InputReader(source, num_rows)
@@ -0,0 +1,156 @@
+"""
+  Column-oriented storage for the data rows of node and edge input files.
+
+  Each CSV column is parsed once into a typed NumPy array. Node and Edge
+  objects are then built on demand as thin views over a single table row.
+"""
+# Library Imports
+from array import array
+import numpy as np
+
+# Column kinds. Determines how a CSV column is parsed and stored.
+FLOAT_COL  = 'f' # float64 values
+INDEX_COL  = 'i' # int32 row indices into the node table (edge endpoints)
+STRING_COL = 's' # Interned strings, stored as an object array
+SKIP_COL   = None # Column is not stored
+
+def isNumeric(s):
+  """
+  Return True if the given string parses as a float.
+  """
+  try:
+    float(s)
+    return True
+  except ValueError:
+    return False
+
+def columnKinds(md, keep_ids):
+  """
+  Decide how each CSV column described by the given metadata is stored.
+
+  Position columns are always floats and edge endpoint columns are always
+  node indices. Property columns are floats when their MIN_VAL metadata is
+  numeric, and strings otherwise (labels, categorical colors).
+
+  Args:
+    md: A Metadata instance
+    keep_ids: If False the primary key column is not stored.
+  Return:
+    A list with one column kind per CSV column.
+  """
+  use_as_row  = md.data[md.getAttrIdx('USE_AS')]
+  min_val_row = md.data[md.getAttrIdx('MIN_VAL')]
+  kinds = []
+  for col_i, use_as in enumerate(use_as_row):
+    if col_i == 0:
+      kinds.append(STRING_COL if keep_ids else SKIP_COL)
+    elif use_as == 'P':
+      kinds.append(FLOAT_COL)
+    elif use_as in ('S', 'E'):
+      kinds.append(INDEX_COL)
+    elif use_as in ('G', 'L') or not isNumeric(min_val_row[col_i]):
+      kinds.append(STRING_COL)
+    else:
+      kinds.append(FLOAT_COL)
+  return kinds
+
+def parseTable(rows, kinds, node_index=None):
+  """
+  Parse CSV data rows into a Table.
+
+  Args:
+    rows: An iterable of CSV data rows (lists of strings)
+    kinds: A list of column kinds, as returned by columnKinds
+    node_index: A dict mapping node IDs to node table row indices. Required
+      if any column is an INDEX_COL.
+  Return:
+    A Table instance
+  """
+  buffers = []
+  parsers = []
+  for col_i, kind in enumerate(kinds):
+    if kind == FLOAT_COL:
+      buf = array('d')
+      parsers.append((col_i, buf.append, float))
+    elif kind == INDEX_COL:
+      buf = array('i')
+      parsers.append((col_i, buf.append, node_index.__getitem__))
+    elif kind == STRING_COL:
+      buf = []
+      parsers.append((col_i, buf.append, intern))
+    else:
+      buf = None
+    buffers.append(buf)
+
+  for row in rows:
+    for col_i, append, parse in parsers:
+      append(parse(row[col_i]))
+
+  columns = []
+  for kind, buf in zip(kinds, buffers):
+    if kind == FLOAT_COL:
+      columns.append(np.frombuffer(buf, dtype=np.float64))
+    elif kind == INDEX_COL:
+      columns.append(np.frombuffer(buf, dtype=np.int32))
+    elif kind == STRING_COL:
+      col = np.empty(len(buf), dtype=object)
+      col[:] = buf
+      columns.append(col)
+    else:
+      columns.append(None)
+  return Table(columns)
+
+class Table(object):
+  """
+  A set of equal length typed columns, one per CSV column. Columns that were
+  not stored are None.
+  """
+  def __init__(self, columns):
+    self.columns = columns
+    stored = [c for c in columns if c is not None]
+    self.num_rows = len(stored[0]) if stored else 0
+
+  def __len__(self):
+    return self.num_rows
+
+  def column(self, col_i):
+    """
+    Return the array for CSV column col_i. None if it was not stored.
+    """
+    return self.columns[col_i]
+
+  def row(self, row_i):
+    """
+    Return a lightweight view of a single row.
+    """
+    return TableRow(self, row_i)
+
+  def take(self, indices):
+    """
+    Return a new Table containing only the given rows, in the given order.
+
+    Args:
+      indices: An integer index array or boolean mask
+    """
+    return Table([c[indices] if c is not None else None
+                  for c in self.columns])
+
+class TableRow(object):
+  """
+  A read only view of one Table row that can stand in for a CSV row (list of
+  strings). Indexing by column returns the parsed value.
+  """
+  __slots__ = ('table', 'row_i')
+
+  def __init__(self, table, row_i):
+    self.table = table
+    self.row_i = row_i
+
+  def __getitem__(self, col_i):
+    col = self.table.columns[col_i]
+    if col is None:
+      return None
+    return col[self.row_i]
+
+  def __len__(self):
+    return len(self.table.columns)
@@ -2,18 +2,43 @@
   Unit tests
 """
 from unittest import main, TestCase
-from math import sqrt
+from math import sqrt, degrees, atan2
 import bisect
+import os
+import re
+import numpy as np
 import config
 import metadata
 import graph
-from graph_renderer import GraphRenderer
+from graph_renderer import GraphRenderer, outputFormat
+import matplotlib.pyplot as plt
+from matplotlib.patches import Wedge
 import node
-from node_renderer import NodeRenderer
+from node_renderer import NodeRenderer, renderRings, wedgePaths
 import edge
-from edge_renderer import EdgeRenderer
+from edge_renderer import edgeRenderValues, renderEdges, collapseEdges, \
+                          renderDensity
 import lobe
 import helper
+import table
+import threshold
+import cache
+import adjacency
+import reader
+import parallel
+import edgelist
+import layout
+import csr
+import colors
+import geometry
+import density
+import labels
+import batch
+import shutil
+import tempfile
+import gzip
+import bz2
+from StringIO import StringIO
 
 class Metadatatests(TestCase):
 
@@ -85,6 +110,18 @@ class EdgeMetadataTests(TestCase):
     self.assertEqual(self.edge_md.getPropertyName('W'), 'Property2')
     self.assertEqual(self.edge_md.getPropertyName('D'), 'Property3')
     self.assertEqual(self.edge_md.getPropertyName('L'), 'Property4')
+    self.assertEqual(self.edge_md.getPropertyName('S'), 'Node1')
+
+  def testSchema(self):
+    schema = self.edge_md.schema
+    self.assertEqual(schema['W'], ('Property2', 4, -6.0, 2.8, False))
+    self.assertTrue(schema['L'].categorical)
+    self.assertEqual([use_as for use_as, spec in self.edge_md.prop_specs],
+                     ['C', 'W', 'D', 'L'])
+    rows = [r[:4] for r in self.edge_md.data]
+    md = metadata.EdgeMetadata.fromRows(rows, 'Id')
+    self.assertEqual(md.schema['W'], (None, None, 0.0, 1.0, False))
+    self.assertEqual(md.getPropertyName('W'), None)
 
   # TODO: Test get methods
 
@@ -104,6 +141,15 @@ class NodeMetadataTests(TestCase):
     self.assertEqual(self.node_md.getPropertyName('L', 0), 'Property4')
     self.assertEqual(self.node_md.getPropertyName('L', 1), 'Property7')
 
+  def testSchema(self):
+    schema = self.node_md.schema
+    self.assertEqual(len(schema), 8)
+    self.assertEqual(schema[('C', 1)].col, 9)
+    self.assertEqual(schema[('W', 1)], (None, None, 0.0, 1.0, False))
+    self.assertTrue(schema[('L', 0)].categorical)
+    self.assertEqual(schema[('C', 0)].min, 
+                     float(self.node_md.getPropertyMinVal('C', 0)))
+
   def testGetPropertyIndex(self):
     self.assertEqual(self.node_md.getPropertyIdx('C', 0), 5)
     self.assertEqual(self.node_md.getPropertyIdx('W', 0), 6)
@@ -171,6 +217,691 @@ class GraphTests(TestCase):
     self.assertTrue(first.name, 'Lobe1')
     self.assertTrue(last.name, 'Lobe2')
 
+  # Check columnar arrays
+  def test_graph_arrays(self):
+    self.assertEqual(self.g.node_pos.shape, (6, 3))
+    self.assertEqual(self.g.edge_start.dtype, np.int32)
+    self.assertEqual(len(self.g.edge_start), 4)
+    n1 = self.g.nodes['1']
+    self.assertIs(self.g.node_list[n1.idx], n1)
+    self.assertEqual(self.g.node_index['1'], n1.idx)
+    self.assertAlmostEqual(self.g.node_pos[n1.idx, 0], n1.pos[0])
+    self.assertEqual(self.g.node_props[5].dtype, np.float64)
+    self.assertEqual(self.g.node_props[8][n1.idx], 'B')
+
+    e0 = self.g.edges[0]
+    self.assertIs(e0.start_node, self.g.nodes['0'])
+    self.assertIs(e0.end_node, self.g.nodes['1'])
+    self.assertEqual(e0.csv[6], 'A')
+    self.assertEqual(self.g.edge_props[4][0], 2.0)
+
+class ThresholdTests(TestCase):
+
+  def setUp(self):
+    edge_file = open('inputs/test/test_edges.csv', 'r')
+    self.edge_md = metadata.EdgeMetadata(edge_file, 3, 'Id')
+    edge_file.close()
+    self.rows = [['0', '0', '1', '10', '2', '0.2', 'A'],
+                 ['1', '2', '0', '12', '-2', '0.3', 'B'],
+                 ['2', '2', '1', '19', '-3', '0.9', 'C'],
+                 ['3', '5', '4', '5', '2.8', '0.1', 'D']]
+
+  def testFilterRowsRange(self):
+    thresh = (50, config.EDGE_THRESH_1)
+    kept = list(threshold.filterRows(iter(self.rows), self.edge_md, thresh))
+    self.assertEqual([r[0] for r in kept], ['0', '3'])
+    thresh = (100, config.EDGE_THRESH_1)
+    kept = list(threshold.filterRows(iter(self.rows), self.edge_md, thresh))
+    self.assertEqual(len(kept), 4)
+    # The top percent needs every row first
+    self.assertRaises(ValueError, threshold.filterRows, iter(self.rows),
+                      self.edge_md, (50, config.EDGE_THRESH_2))
+
+  def testFilterTableTop(self):
+    node_index = dict((str(i), i) for i in range(6))
+    t = table.parseTable(self.rows, graph.columnKinds(self.edge_md, False), 
+                         node_index)
+    thresh = (75, config.EDGE_THRESH_2)
+    kept = threshold.filterTable(t, self.edge_md, thresh)
+    self.assertEqual(list(kept.column(4)), [2.0, -2.0, 2.8])
+    thresh = (20, config.EDGE_THRESH_2)
+    kept = threshold.filterTable(t, self.edge_md, thresh)
+    self.assertEqual(list(kept.column(4)), [2.8])
+
+  def testFilterNoWeight(self):
+    # Without a weight property every edge has the default weight, so -t 
+    # keeps the first rows
+    md_rows = reader.InputReader('inputs/test/test_edges.csv', 3).md_rows
+    md = metadata.EdgeMetadata.fromRows([r[:4] + r[5:] for r in md_rows], 
+                                        'Id')
+    rows = [r[:4] + r[5:] for r in self.rows]
+    thresh = (50, config.EDGE_THRESH_2)
+    node_index = dict((str(i), i) for i in range(6))
+    t = table.parseTable(rows, graph.columnKinds(md, False), node_index)
+    self.assertEqual(list(threshold.filterTable(t, md, thresh).column(1)), 
+                     [0, 2])
+    thresh = (50, config.EDGE_THRESH_1)
+    self.assertEqual(len(list(threshold.filterRows(iter(rows), md, thresh))),
+                     4)
+    self.assertEqual(len(threshold.filterTable(t, md, thresh)), 4)
+
+  def testGraphThreshold(self):
+    node_file = open('inputs/test/test_nodes.csv', 'r')
+    node_md = metadata.NodeMetadata(node_file, 3, 'Id')
+    node_file.close()
+    g = graph.Graph(node_md, self.edge_md, 'inputs/test/test_nodes.csv', 
+                    'inputs/test/test_edges.csv', (50, config.EDGE_THRESH_2))
+    self.assertEqual(len(g.edges), 2)
+    self.assertEqual(list(g.edge_props[4]), [2.0, 2.8])
+
+  def testTopPercentRecords(self):
+    # -t counts CSV records, not lines: a quoted label spans two lines
+    with open('inputs/test/test_edges.csv') as f:
+      text = f.read().replace('\tA\n', '\t"A\nA"\n')
+    out_dir = tempfile.mkdtemp()
+    try:
+      edge_filename = os.path.join(out_dir, 'edges.csv')
+      with open(edge_filename, 'w') as f:
+        f.write(text)
+      node_r = reader.InputReader('inputs/test/test_nodes.csv', 3)
+      node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+      node_index = graph.nodeIndex(graph.parseNodeFile(node_r, node_md), 
+                                   node_md)
+      t = graph.parseEdgeFile(edge_filename, self.edge_md, node_index,
+                              (50, config.EDGE_THRESH_2))
+    finally:
+      shutil.rmtree(out_dir)
+    self.assertEqual(list(t.column(4)), [2.0, 2.8])
+    self.assertEqual(list(t.column(6)), ['A\nA', 'D'])
+
+class InputReaderTests(TestCase):
+
+  def testSinglePass(self):
+    r = reader.InputReader('inputs/test/test_edges.csv', 3)
+    self.assertEqual(len(r.md_rows), 4)
+    self.assertEqual(r.md_rows[3][1], 'S')
+    edge_md = metadata.EdgeMetadata.fromRows(r.md_rows, 'Id')
+    self.assertEqual(edge_md.getPropertyName('W'), 'Property2')
+    rows = list(r.rows())
+    r.close()
+    self.assertEqual(len(rows), 4)
+    self.assertEqual(rows[0], ['0', '0', '1', '10', '2', '0.2', 'A'])
+
+  def testGraphFromReaders(self):
+    node_r = reader.InputReader('inputs/test/test_nodes.csv', 3)
+    edge_r = reader.InputReader('inputs/test/test_edges.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+    g = graph.Graph(node_md, edge_md, node_r, edge_r)
+    self.assertEqual(len(g.nodes), 6)
+    self.assertEqual(len(g.edges), 4)
+    self.assertEqual(g.edge_filename, 'inputs/test/test_edges.csv')
+    self.assertTrue(edge_r.file.closed)
+
+class CompressedInputTests(TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def compress(self, filename, ext, opener):
+    """
+    Write a compressed copy of filename to the temp dir, in two concatenated
+    compressed streams.
+    """
+    with open(filename, 'rb') as f:
+      data = f.read()
+    out_filename = os.path.join(self.tmp_dir, os.path.basename(filename) + ext)
+    with open(out_filename, 'wb') as out:
+      for part in (data[:100], data[100:]):
+        out.write(opener(part))
+    return out_filename
+
+  def testRoundTrips(self):
+    formats = [('.gz', gzipBytes), ('.bz2', bz2.compress)]
+    if reader.lzma is not None:
+      formats.append(('.xz', reader.lzma.compress))
+    for ext, opener in formats:
+      node_filename = self.compress('inputs/test/test_nodes.csv', ext, opener)
+      edge_filename = self.compress('inputs/test/test_edges.csv', ext, opener)
+      node_r = reader.InputReader(node_filename, 3)
+      edge_r = reader.InputReader(edge_filename, 3)
+      node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+      edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+      g = graph.Graph(node_md, edge_md, node_r, edge_r,
+                      (50, config.EDGE_THRESH_2))
+      self.assertEqual(len(g.nodes), 6)
+      self.assertEqual(len(g.edges), 2)
+
+  def testCompressedTopPercent(self):
+    # -t thresholds compressed input after parsing it, in one decompression
+    # pass
+    node_r = reader.InputReader('inputs/test/test_nodes.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    node_index = graph.nodeIndex(graph.parseNodeFile(node_r, node_md), node_md)
+    edge_filename = self.compress('inputs/test/test_edges.csv', '.gz',
+                                  gzipBytes)
+    edge_r = reader.InputReader(edge_filename, 3)
+    edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+    t = graph.parseEdgeFile(edge_r, edge_md, node_index,
+                            (50, config.EDGE_THRESH_2))
+    self.assertEqual(sorted(t.column(4)), [2.0, 2.8])
+
+  def testMagicBytes(self):
+    filename = self.compress('inputs/test/test_edges.csv', '', gzipBytes)
+    with reader.InputReader(filename, 3) as r:
+      self.assertEqual(len(list(r.rows())), 4)
+
+  def testNonSeekable(self):
+    with open('inputs/test/test_edges.csv', 'rb') as f:
+      stream = reader.InputStream(StringIO(f.read()), None)
+    (rows, md_rows) = reader.readHeader(stream, 3)
+    self.assertEqual(md_rows[3][1], 'S')
+    self.assertEqual(list(rows)[3][0], '3')
+
+  def testCompressedNpy(self):
+    matrix = AdjacencyTests.matrix
+    buf = StringIO()
+    np.save(buf, matrix)
+    filename = os.path.join(self.tmp_dir, 'adj.npy.gz')
+    with open(filename, 'wb') as f:
+      f.write(gzipBytes(buf.getvalue()))
+    self.assertTrue(adjacency.isBinaryMatrix(filename))
+    md, t = adjacency.loadAdjacency(filename, AdjacencyTests.node_index,
+                                    block_rows=2)
+    self.assertEqual(list(t.column(1)), [2, 0, 0, 1])
+    self.assertEqual(list(t.column(2)), [0, 2, 1, 0])
+
+def gzipBytes(data):
+  """
+  Return data gzip compressed.
+  """
+  buf = StringIO()
+  with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+    f.write(data)
+  return buf.getvalue()
+
+class ParallelTests(TestCase):
+
+  def testChunkRanges(self):
+    filename = 'inputs/real/edgedata.csv'
+    begin = parallel.dataOffset(filename, 3)
+    ranges = parallel.chunkRanges(filename, begin, 7)
+    self.assertEqual(ranges[0][0], begin)
+    self.assertEqual(ranges[-1][1], os.path.getsize(filename))
+    with open(filename, 'rb') as f:
+      data = f.read()
+    for (b1, e1), (b2, e2) in zip(ranges[:-1], ranges[1:]):
+      self.assertEqual(e1, b2)
+      self.assertEqual(data[b2 - 1], '\n')
+
+  def testParseParallel(self):
+    node_r = reader.InputReader('inputs/real/nodedata.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    node_index = graph.nodeIndex(graph.parseNodeFile(node_r, node_md), node_md)
+    for edge_thresh in (None, (30, config.EDGE_THRESH_1),
+                        (20, config.EDGE_THRESH_2)):
+      edge_r = reader.InputReader('inputs/real/edgedata.csv', 3)
+      edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+      kinds = table.columnKinds(edge_md, False)
+      t1 = parallel.parseParallel(edge_r, kinds, node_index, edge_md,
+                                  edge_thresh, jobs=3, chunk_bytes=4096)
+      edge_r.close()
+      t2 = graph.parseEdgeFile('inputs/real/edgedata.csv', edge_md,
+                               node_index, edge_thresh)
+      self.assertEqual(len(t1), len(t2))
+      for c1, c2 in zip(t1.columns, t2.columns):
+        if c2 is not None:
+          self.assertEqual(list(c1), list(c2))
+
+class BatchTests(TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    plt.close('all')
+
+  def testOutputFilename(self):
+    self.assertEqual(batch.outputFilename('out', 'a/s01_edges.csv.gz', 'png'),
+                     os.path.join('out', 's01_edges.png'))
+    self.assertEqual(batch.expandInputs(['inputs/test/test_edges*.csv',
+                                         'inputs/test/test_edges.csv',
+                                         'missing.csv']),
+                     ['inputs/test/test_edges.csv',
+                      'inputs/test/test_edges2.csv', 'missing.csv'])
+
+  def testWithEdges(self):
+    node_r = reader.InputReader('inputs/test/test_nodes.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    g = graph.Graph(node_md, None, 'inputs/test/test_nodes.csv', None,
+                    node_table=graph.parseNodeFile(node_r, node_md))
+    self.assertEqual(g.edges, [])
+    edge_r = reader.InputReader('inputs/test/test_edges.csv', 3)
+    edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+    g2 = g.withEdges(edge_md, edge_r)
+    self.assertIs(g2.node_table, g.node_table)
+    self.assertEqual(g2.edge_filename, 'inputs/test/test_edges.csv')
+    self.assertEqual(len(g2.edges), 4)
+    self.assertEqual(g.edges, [])
+
+  def testLayerTemplate(self):
+    node_r = reader.InputReader('inputs/test/test_nodes.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    g = graph.Graph(node_md, None, 'inputs/test/test_nodes.csv', None,
+                    node_table=graph.parseNodeFile(node_r, node_md))
+    template = batch.LayerTemplate()
+    gr = GraphRenderer(g, None)
+    gr.renderNodeLayers(template)
+    self.assertIsNotNone(template.data)
+    # Later renders draw on a copy of the stored layers
+    gr2 = GraphRenderer(g, None)
+    fig = gr2.fig
+    gr2.renderNodeLayers(template)
+    self.assertIsNot(gr2.fig, fig)
+    self.assertIsNot(gr2.fig, gr.fig)
+    self.assertEqual(len(gr2.ax.texts), len(gr.ax.texts))
+
+  def testRenderBatch(self):
+    edge_filenames = ['inputs/test/test_edges.csv', 'missing.csv']
+    results = batch.renderBatch('inputs/test/test_nodes.csv', edge_filenames,
+                                self.tmp_dir, fmt='svg')
+    self.assertEqual([r[0] for r in results], edge_filenames)
+    self.assertIsNone(results[0][2])
+    self.assertTrue(os.path.isfile(results[0][1]))
+    self.assertIn('IOError', results[1][2])
+    # Matches a render of the same files on their own
+    g = graph.Graph(self.nodeMetadata(), self.edgeMetadata(),
+                    'inputs/test/test_nodes.csv', 'inputs/test/test_edges.csv')
+    out_filename = os.path.join(self.tmp_dir, 'single.svg')
+    GraphRenderer(g, None).render(out_filename, None)
+    outputs = []
+    for filename in (results[0][1], out_filename):
+      with open(filename) as f:
+        outputs.append(re.sub('p[0-9a-f]{10}', '', f.read()))
+    self.assertEqual(outputs[0], outputs[1])
+    self.assertRaises(ValueError, batch.renderBatch,
+                      'inputs/test/test_nodes.csv',
+                      ['a/edges.csv', 'b/edges.csv'], self.tmp_dir)
+
+  def testRenderBatchJobs(self):
+    edge_filenames = []
+    for name in ('a.csv', 'b.csv'):
+      edge_filenames.append(os.path.join(self.tmp_dir, name))
+      shutil.copy('inputs/test/test_edges.csv', edge_filenames[-1])
+    serial = batch.renderBatch('inputs/test/test_nodes.csv', edge_filenames,
+                               os.path.join(self.tmp_dir, 'serial'), 
+                               fmt='svg')
+    # Worker processes render the same outputs
+    out_dir = os.path.join(self.tmp_dir, 'pool')
+    results = batch.renderBatch('inputs/test/test_nodes.csv', edge_filenames,
+                                out_dir, jobs=2, fmt='svg')
+    self.assertEqual([r[0] for r in results], edge_filenames)
+    for (r, s) in zip(results, serial):
+      self.assertIsNone(r[2])
+      with open(r[1]) as f1, open(s[1]) as f2:
+        self.assertEqual(re.sub('p[0-9a-f]{10}', '', f1.read()),
+                         re.sub('p[0-9a-f]{10}', '', f2.read()))
+
+  def testInitWorkerFonts(self):
+    # Each worker opens its own font files instead of the forked parent's
+    font_cache = batch.font_manager._get_font
+    batch.font_manager.get_font(batch.font_manager.findfont('sans'))
+    self.assertTrue(font_cache.cache_info().currsize)
+    state = batch._worker_state
+    try:
+      batch.initWorker(*(state or (None,) * 7))
+    finally:
+      batch._worker_state = state
+    self.assertEqual(font_cache.cache_info().currsize, 0)
+
+  def nodeMetadata(self):
+    with open('inputs/test/test_nodes.csv', 'r') as f:
+      return metadata.NodeMetadata(f, 3, 'Id')
+
+  def edgeMetadata(self):
+    with open('inputs/test/test_edges.csv', 'r') as f:
+      return metadata.EdgeMetadata(f, 3, 'Id')
+
+class EdgeListTests(TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.node_index = {'0': 0, '1': 1, '2': 2}
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def write(self, text):
+    filename = os.path.join(self.tmp_dir, 'edges.csv')
+    with open(filename, 'wb') as f:
+      f.write(text)
+    return filename
+
+  def testParseRoles(self):
+    self.assertEqual(edgelist.parseRoles('C+W,-,L'), [('C', 'W'), (), ('L',)])
+    self.assertRaises(ValueError, edgelist.parseRoles, 'C,X')
+    self.assertRaises(ValueError, edgelist.parseRoles, 'C+W,W')
+
+  def testLoadEdgeList(self):
+    filename = self.write('0,1,2.5,A\n2,0,-1,B\n1,2,4,C\n')
+    md, t = edgelist.loadEdgeList(filename, self.node_index, 'C+W,L')
+    self.assertEqual(md.data[0], ['Id', 'Node1', 'Node2', 'Property1_C', 
+                                  'Property1_W', 'Property2'])
+    self.assertEqual(md.get('Property1_W', 'MIN_VAL'), '-1.0')
+    self.assertEqual(md.get('Property1_W', 'MAX_VAL'), '4.0')
+    self.assertEqual(md.get('Property2', 'MIN_VAL'), 'NA')
+    self.assertEqual(md.getPropertyName('L'), 'Property2')
+    self.assertEqual(list(t.column(1)), [0, 2, 1])
+    self.assertEqual(list(t.column(4)), [2.5, -1.0, 4.0])
+    self.assertEqual(list(t.column(5)), ['A', 'B', 'C'])
+
+  def testHeaderAndThreshold(self):
+    filename = self.write('source\ttarget\tweight\n0\t1\t1\n2\t0\t9\n')
+    md, t = edgelist.loadEdgeList(filename, self.node_index, 'W')
+    self.assertEqual(md.getPropertyName('W'), 'weight')
+    self.assertEqual(len(t), 2)
+    t = threshold.filterTable(t, md, (50, config.EDGE_THRESH_1))
+    self.assertEqual(list(t.column(3)), [9.0])
+
+  def testHeaderDetection(self):
+    # A data row with an unknown node is reported, not taken as a header
+    filename = self.write('0,7,2.5\n2,0,-1\n')
+    self.assertRaises(KeyError, edgelist.loadEdgeList, filename,
+                      self.node_index)
+    filename = self.write('\nsrc,dst,weight,name\n\n0,1,2.5,A\n2,0,-1,B\n')
+    md, t = edgelist.loadEdgeList(filename, self.node_index, 'W,L')
+    self.assertEqual(md.getPropertyName('L'), 'name')
+    self.assertEqual(list(t.column(3)), [2.5, -1.0])
+
+class LayoutTests(TestCase):
+
+  def setUp(self):
+    node_r = reader.InputReader('inputs/real/nodedata.csv', 3)
+    edge_r = reader.InputReader('inputs/real/edgedata.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+    self.g = graph.Graph(node_md, edge_md, node_r, edge_r)
+
+  def tearDown(self):
+    plt.close('all')
+
+  def testLobeCodes(self):
+    codes, ids = layout.lobeCodes(['b', 'a', 'b', 'c'])
+    self.assertEqual(list(codes), [0, 1, 0, 2])
+    self.assertEqual(ids, ['b', 'a', 'c'])
+
+  def testMatchesObjects(self):
+    # Sorted lobes and nodes agree with the Lobe and Node comparators
+    lobes = self.g.sorted_lobes
+    for l1, l2 in zip(lobes[:-1], lobes[1:]):
+      self.assertFalse(l2 < l1)
+    for i, lobe in enumerate(lobes):
+      self.assertEqual(self.g.lobe_wts[i], lobe.weight())
+      self.assertEqual(tuple(self.g.lobe_centers[i]), lobe.centerOfMass())
+      for n1, n2 in zip(lobe.nodes[:-1], lobe.nodes[1:]):
+        self.assertFalse(n2 < n1)
+    self.assertEqual([n.idx for l in lobes for n in l.nodes], 
+                     list(self.g.node_order))
+
+  def testNodeExtents(self):
+    gr = GraphRenderer(self.g, None)
+    curr = {}
+    for lobe in self.g.sorted_lobes:
+      lex = gr.lobe_extents[lobe.uID]
+      curr_theta = lex[0]
+      for node in lobe.nodes:
+        start = curr_theta
+        curr_theta += (lex[1] - lex[0]) * (node.weight() / lobe.weight())
+        self.assertEqual(gr.node_extents[node.uID], (start, curr_theta))
+      self.assertAlmostEqual(curr_theta, lex[1])
+
+class CSRTests(TestCase):
+
+  def setUp(self):
+    node_r = reader.InputReader('inputs/real/nodedata.csv', 3)
+    edge_r = reader.InputReader('inputs/real/edgedata.csv', 3)
+    node_md = metadata.NodeMetadata.fromRows(node_r.md_rows, 'Id')
+    edge_md = metadata.EdgeMetadata.fromRows(edge_r.md_rows, 'Id')
+    self.g = graph.Graph(node_md, edge_md, node_r, edge_r)
+    self.start = list(self.g.edge_start)
+    self.end = list(self.g.edge_end)
+
+  def testDegree(self):
+    c = self.g.csr()
+    self.assertIs(self.g.csr(), c)
+    for i in (0, 7, len(self.g.node_list) - 1):
+      self.assertEqual(c.outDegree()[i], self.start.count(i))
+      self.assertEqual(c.inDegree()[i], self.end.count(i))
+    self.assertEqual(c.degree().sum(), 2 * len(self.g.edges))
+    w = self.g.edge_props[self.g.edge_md.schema['W'].col]
+    self.assertAlmostEqual(c.strength().sum(), 2 * w.sum())
+
+  def testEdgesOf(self):
+    c = self.g.csr()
+    i = self.start[0]
+    expected = [e for e in range(len(self.start)) 
+                if self.start[e] == i or self.end[e] == i]
+    self.assertEqual(list(c.edgesOf(i)), expected)
+    self.assertEqual(list(c.edgesOfNodes([i])), expected)
+    self.assertEqual(list(c.outEdges(i)), 
+                     [e for e in expected if self.start[e] == i])
+    self.assertEqual(list(c.neighbors(i)), 
+                     sorted(set(self.end[e] if self.start[e] == i 
+                                else self.start[e] for e in expected)))
+
+  def testLobeEdges(self):
+    lobe = self.g.sorted_lobes[0]
+    nodes = set(n.idx for n in lobe.nodes)
+    touching = [e for e in range(len(self.start)) 
+                if self.start[e] in nodes or self.end[e] in nodes]
+    within = [e for e in touching 
+              if self.start[e] in nodes and self.end[e] in nodes]
+    self.assertEqual(list(self.g.lobeEdges(lobe.uID)), touching)
+    self.assertEqual(list(self.g.lobeEdges(lobe.uID, within=True)), within)
+    self.assertEqual(self.g.lobeDegree()[0], len(touching) + len(within))
+    counts = self.g.csr().groupEdgeCounts(self.g.node_lobe, 
+                                          len(self.g.sorted_lobes))
+    self.assertEqual(counts[0, 0], len(within))
+    self.assertEqual(counts.sum(), len(self.start))
+
+class RegionOfInterestTests(TestCase):
+
+  def setUp(self):
+    node_file = open('inputs/test/test_nodes.csv', 'r')
+    node_md = metadata.NodeMetadata(node_file, 3, 'Id')
+    node_file.close()
+    edge_file = open('inputs/test/test_edges.csv', 'r')
+    edge_md = metadata.EdgeMetadata(edge_file, 3, 'Id')
+    edge_file.close()
+    self.g = graph.Graph(node_md, edge_md, 'inputs/test/test_nodes.csv', 
+                         'inputs/test/test_edges.csv')
+
+  def tearDown(self):
+    plt.close('all')
+
+  def testRoiEdges(self):
+    self.assertEqual(list(self.g.roiEdges(node_ids=['2'])), [1, 2])
+    self.assertEqual(list(self.g.roiEdges(node_ids=['0', '1'], within=True)),
+                     [0])
+    self.assertEqual(list(self.g.roiEdges(['Lobe3_L'])), [3])
+    self.assertEqual(list(self.g.roiEdges(['Lobe3'])), [3])
+    self.assertRaises(KeyError, self.g.roiEdges, ['Lobe9'])
+
+  def testRoiRender(self):
+    full = GraphRenderer(self.g, None)
+    roi = GraphRenderer(self.g, None, self.g.roiEdges(node_ids=['2']))
+    depth_col = self.g.edge_md.schema['D'].col
+    self.assertEqual(list(self.g.edge_props[depth_col][roi.edge_order]), 
+                     [0.3, 0.9])
+    self.assertEqual(roi.node_extents, full.node_extents)
+
+class GraphCacheTests(TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def testRoundTrip(self):
+    c = cache.GraphCache(self.cache_dir, 1024 ** 2)
+    g1 = c.loadGraph('inputs/test/test_nodes.csv', 'inputs/test/test_edges.csv')
+    self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+    g2 = c.loadGraph('inputs/test/test_nodes.csv', 'inputs/test/test_edges.csv',
+                     (50, config.EDGE_THRESH_2))
+    self.assertTrue(isinstance(g2.edge_table.column(4), np.ndarray))
+    self.assertEqual(g2.node_md.layers, g1.node_md.layers)
+    self.assertEqual(g2.edge_md.data, g1.edge_md.data)
+    self.assertEqual(len(g2.edges), 2)
+    self.assertEqual(list(g2.edge_props[4]), [2.0, 2.8])
+    self.assertEqual(g2.edges[1].csv[6], 'D')
+    self.assertEqual(g2.total_wt, g1.total_wt)
+
+  def testNonAsciiMetadata(self):
+    node_filename = os.path.join(self.cache_dir, 'nodes.csv')
+    with open('inputs/test/test_nodes.csv', 'rb') as f:
+      text = f.read().replace('Property1', 'Eigenvektorzentralit\xc3\xa4t')
+    with open(node_filename, 'wb') as f:
+      f.write(text)
+    c = cache.GraphCache(os.path.join(self.cache_dir, 'cache'), 1024 ** 2)
+    md1 = c.loadNodes(node_filename)[0]
+    md2 = c.loadNodes(node_filename)[0]
+    self.assertEqual(md2.data, md1.data)
+    self.assertEqual(md2.data[0][5], 'Eigenvektorzentralit\xc3\xa4t')
+    self.assertTrue(isinstance(md2.data[0][5], str))
+    # Bytes which aren't utf-8 are kept as they are
+    with open(node_filename, 'wb') as f:
+      f.write(text.replace('Eigenvektorzentralit\xc3\xa4t', 
+                           'Propri\xe9t\xe9'))
+    md1 = c.loadNodes(node_filename)[0]
+    md2 = c.loadNodes(node_filename)[0]
+    self.assertEqual(md2.data, md1.data)
+    self.assertEqual(md2.data[0][5], 'Propri\xe9t\xe9')
+    self.assertEqual(len([n for n in os.listdir(c.cache_dir)
+                          if n.startswith('nodes-')]), 2)
+
+  def testEvict(self):
+    c = cache.GraphCache(self.cache_dir, 1)
+    c.loadGraph('inputs/test/test_nodes.csv', 'inputs/test/test_edges.csv')
+    self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+class AdjacencyTests(TestCase):
+
+  node_index = {'Node1': 2, 'Node2': 0, 'Node3': 1}
+  matrix = np.array([[  7, 1.5,   0],
+                     [1.5,   4,   3],
+                     [  0,   3, np.nan]])
+
+  def testReadMatrix(self):
+    m = adjacency.readAdjacencyMatrix('inputs/sample/edgemat_2.csv')
+    self.assertEqual(m.shape, (15, 13))
+    self.assertEqual(np.isfinite(m).sum(), 15)
+    self.assertEqual(m[0, 2], 5.0)
+
+  def testAdjacencyEdges(self):
+    md, t = adjacency.adjacencyEdges(self.matrix, self.node_index)
+    self.assertEqual(len(t), 4)
+    self.assertEqual(list(t.column(1)), [2, 0, 0, 1])
+    self.assertEqual(list(t.column(2)), [0, 2, 1, 0])
+    self.assertEqual(list(t.column(5)), [1.0, 2.0, 3.0, 4.0])
+    self.assertEqual(md.get('Property2', 'MIN_VAL'), '1.5')
+    self.assertEqual(md.get('Property2', 'MAX_VAL'), '3.0')
+    self.assertEqual(md.getPropertyName('W'), 'Property2')
+
+  def testAdjacencyEdgesUpper(self):
+    md, t = adjacency.adjacencyEdges(self.matrix, self.node_index, upper=True)
+    self.assertEqual(len(t), 2)
+    self.assertEqual(list(t.column(1)), [2, 0])
+    self.assertEqual(list(t.column(2)), [0, 1])
+
+  def testBlocks(self):
+    md1, t1 = adjacency.adjacencyEdges(self.matrix, self.node_index)
+    md2, t2 = adjacency.adjacencyEdges(self.matrix, self.node_index, 
+                                       block_rows=1)
+    self.assertEqual(list(t1.column(1)), list(t2.column(1)))
+    self.assertEqual(list(t1.column(2)), list(t2.column(2)))
+    self.assertEqual(md1.data, md2.data)
+
+  def testReadMatrixText(self):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      filename = os.path.join(tmp_dir, 'adj.csv')
+      with open(filename, 'wb') as f:
+        f.write('\t\t1.5\r\n\n-2e1\t\t\r\n\t3\t\n')
+      for block_rows in (1, 256):
+        m = adjacency.readAdjacencyMatrix(filename, block_rows)
+        self.assertEqual(m.shape, (3, 3))
+        self.assertEqual(list(np.isnan(m).sum(axis=1)), [2, 2, 2])
+        self.assertEqual(list(m[np.isfinite(m)]), [1.5, -20.0, 3.0])
+      with open(filename, 'wb') as f:
+        f.write('1\t2\n3\tx\n')
+      self.assertRaises(ValueError, adjacency.readAdjacencyMatrix, filename)
+    finally:
+      shutil.rmtree(tmp_dir)
+
+  def testThreshAndTopK(self):
+    md, t = adjacency.adjacencyEdges(self.matrix, self.node_index, thresh=2.0)
+    # Comparisons skip empty (NaN) cells
+    with np.errstate(invalid='raise'):
+      adjacency.adjacencyEdges(self.matrix, self.node_index, thresh=2.0)
+    self.assertEqual(list(t.column(3)), [3.0, 3.0])
+    md, t = adjacency.adjacencyEdges(self.matrix, self.node_index, top_k=1)
+    self.assertEqual(list(t.column(3)), [1.5, 3.0, 3.0])
+
+  def testBinaryMatrix(self):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      npy_filename = os.path.join(tmp_dir, 'adj.npy')
+      np.save(npy_filename, self.matrix)
+      raw_filename = os.path.join(tmp_dir, 'adj.bin')
+      self.matrix.astype(np.float32).tofile(raw_filename)
+      for filename in (npy_filename, raw_filename):
+        self.assertTrue(adjacency.isBinaryMatrix(filename))
+        m = adjacency.openBinaryMatrix(filename)
+        self.assertTrue(isinstance(m, np.memmap))
+        md, t = adjacency.loadAdjacency(filename, self.node_index, upper=True)
+        self.assertEqual(list(t.column(1)), [2, 0])
+        self.assertEqual(list(t.column(2)), [0, 1])
+    finally:
+      shutil.rmtree(tmp_dir)
+
+  def testMissingNode(self):
+    self.assertRaises(KeyError, adjacency.adjacencyEdges, self.matrix, 
+                      {'Node1': 0})
+
+class TableTests(TestCase):
+
+  def setUp(self):
+    edge_file = open('inputs/test/test_edges.csv', 'r')
+    self.edge_md = metadata.EdgeMetadata(edge_file, 3, 'Id')
+    edge_file.close()
+
+  def testColumnKinds(self):
+    kinds = table.columnKinds(self.edge_md, False)
+    self.assertEqual(kinds, [table.SKIP_COL, table.INDEX_COL, table.INDEX_COL,
+                             table.FLOAT_COL, table.FLOAT_COL, table.FLOAT_COL,
+                             table.STRING_COL])
+
+  def testParseTable(self):
+    rows = [['0', 'a', 'b', '10', '2', '0.2', 'A'], 
+            ['1', 'b', 'a', '12', '-2', '0.3', 'B']]
+    kinds = table.columnKinds(self.edge_md, False)
+    t = table.parseTable(rows, kinds, {'a': 0, 'b': 1})
+    self.assertEqual(len(t), 2)
+    self.assertIsNone(t.column(0))
+    self.assertEqual(list(t.column(1)), [0, 1])
+    self.assertEqual(t.row(1)[4], -2.0)
+    self.assertEqual(t.row(1)[6], 'B')
+    self.assertEqual(len(t.row(1)), 7)
+
+    t2 = t.take(np.array([1]))
+    self.assertEqual(len(t2), 1)
+    self.assertEqual(t2.row(0)[3], 12.0)
+
 class NodeTests(TestCase):
 
   def setUp(self):
@@ -212,6 +943,9 @@ class HelperTests(TestCase):
     self.assertEqual(helper.mapRangeParam(1.0, 0.0, 2.0, 0.0, 10.0), 5.0)
     self.assertEqual(helper.mapRangeParam(1.0, 0.0, 2.0, 0.0, 2.0), 1.0)
     self.assertEqual(helper.mapRangeParam(1.0, 0.0, 2.0, 2.0, 0.0), 1.0)
+    self.assertEqual(list(helper.mapRangeArray(np.array([0.0, 1.0, 2.0]), 
+                                               0.0, 2.0, 0.0, -4.0)),
+                     [0.0, -2.0, -4.0])
 
   def testCenterOfMass(self):
     positions = [( 1.0,  0.0, 0.0), 
@@ -302,6 +1036,210 @@ class HelperTests(TestCase):
     self.assertTrue(helper.angularExtentsOverlap(b1, b2, a1, a2))
 
 
+class ColorTests(TestCase):
+  def setUp(self):
+    self.gradients = [tuple(g) for g in config.NODE_COLOR_GRADIENTS] + \
+                     [config.EDGE_COLOR_GRADIENT, ('#000000', '#FFFFFF'), 
+                      ('#FF0000', '#00FF00')]
+    self.values = np.concatenate((np.linspace(-3.0, 7.0, 1001), 
+                                  np.random.RandomState(0).uniform(-3, 7, 999)))
+
+  def test_color(self):
+    for start, end in self.gradients:
+      gradient = colors.Gradient(start, end)
+      for u in self.values[::10].tolist():
+        self.assertEqual(gradient.color(u, -3.0, 7.0), 
+                         helper.calcColor(start, end, u, -3.0, 7.0))
+
+  def test_rgba(self):
+    # Matches matplotlib's conversion of calcColor's hex strings
+    from matplotlib.colors import to_rgba
+    for start, end in self.gradients:
+      rgba = colors.Gradient(start, end).rgba(self.values, -3.0, 7.0)
+      self.assertEqual(rgba.shape, (len(self.values), 4))
+      expected = [to_rgba(helper.calcColor(start, end, u, -3.0, 7.0)) 
+                  for u in self.values.tolist()]
+      self.assertTrue(np.array_equal(rgba, np.array(expected)))
+    # Reversed ranges, as in calcColor
+    rgba = colors.Gradient('#FF0000', '#00FF00').rgba(np.array([5.0]), 10.0, 
+                                                     0.0)
+    self.assertEqual(tuple(rgba[0]), to_rgba('#7F7F00'))
+
+  def test_hex_rgba(self):
+    rgba = colors.hexRGBA(['#FF0000', '#00FF00', '#FF0000'])
+    self.assertTrue(np.array_equal(rgba, [[1, 0, 0, 1], [0, 1, 0, 1], 
+                                          [1, 0, 0, 1]]))
+    self.assertEqual(colors.hexRGBA([]).shape, (0, 4))
+
+  def test_node_gradient(self):
+    num_gradients = len(config.NODE_COLOR_GRADIENTS)
+    self.assertIs(colors.nodeGradient(num_gradients), colors.nodeGradient(0))
+    self.assertEqual(colors.nodeGradient(1).start_color, 
+                     config.NODE_COLOR_GRADIENTS[1][0])
+
+class GeometryTests(TestCase):
+  def setUp(self):
+    self.extents = np.array([[0.0, 10.0], [100.0, 160.0], [200.0, 300.0]])
+
+  def test_node_points(self):
+    points = geometry.nodePoints(self.extents)
+    for (t1, t2), point in zip(self.extents.tolist(), points):
+      expected = helper.polar2Cartesian(config.RING_RADIUS, 
+                                        helper.midTheta(t1, t2))
+      self.assertTrue(np.allclose(point, expected))
+
+  def test_control_points(self):
+    points = geometry.nodePoints(self.extents)
+    ctrl = geometry.edgeControlPoints(np.array([0, 2]), np.array([1, 0]), 
+                                      points)
+    self.assertEqual(ctrl.shape, (2, 3, 2))
+    self.assertTrue(np.array_equal(ctrl[1, 0], points[2]))
+    self.assertTrue(np.array_equal(ctrl[1, 2], points[0]))
+    self.assertEqual(tuple(ctrl[0, 1]), config.RING_ORIGIN)
+
+  def test_flatten(self):
+    ctrl = np.array([[[0.0, 0.0], [1.0, 2.0], [2.0, 0.0]]])
+    verts = geometry.flattenQuadratic(ctrl, 4)
+    self.assertEqual(verts.shape, (1, 5, 2))
+    self.assertTrue(np.allclose(verts[0, 0], ctrl[0, 0]))
+    self.assertTrue(np.allclose(verts[0, 2], [1.0, 1.0]))
+    self.assertTrue(np.allclose(verts[0, 4], ctrl[0, 2]))
+    paths = geometry.curvePaths(verts, None)
+    self.assertIsNone(paths[0].codes)
+
+  def test_bspline(self):
+    ctrl = np.array([[[0.0, 0.0], [1.0, 1.0], [2.0, 0.0], [3.0, 1.0], 
+                      [4.0, 0.0]]])
+    verts = geometry.bsplineVerts(ctrl)
+    self.assertEqual(verts.shape, (1, 7, 2))
+    self.assertTrue(np.array_equal(verts[0, [0, 1, 3, 5, 6]], ctrl[0]))
+    self.assertTrue(np.array_equal(verts[0, 2], [1.5, 0.5]))
+    self.assertEqual(len(geometry.bsplineCodes(5)), 7)
+    flat = geometry.flattenBSpline(ctrl, 2)
+    self.assertEqual(flat.shape, (1, 7, 2))
+    self.assertTrue(np.allclose(flat[0, [0, 2, 4, 6]], verts[0, [0, 2, 4, 6]]))
+    self.assertTrue(np.allclose(flat[0, 1], [0.875, 0.625]))
+    self.assertEqual(len(geometry.controlPaths(ctrl)[0].vertices), 7)
+
+  def test_bundling(self):
+    node_lobes = np.array([0, 0, 1])
+    points = geometry.nodePoints(self.extents)
+    lobe_extents = np.array([[0.0, 160.0], [200.0, 300.0]])
+    start, end = np.array([0, 0]), np.array([2, 1])
+    bundling = geometry.LobeBundling(node_lobes, lobe_extents, 1.0)
+    ctrl = bundling.controlPoints(start, end, points)
+    self.assertEqual(ctrl.shape, (2, 5, 2))
+    anchors = geometry.nodePoints(lobe_extents, config.RING_RADIUS * 
+                                  config.BUNDLE_ANCHOR_RADIUS)
+    self.assertTrue(np.allclose(ctrl[0], [points[0], anchors[0], 
+                                          config.RING_ORIGIN, anchors[1], 
+                                          points[2]]))
+    # Edges within a lobe turn at the lobe's anchor
+    self.assertTrue(np.allclose(ctrl[1, 1:4], anchors[0]))
+    # Without bundling strength, edges are straight lines
+    bundling = geometry.LobeBundling(node_lobes, lobe_extents, 0.0)
+    ctrl = bundling.controlPoints(start, end, points)
+    self.assertTrue(np.allclose(ctrl[0, 2], (points[0] + points[2]) / 2))
+    ctrl = bundling.lobeControlPoints(np.array([0]), np.array([1]))
+    self.assertTrue(np.allclose(ctrl[0, [0, 4]], 
+                                geometry.nodePoints(lobe_extents)))
+    self.assertRaises(ValueError, geometry.LobeBundling, node_lobes, 
+                      lobe_extents, 1.5)
+
+class DensityTests(TestCase):
+  def test_merge_curves(self):
+    (start, end, weights) = density.mergeCurves(np.array([0, 2, 1, 0]), 
+                                                np.array([2, 0, 1, 1]), 
+                                                np.array([1.0, 2.0, 3.0, 
+                                                          4.0]), 3)
+    self.assertEqual(zip(start, end, weights), 
+                     [(0, 1, 4.0), (0, 2, 3.0), (1, 1, 3.0)])
+
+  def test_samples(self):
+    # A sample's weight is its share of the polyline's length in pixels
+    verts = np.array([[[0.0, 0.0], [1.0, 0.0], [1.0, 0.5]]])
+    (points, weights) = density.polylineSamples(verts, np.array([2.0]), 10.0)
+    self.assertEqual(len(points), 15)
+    self.assertAlmostEqual(weights.sum(), 2.0 * 15)
+    self.assertTrue(np.allclose(points[0], [0.05, 0.0]))
+    self.assertTrue(np.allclose(points[-1], [1.0, 0.45]))
+
+  def test_splat(self):
+    buf = np.zeros((4, 4))
+    extent = (0.0, 4.0, 0.0, 4.0)
+    # Pixel centers are at half units. Row 0 is the bottom.
+    density.splat(buf, np.array([[1.5, 0.5], [2.0, 2.5]]), 
+                  np.array([1.0, 2.0]), extent)
+    self.assertEqual(buf[0, 1], 1.0)
+    self.assertEqual(buf[2, 1], 1.0)
+    self.assertEqual(buf[2, 2], 1.0)
+    self.assertEqual(buf.sum(), 3.0)
+    # Points outside the buffer land on its border
+    density.splat(buf, np.array([[-1.0, 9.0]]), np.array([1.0]), extent)
+    self.assertAlmostEqual(buf[3, 0], 1.0, 5)
+
+  def test_accumulate(self):
+    verts = np.array([[[-0.5, 0.0], [0.5, 0.0]], [[0.0, -0.5], [0.0, 0.5]]])
+    buf = density.accumulate(verts, np.array([1.0, 3.0]), 64, 
+                             (-1.0, 1.0, -1.0, 1.0), chunk_samples=10)
+    self.assertEqual(buf.shape, (64, 64))
+    self.assertAlmostEqual(buf.sum(), 1.0 * 32 + 3.0 * 32)
+    self.assertEqual(density.accumulate(verts[:0], np.array([]), 8, 
+                                        (-1.0, 1.0, -1.0, 1.0)).sum(), 0.0)
+
+  def test_tone_map(self):
+    buf = np.array([[0.0, 1.0], [10.0, 100.0]])
+    rgba = density.toneMap(buf, colors.EDGE_GRADIENT)
+    self.assertEqual(rgba.shape, (2, 2, 4))
+    self.assertEqual(rgba[0, 0, 3], 0.0)
+    self.assertEqual(rgba[1, 1, 3], 1.0)
+    self.assertTrue(np.all(np.diff(rgba[..., 3].reshape(-1)) > 0))
+    self.assertTrue(np.allclose(rgba[1, 1], 
+                                colors.hexRGBA([config.EDGE_COLOR_GRADIENT[1]])))
+    rgb = density.composite(rgba, (1.0, 1.0, 1.0, 1.0))
+    self.assertTrue(np.allclose(rgb[0, 0], 1.0))
+    self.assertTrue(np.allclose(rgb[1, 1], rgba[1, 1, :3]))
+
+class LabelTests(TestCase):
+  def test_text_size(self):
+    (w, h) = labels.textSize('Frontal', 6)
+    self.assertGreater(w, h)
+    self.assertIs(labels.textMetrics('Frontal', 6), 
+                  labels.textMetrics('Frontal', 6))
+    # Heights cover the descent of 'p' even without descenders
+    self.assertEqual(labels.textSize('x', 6)[1], h)
+    self.assertGreater(labels.textSize('Frontal', 12)[0], w)
+
+  def test_label_extents(self):
+    sizes = np.array([[0.2, 0.05], [0.2, 0.05]])
+    (start, end) = labels.labelExtents(np.array([90.0, 270.0]), 1.0, sizes)
+    # Extents span the bounding box diagonal along the text, counterclockwise
+    (inner, outer) = (degrees(atan2(0.1, 0.975)), degrees(atan2(0.1, 1.025)))
+    self.assertTrue(np.allclose(start, [90 - outer, 270 - outer]))
+    self.assertTrue(np.allclose(end, [90 + inner, 270 + inner]))
+
+  def test_label_levels(self):
+    sizes = np.tile([0.3, 0.05], (4, 1))
+    mid_thetas = np.array([10.0, 15.0, 20.0, 120.0])
+    levels = labels.labelLevels(mid_thetas, sizes, 1.0, 0.5)
+    self.assertEqual(levels.tolist(), [0, 1, 2, 0])
+    # Farther out, the same labels span smaller angles
+    levels = labels.labelLevels(mid_thetas, sizes, 10.0, 0.5)
+    self.assertEqual(levels.tolist(), [0, 0, 0, 0])
+
+  def test_decimate_labels(self):
+    thetas = np.array([0.0, 1.0, 2.0, 3.0, 10.0, 359.5])
+    keep = labels.decimateLabels(thetas, 2.0)
+    # The last label is too close to the first, around the ring
+    self.assertEqual(keep.tolist(), [True, False, True, False, True, False])
+    self.assertTrue(np.all(labels.decimateLabels(thetas, 0.5)))
+
+  def test_radial_rotations(self):
+    (rotations, outward) = labels.radialRotations(np.array([10.0, 100.0, 
+                                                            200.0, 300.0]))
+    self.assertEqual(rotations.tolist(), [10.0, -80.0, 20.0, 300.0])
+    self.assertEqual(outward.tolist(), [True, False, False, True])
+
 class EdgeTests(TestCase):
 
   def setUp(self):
@@ -407,14 +1345,18 @@ class GraphRendererTests(TestCase):
                          'inputs/test/test_edges.csv')
     self.gr = GraphRenderer(self.g, None)
   
+  def tearDown(self):
+    plt.close('all')
+
   def test_constructor(self):
     self.assertIs(self.gr.graph, self.g)
     self.assertEqual(len(self.gr.node_renderers), 6) 
 
-    # EdgeRenderers should be sorted by depth
-    self.assertEqual(len(self.gr.edge_renderers), 4)
-    self.assertEqual(self.gr.edge_renderers[0].depth, 0.1)
-    self.assertEqual(self.gr.edge_renderers[3].depth, 0.9)
+    # Edges should be sorted by depth
+    self.assertEqual(len(self.gr.edge_order), 4)
+    depths = self.g.edge_props[self.g.edge_md.schema['D'].col]
+    self.assertEqual(depths[self.gr.edge_order[0]], 0.1)
+    self.assertEqual(depths[self.gr.edge_order[3]], 0.9)
 
     self.assertAlmostEqual(self.gr.lobe_extents['Lobe1_R'][0], -40.79638642722060)
     self.assertAlmostEqual(self.gr.lobe_extents['Lobe1_R'][1], 69.2036135727794)
@@ -428,6 +1370,154 @@ class GraphRendererTests(TestCase):
     self.assertEqual(self.gr.node_extents['5'], 
                      (184.2036135727794, 239.20361357277937))
 
+  def edgeArrays(self):
+    """
+    Return the (start, end, colors, widths) arrays of self.gr's edges, in 
+    draw order.
+    """
+    order = self.gr.edge_order
+    return (self.g.edge_start[order], self.g.edge_end[order], 
+            self.gr.edge_colors, self.gr.edge_widths)
+
+  def test_render_edges(self):
+    (start, end, rgba, widths) = self.edgeArrays()
+    c = renderEdges(self.gr.ax, start, end, rgba, widths, 
+                    self.gr.node_extent_array)
+    self.assertIn(c, self.gr.ax.collections)
+    self.assertEqual(len(c.get_paths()), 4)
+    self.assertEqual(list(c.get_linewidths()), list(widths))
+    # Curves run from the start node's mid theta through the ring origin
+    theta = helper.midTheta(*self.gr.node_extent_array[start[0]])
+    verts = c.get_paths()[0].vertices
+    self.assertTrue(np.allclose(verts[0], 
+                                helper.polar2Cartesian(config.RING_RADIUS, 
+                                                       theta)))
+    self.assertEqual(tuple(verts[1]), config.RING_ORIGIN)
+    self.assertIsNone(renderEdges(self.gr.ax, start[:0], end[:0], rgba[:0],
+                                  widths[:0], self.gr.node_extent_array))
+
+  def test_render_density(self):
+    (start, end, rgba, widths) = self.edgeArrays()
+    im = renderDensity(self.gr.ax, start, end, widths, 
+                       self.gr.node_extent_array, size=32)
+    self.assertIn(im, self.gr.ax.images)
+    self.assertEqual(im.get_array().shape, (32, 32, 3))
+    r = config.RING_RADIUS
+    self.assertEqual(tuple(im.get_extent()), (-r, r, -r, r))
+    # The image doesn't change the axes limits
+    self.assertEqual(tuple(self.gr.ax.get_xlim()), (-1.5, 1.5))
+
+  def test_collapse_edges(self):
+    (start, end, edge_rgba, edge_widths) = self.edgeArrays()
+    node_lobes = self.g.node_lobe
+    (lobe_a, lobe_b, widths, rgba) = collapseEdges(start, end, edge_rgba,
+                                                   edge_widths, node_lobes)
+    pairs = set()
+    for (s, e) in zip(start, end):
+      lobes = (node_lobes[s], node_lobes[e])
+      pairs.add((min(lobes), max(lobes)))
+    self.assertEqual(set(zip(lobe_a, lobe_b)), pairs)
+    self.assertAlmostEqual(widths.sum(), edge_widths.sum())
+    self.assertTrue(np.all(np.diff(widths) >= 0))
+    self.assertEqual(rgba.shape, (len(pairs), 4))
+    self.assertTrue(np.allclose(rgba[:, 3], 1.0))
+
+  def test_output_format(self):
+    self.assertEqual(outputFormat('out.svg'), 'svg')
+    self.assertEqual(outputFormat('out.PNG'), 'png')
+    self.assertEqual(outputFormat('out'), config.DEFAULT_OUTPUT_FORMAT)
+    self.assertEqual(outputFormat('out.pdf', 'svg'), 'svg')
+    self.assertRaises(ValueError, outputFormat, 'out.pdf', 'gif')
+
+  def test_rasterize(self):
+    out_dir = tempfile.mkdtemp()
+    try:
+      out_filename = os.path.join(out_dir, 'out.svg')
+      self.gr.render(out_filename, None, rasterize='edges', dpi=50)
+      edges = self.gr.ax.collections[-1]
+      self.assertTrue(edges.get_rasterized())
+      self.assertFalse(any(c.get_rasterized() 
+                           for c in self.gr.ax.collections[:-1]))
+      self.assertFalse(any(t.get_rasterized() for t in self.gr.ax.texts))
+      with open(out_filename) as f:
+        svg = f.read()
+      self.assertIn('<image', svg)
+      self.assertIn('<svg', svg)
+    finally:
+      shutil.rmtree(out_dir)
+
+  def test_rasterize_all(self):
+    out_dir = tempfile.mkdtemp()
+    try:
+      self.gr.render(os.path.join(out_dir, 'out.pdf'), None, rasterize='all')
+      artists = (self.gr.ax.collections + self.gr.ax.patches + 
+                 self.gr.ax.lines)
+      legends = [a for a in artists if a.get_label() == '_legend']
+      # Legend boxes and color bars stay vector
+      self.assertTrue(legends)
+      self.assertFalse(any(a.get_rasterized() for a in legends))
+      self.assertTrue(all(a.get_rasterized() for a in artists 
+                          if a not in legends))
+    finally:
+      shutil.rmtree(out_dir)
+
+  def test_node_labels(self):
+    self.gr.renderNodeLabels()
+    self.assertEqual(len(self.gr.ax.texts), 12)
+    (arcs, lines) = self.gr.ax.collections
+    self.assertEqual(len(arcs.get_paths()), 6)
+    self.assertEqual(len(lines.get_segments()), 6)
+    # Labels given too little arc are merged by node
+    spacing = config.NODE_LABEL_SPACING
+    try:
+      config.NODE_LABEL_SPACING = 50.0
+      gr = GraphRenderer(self.g, None)
+      gr.renderNodeLabels()
+    finally:
+      config.NODE_LABEL_SPACING = spacing
+    self.assertEqual(len(gr.ax.texts), 6)
+    self.assertIn(config.NODE_LABEL_SEPARATOR, gr.ax.texts[0].get_text())
+
+  def test_node_labels_dropped(self):
+    # A node with no label drawn gets no arc or line, also when not merged
+    gr = GraphRenderer(self.g, None)
+    node = gr.node_renderers[0].node
+    md = self.g.node_md
+    csv = list(node.csv)
+    for i in range(md.numLabeledLayers()):
+      csv[md.getPropertyIdx('L', i)] = ''
+    (node.csv, csv) = (csv, node.csv)
+    try:
+      gr.renderNodeLabels()
+    finally:
+      node.csv = csv
+    self.assertEqual(len(gr.ax.texts), 10)
+    (arcs, lines) = gr.ax.collections
+    self.assertEqual(len(arcs.get_paths()), 5)
+    self.assertEqual(len(lines.get_segments()), 5)
+
+  def test_layer_cache(self):
+    out_dir = tempfile.mkdtemp()
+    try:
+      c = cache.GraphCache(os.path.join(out_dir, 'cache'), 1024 ** 3)
+      outputs = []
+      for i in range(2):
+        gr = GraphRenderer(self.g, None)
+        out_filename = os.path.join(out_dir, 'out_%d.svg' % i)
+        gr.render(out_filename, None, cache=c)
+        with open(out_filename) as f:
+          # Clip path IDs differ between figures
+          outputs.append(re.sub('p[0-9a-f]{10}', '', f.read()))
+        if i == 0:
+          self.assertEqual(len(os.listdir(c.cache_dir)), 1)
+          fig = gr.fig
+      # The second render draws on the cached figure
+      self.assertIsNot(gr.fig, fig)
+      self.assertEqual(len(gr.ax.texts), len(fig.axes[0].texts))
+      self.assertEqual(outputs[0], outputs[1])
+    finally:
+      shutil.rmtree(out_dir)
+
   def test_lobe_offset(self):
     node_file = open('inputs/test/test_nodes2.csv', 'r')
     node_md = metadata.NodeMetadata(node_file, 3, 'Id')
@@ -454,11 +1544,58 @@ class NodeRendererTests(TestCase):
     self.g = graph.Graph(node_md, edge_md, 'inputs/test/test_nodes.csv', 
                          'inputs/test/test_edges.csv')
   
+  def tearDown(self):
+    plt.close('all')
+
   def test_constructor(self):
     nr = NodeRenderer(self.g.nodes['0'], 0.0, 55.0)
     self.assertEqual(nr.start_theta, 0.0)
     self.assertEqual(nr.end_theta, 55.0)
 
+  def test_render_rings(self):
+    # One collection per layer, matching a Wedge patch per node per layer
+    gr = GraphRenderer(self.g, None)
+    collections = renderRings(gr.ax, self.g, gr.node_extent_array)
+    num_layers = len(self.g.node_md.layers)
+    self.assertEqual(len(collections), num_layers)
+    for (node_i, nr) in enumerate(gr.node_renderers):
+      node = nr.node
+      for layer_i in xrange(num_layers):
+        color_spec = self.g.node_md.schema[('C', layer_i)]
+        color_val  = node.getLayerColor(layer_i)
+        if color_spec.categorical:
+          color_val = abs(hash(color_val)) % config.NON_NUM_COLOR_MAX_VAL
+        color = colors.nodeGradient(layer_i).color(float(color_val), 
+                                                   color_spec.min, 
+                                                   color_spec.max)
+        depth_spec = self.g.node_md.schema[('D', layer_i)]
+        depth = helper.mapRangeParam(float(node.getLayerDepth(layer_i)), 
+                                     depth_spec.min, depth_spec.max, 0.0, 
+                                     -config.RING_DEPTH)
+        patch = Wedge(config.RING_ORIGIN, 
+                      config.RING_RADIUS + config.RING_DEPTH * layer_i, 
+                      nr.start_theta, nr.end_theta, width=depth, 
+                      edgecolor='none', facecolor=color)
+        path = collections[layer_i].get_paths()[node_i]
+        self.assertTrue(np.array_equal(path.vertices, 
+                                       patch.get_path().vertices))
+        self.assertTrue(np.array_equal(path.codes, patch.get_path().codes))
+        self.assertEqual(
+          tuple(collections[layer_i].get_facecolors()[node_i]), 
+          tuple(patch.get_facecolor()))
+
+  def test_wedge_paths(self):
+    # Wider wedges get more arc segments, as with Path.arc
+    paths = wedgePaths(np.array([0.0, 10.0]), np.array([10.0, 200.0]), 1.0, 
+                       np.array([0.1, -0.1]))
+    self.assertEqual([len(p.vertices) for p in paths], [2 * 7 + 2, 2 * 25 + 2])
+    self.assertTrue(np.allclose(paths[1].vertices[24], 
+                                [np.cos(np.radians(200.0)), 
+                                 np.sin(np.radians(200.0))]))
+    self.assertTrue(np.allclose(paths[1].vertices[25], 
+                                [1.1 * np.cos(np.radians(200.0)), 
+                                 1.1 * np.sin(np.radians(200.0))]))
+
 class EdgeRendererTests(TestCase):
   def setUp(self):
     node_file = open('inputs/test/test_nodes.csv', 'r')
@@ -470,21 +1607,42 @@ class EdgeRendererTests(TestCase):
     self.g = graph.Graph(node_md, edge_md, 'inputs/test/test_nodes.csv', 
                          'inputs/test/test_edges.csv')
   
-  def test_constructor(self):
-    er = EdgeRenderer(self.g.edges[0])
-
-    self.assertEqual(er.color, '#BC5228')
-    self.assertAlmostEqual(er.width, 1.818181818, places=4)
-    self.assertEqual(er.depth, 0.2)
-    self.assertEqual(er.label, 'A')
+  def test_render_values(self):
+    (order, rgba, widths) = edgeRenderValues(self.g)
+    self.assertEqual(list(order), [3, 0, 1, 2])
+    self.assertTrue(np.array_equal(rgba[1], colors.hexRGBA(['#BC5228'])[0]))
+    self.assertAlmostEqual(widths[1], 1.818181818, places=4)
+    self.assertEqual(widths.max(), config.MAX_EDGE_WIDTH)
+    # Only the given edges are rendered
+    (order, rgba, widths) = edgeRenderValues(self.g, [2, 0])
+    self.assertEqual(list(order), [0, 2])
+    self.assertEqual(rgba.shape, (2, 4))
+
+  def test_compact(self):
+    # Views keep no __dict__
+    for obj in (self.g.edges[0], self.g.edges[0].csv, self.g.node_list[0],
+                self.g.sorted_lobes[0]):
+      self.assertFalse(hasattr(obj, '__dict__'))
 
   def test_edge_order(self):
-    er0 = EdgeRenderer(self.g.edges[0])
-    er3 = EdgeRenderer(self.g.edges[3])
-    
-    self.assertEqual(er0.depth, 0.2)
-    self.assertEqual(er3.depth, 0.1)
-    self.assertLess(er3, er0)
+    # Edges are drawn by depth whether or not they are labeled
+    label_col = self.g.edge_md.schema['L'].col
+    labels = self.g.edge_props[label_col]
+    self.g.edge_props[label_col] = np.array(['', 'A', '', 'B'], dtype=object)
+    try:
+      order = edgeRenderValues(self.g)[0]
+    finally:
+      self.g.edge_props[label_col] = labels
+    self.assertEqual(list(order), [3, 0, 1, 2])
+    # Ties keep file order
+    depth_col = self.g.edge_md.schema['D'].col
+    depths = self.g.edge_props[depth_col]
+    self.g.edge_props[depth_col] = np.array([0.5, 0.5, 0.2, 0.5])
+    try:
+      order = edgeRenderValues(self.g)[0]
+    finally:
+      self.g.edge_props[depth_col] = depths
+    self.assertEqual(list(order), [2, 0, 1, 3])
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,109 @@
+"""
+  Edge weight thresholding. The weight range threshold is applied while edge
+  rows are being read, so that only edges which will be rendered are ever
+  parsed into the graph. Both thresholds apply to an already parsed edge 
+  Table.
+"""
+# Library Imports
+from math import ceil
+import numpy as np
+
+# Local Module Imports
+import config
+from helper import topRange
+
+def weightColumn(md):
+  """
+  Get the CSV column of the edge property used as edge width (weight).
+
+  Args:
+    md: An EdgeMetadata instance
+  Return:
+    Integer column index, None if no weight property is specified.
+  """
+  return md.schema['W'].col
+
+def filterRows(rows, md, edge_thresh):
+  """
+  Filter edge CSV rows by weight as they are read.
+
+  With config.EDGE_THRESH_1 (-s), rows are kept when their weight lies in
+  the top s percent of the weight range given by the MIN_VAL and MAX_VAL
+  metadata rows; 100 percent, or a missing weight property, keeps every row.
+  The top t percent of rows (config.EDGE_THRESH_2, -t) depends on the number
+  of rows, which is only known once they are all read, so it is applied to 
+  the parsed Table by filterTable instead.
+
+  Args:
+    rows: An iterable of edge CSV data rows
+    md: An EdgeMetadata instance
+    edge_thresh: A tuple (percentage, config.EDGE_THRESH_1) or None
+  Return:
+    An iterable of the surviving rows, in file order.
+  """
+  if not edge_thresh:
+    return rows
+  percent, use_style = edge_thresh
+  if use_style != config.EDGE_THRESH_1:
+    raise ValueError('Only EDGE_THRESH_1 is applied while reading rows')
+  w_col = weightColumn(md)
+  if percent >= 100 or w_col is None:
+    return rows
+  spec   = md.schema['W']
+  thresh = topRange([spec.min, spec.max], percent)[0]
+  return (row for row in rows if float(row[w_col]) > thresh)
+
+def weightOrder(table, md):
+  """
+  Sort the rows of an edge Table by descending weight. Ties keep file order.
+
+  Args:
+    table: A Table of edge data rows
+    md: An EdgeMetadata instance
+  Return:
+    An int64 array of row indices. None if no weight property is specified.
+  """
+  w_col = weightColumn(md)
+  if w_col is None:
+    return None
+  return np.argsort(-table.column(w_col), kind='mergesort')
+
+def filterTable(table, md, edge_thresh, order=None):
+  """
+  Filter the rows of an already parsed edge Table by weight. 
+  config.EDGE_THRESH_1 (-s) is applied as by filterRows. With 
+  config.EDGE_THRESH_2 (-t), the t percent of rows with the highest weights
+  are kept; ties go to the rows appearing first in the file. Without a 
+  weight property every edge has the default weight, so -t keeps the first
+  t percent of rows.
+
+  Args:
+    table: A Table of edge data rows
+    md: An EdgeMetadata instance
+    edge_thresh: A tuple (percentage, use style code) or None
+    order: Optional result of weightOrder for this table. Computed if needed
+      and not given.
+  Return:
+    A Table of the surviving rows, in file order.
+  """
+  w_col = weightColumn(md)
+  if not edge_thresh:
+    return table
+  percent, use_style = edge_thresh
+
+  if use_style == config.EDGE_THRESH_1:
+    if percent >= 100 or w_col is None:
+      return table
+    spec   = md.schema['W']
+    thresh = topRange([spec.min, spec.max], percent)[0]
+    return table.take(np.nonzero(table.column(w_col) > thresh)[0])
+
+  elif use_style == config.EDGE_THRESH_2:
+    num_edges = max(int(ceil(len(table) * (percent / 100.0))), 0)
+    if w_col is None:
+      return table.take(np.arange(min(num_edges, len(table))))
+    if order is None:
+      order = weightOrder(table, md)
+    return table.take(np.sort(order[:num_edges]))
+
+  return table